@@ -49,6 +49,9 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise
+    'core.query_budget.QueryBudgetMiddleware',
+    'core.revisions.DatasetRevisionMiddleware',
+    'core.render_timing.RenderTimingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,21 +62,41 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'blogs.urls'
 
+# Templates are compiled once per process by the cached loader (runserver
+# still reloads edited templates); TEMPLATE_CACHED_LOADER=False re-reads
+# them on every render
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if os.environ.get('TEMPLATE_CACHED_LOADER', 'True') == 'True':
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.render_timing.TimedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.template_fragments',
             ],
+            'loaders': TEMPLATE_LOADERS,
         },
     },
 ]
 
+# Seconds a {% cache %} fragment is kept; fragment keys include the shared
+# revision of the data they show, so every worker stops serving a fragment
+# within DATASET_REVISION_POLL_SECONDS of an edit
+TEMPLATE_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('TEMPLATE_FRAGMENT_CACHE_TIMEOUT', 300))
+# Template render times: Server-Timing header when enabled (default: DEBUG),
+# and a warning for any render slower than TEMPLATE_RENDER_SLOW_MS
+TEMPLATE_RENDER_TIMING = os.environ.get('TEMPLATE_RENDER_TIMING', str(DEBUG)) == 'True'
+TEMPLATE_RENDER_SLOW_MS = float(os.environ.get('TEMPLATE_RENDER_SLOW_MS', 200))
+
 WSGI_APPLICATION = 'blogs.wsgi.application'
 
 
@@ -144,6 +167,95 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Per-view query budgets (core.query_budget): counted when enabled,
+# and raised as errors instead of logged when strict
+QUERY_BUDGET_ENABLED = os.environ.get('QUERY_BUDGET_ENABLED', str(DEBUG)) == 'True'
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', 'False') == 'True'
+
+# Cache: per-process memory by default, or a shared directory with
+# CACHE_BACKEND=file so every worker sees the same counters
+if os.environ.get('CACHE_BACKEND', 'locmem') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', BASE_DIR / 'cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'e-waste-locator',
+        }
+    }
+
+# Seconds before cached home page statistics are recounted from the
+# database
+STATS_CACHE_TIMEOUT = int(os.environ.get('STATS_CACHE_TIMEOUT', 3600))
+
+# Seconds between checks of the shared dataset revisions (core.revisions):
+# the longest a worker keeps using in-memory data after another process
+# wrote facilities, components or devices
+DATASET_REVISION_POLL_SECONDS = float(os.environ.get('DATASET_REVISION_POLL_SECONDS', 2))
+
+# Read-through cache for facility and device queries: 'lru' keeps up to
+# MAX_ENTRIES results in each worker, 'django' stores them in the default
+# cache. Either way entries expire after TIMEOUT seconds, the longest a
+# worker serves results from before another worker's write when the
+# default cache is not shared
+QUERY_CACHE = {
+    'BACKEND': os.environ.get('QUERY_CACHE_BACKEND', 'lru'),
+    'MAX_ENTRIES': int(os.environ.get('QUERY_CACHE_MAX_ENTRIES', 2048)),
+    'TIMEOUT': int(os.environ.get('QUERY_CACHE_TIMEOUT', 300)),
+}
+
+# Offline PIN code centroids: `manage.py build_pincode_index` (run by
+# build.sh and the render.yaml build) compiles the CSV into the binary
+# lookup file. The bundled CSV only covers a few sample PIN codes; point
+# PINCODE_CENTROIDS_CSV at a full pincode,latitude,longitude table for
+# real coverage. PINCODE_CENTROID_FALLBACK=False turns off both uses:
+# coordinates for imported rows and nearest-facility PIN code searches
+PINCODE_CENTROIDS_CSV = os.environ.get('PINCODE_CENTROIDS_CSV', BASE_DIR / 'core' / 'data' / 'pincode_centroids.csv')
+PINCODE_CENTROIDS_PATH = os.environ.get('PINCODE_CENTROIDS_PATH', BASE_DIR / 'pincode_centroids.bin')
+PINCODE_CENTROID_FALLBACK = os.environ.get('PINCODE_CENTROID_FALLBACK', 'True') == 'True'
+# Facilities shown for a PIN code search, nearest first
+PINCODE_SEARCH_RESULTS = 20
+PINCODE_SEARCH_RADIUS_KM = 50
+
+# Facility map tiles: rendered on demand and cached on disk
+FACILITY_TILE_CACHE_DIR = os.environ.get('FACILITY_TILE_CACHE_DIR', BASE_DIR / 'tile_cache')
+FACILITY_TILE_CACHE_MAX_FILES = int(os.environ.get('FACILITY_TILE_CACHE_MAX_FILES', 20000))
+FACILITY_TILE_MAX_AGE = int(os.environ.get('FACILITY_TILE_MAX_AGE', 300))
+
+# Metal prices in INR per gram used to value devices
+METAL_PRICES = {
+    'gold': float(os.environ.get('GOLD_PRICE_PER_GRAM', 6500)),
+    'silver': float(os.environ.get('SILVER_PRICE_PER_GRAM', 80)),
+    'copper': float(os.environ.get('COPPER_PRICE_PER_GRAM', 0.85)),
+}
+
+# Seconds before the in-memory leaderboard ranks are reloaded from the
+# database, by a background thread of each worker
+RANK_SERVICE_MAX_AGE = int(os.environ.get('RANK_SERVICE_MAX_AGE', 60))
+
+# Materialized dashboard leaderboards: LEADERBOARD_SIZE rows per window,
+# written by the `manage.py refresh_leaderboard --interval 10` worker and
+# cached for LEADERBOARD_CACHE_TIMEOUT seconds. Snapshots older than
+# LEADERBOARD_MAX_AGE seconds (no worker running) are recomputed on read
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', 5))
+LEADERBOARD_CACHE_TIMEOUT = int(os.environ.get('LEADERBOARD_CACHE_TIMEOUT', 10))
+LEADERBOARD_MAX_AGE = int(os.environ.get('LEADERBOARD_MAX_AGE', 30))
+
+# Recycling point accrual: 'sync' writes one ledger row per submission,
+# 'buffered' queues submissions in memory and flushes them in batches
+RECYCLE_ACCRUAL_MODE = os.environ.get('RECYCLE_ACCRUAL_MODE', 'sync')
+RECYCLE_ACCRUAL_FLUSH_MS = int(os.environ.get('RECYCLE_ACCRUAL_FLUSH_MS', 500))
+RECYCLE_ACCRUAL_MAX_PENDING = int(os.environ.get('RECYCLE_ACCRUAL_MAX_PENDING', 5000))
+# Queued events beyond this are written synchronously, and an event is
+# dropped (and logged) after failing this many flushes on its own
+RECYCLE_ACCRUAL_MAX_BACKLOG = int(os.environ.get('RECYCLE_ACCRUAL_MAX_BACKLOG', 50000))
+RECYCLE_ACCRUAL_MAX_ATTEMPTS = int(os.environ.get('RECYCLE_ACCRUAL_MAX_ATTEMPTS', 5))
+
 # Login settings for E-Waste Locator
 LOGIN_URL = 'core:login'
 LOGIN_REDIRECT_URL = 'core:dashboard'
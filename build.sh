@@ -23,6 +23,9 @@ echo "==> Running database migrations..."
 python manage.py migrate --noinput
 echo "Migrations completed successfully!"
 
+echo "==> Building the PIN code centroid lookup..."
+python manage.py build_pincode_index --from-facilities
+
 echo "=========================================="
 echo "Build completed successfully!"
 echo "=========================================="
@@ -0,0 +1,194 @@
+"""
+Write-behind buffer for recycling point accrual
+With RECYCLE_ACCRUAL_MODE = 'buffered', add_recycled_device only queues
+the event in memory; a background thread flushes the queue every
+RECYCLE_ACCRUAL_FLUSH_MS milliseconds as one bulk insert of ledger events
+plus one UPDATE ... CASE of the coalesced per-user deltas
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def is_buffered():
+    return getattr(settings, 'RECYCLE_ACCRUAL_MODE', 'sync') == 'buffered'
+
+
+class AccrualBuffer:
+    """
+    In-process queue of recycle events with per-user running deltas
+    The dashboard adds pending() to the stored totals, so users see
+    their new points before the next flush
+    Events that cannot be written are retried one by one and dropped
+    after RECYCLE_ACCRUAL_MAX_ATTEMPTS failures, so a single bad event
+    never blocks the rest of the queue
+    """
+
+    def __init__(self):
+        self._events = []
+        self._deltas = defaultdict(lambda: [0, 0, Decimal('0')])
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._registered_exit = False
+        self._failures = 0
+
+    def add(self, user_id, device_id, points, co2_saved):
+        """
+        Queue one recycled device for the next flush
+        Returns False without queueing when the backlog is full (e.g.
+        while the database is unreachable), so the caller writes it directly
+        """
+        with self._lock:
+            if len(self._events) >= settings.RECYCLE_ACCRUAL_MAX_BACKLOG:
+                return False
+            self._events.append((user_id, device_id, points, co2_saved, 0))
+            delta = self._deltas[user_id]
+            delta[0] += points
+            delta[1] += 1
+            delta[2] += co2_saved
+            backlog = len(self._events)
+        self._ensure_worker()
+        if backlog >= settings.RECYCLE_ACCRUAL_MAX_PENDING:
+            self._wake.set()
+        return True
+
+    def pending(self, user_id):
+        """(points, devices, co2_saved) queued for a user but not flushed"""
+        with self._lock:
+            if user_id not in self._deltas:
+                return 0, 0, Decimal('0')
+            return tuple(self._deltas[user_id])
+
+    def pending_points(self):
+        """{user_id: points} for everything still queued"""
+        with self._lock:
+            return {user_id: delta[0] for user_id, delta in self._deltas.items()}
+
+    def _without_stale_references(self, events):
+        """
+        Drop events of deleted users and detach deleted devices, as a
+        synchronous write would have failed or stored device=None
+        """
+        from django.contrib.auth.models import User
+        from .models import Device
+
+        users = set(User.objects.filter(pk__in={event[0] for event in events}).values_list('pk', flat=True))
+        devices = set(Device.objects.filter(
+            pk__in={event[1] for event in events if event[1] is not None}
+        ).values_list('pk', flat=True))
+        kept = []
+        for user_id, device_id, points, co2_saved, attempts in events:
+            if user_id not in users:
+                logger.warning("Dropping buffered recycle event of deleted user %s", user_id)
+                continue
+            kept.append((user_id, device_id if device_id in devices else None, points, co2_saved, attempts))
+        return kept
+
+    def _write(self, events):
+        """Insert events and apply their deltas in one transaction"""
+        from .ledger import apply_profile_deltas
+        from .models import RecycleEvent
+
+        deltas = defaultdict(lambda: [0, 0, Decimal('0')])
+        for user_id, _, points, co2_saved, _ in events:
+            delta = deltas[user_id]
+            delta[0] += points
+            delta[1] += 1
+            delta[2] += co2_saved
+        with transaction.atomic():
+            # Events are written already compacted because the same
+            # transaction applies their deltas to the profiles
+            RecycleEvent.objects.bulk_create([
+                RecycleEvent(
+                    user_id=user_id, device_id=device_id, points=points,
+                    co2_saved=co2_saved, compacted=True,
+                )
+                for user_id, device_id, points, co2_saved, _ in events
+            ], batch_size=500)
+            apply_profile_deltas(deltas)
+
+    def flush(self):
+        """
+        Write every queued event; returns the number written
+        Raises OperationalError or InterfaceError, after requeueing
+        everything, when the database cannot be reached at all
+        """
+        with self._lock:
+            events, self._events = self._events, []
+            self._deltas = defaultdict(lambda: [0, 0, Decimal('0')])
+        if not events:
+            return 0
+
+        try:
+            events = self._without_stale_references(events)
+            self._write(events)
+            return len(events)
+        except (OperationalError, InterfaceError):
+            logger.exception("Flushing %d buffered recycle events failed, requeueing", len(events))
+            self._requeue(events)
+            raise
+        except Exception:
+            logger.exception("Flushing %d buffered recycle events failed, retrying one by one", len(events))
+
+        written, retry = 0, []
+        max_attempts = settings.RECYCLE_ACCRUAL_MAX_ATTEMPTS
+        for event in events:
+            try:
+                self._write([event])
+                written += 1
+            except (OperationalError, InterfaceError):
+                retry.append(event)
+            except Exception:
+                attempts = event[4] + 1
+                if attempts >= max_attempts:
+                    logger.exception("Dropping recycle event %r after %d failed attempts", event[:4], attempts)
+                else:
+                    retry.append(event[:4] + (attempts,))
+        self._requeue(retry)
+        return written
+
+    def _requeue(self, events):
+        with self._lock:
+            self._events[:0] = events
+            for user_id, _, points, co2_saved, _ in events:
+                delta = self._deltas[user_id]
+                delta[0] += points
+                delta[1] += 1
+                delta[2] += co2_saved
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='recycle-accrual', daemon=True)
+                self._thread.start()
+                if not self._registered_exit:
+                    # Flush whatever is still queued when the process exits
+                    atexit.register(self.flush)
+                    self._registered_exit = True
+
+    def _run(self):
+        interval = settings.RECYCLE_ACCRUAL_FLUSH_MS / 1000
+        while True:
+            # Back off while the database is unreachable
+            self._wake.wait(min(interval * 2 ** self._failures, 60))
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+                self._failures = 0
+            except Exception:
+                # Already logged and requeued, try again later
+                self._failures = min(self._failures + 1, 10)
+
+
+accrual_buffer = AccrualBuffer()
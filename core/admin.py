@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Facility, ComponentInfo, Device, UserProfile
+from .models import Facility, ComponentInfo, Device, UserProfile, RecycleEvent
+from .accrual import accrual_buffer
+from .ledger import pending_points_by_user
+from .ranking import rank_service
 
 # Admin configuration for Facility model
 @admin.register(Facility)
@@ -78,10 +81,13 @@ class UserProfileAdmin(admin.ModelAdmin):
     Admin interface for managing user profiles and recycling statistics
     """
     list_display = ['user', 'points', 'total_recycled', 'co2_saved', 'get_rank', 'created_at']
+    list_select_related = ['user']
     list_filter = ['created_at']
     search_fields = ['user__username', 'user__email']
     ordering = ['-points']
-    readonly_fields = ['created_at', 'updated_at']
+    # Counters only change through F() updates (ledger compaction and the
+    # accrual flush); a form save would write back the values it loaded
+    readonly_fields = ['points', 'total_recycled', 'co2_saved', 'created_at', 'updated_at']
     fieldsets = (
         ('User', {
             'fields': ('user',)
@@ -95,7 +101,50 @@ class UserProfileAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=['user', 'updated_at'])
+        else:
+            super().save_model(request, obj, form, change)
+
+    def get_changelist_instance(self, request):
+        """
+        Rank the whole page at once instead of once per row, on the same
+        totals as the dashboard (stored points plus uncompacted ledger
+        events and the accrual buffer)
+        """
+        changelist = super().get_changelist_instance(request)
+        profiles = changelist.result_list
+        pending = pending_points_by_user([profile.user_id for profile in profiles])
+        buffered = accrual_buffer.pending_points()
+        ranks = rank_service.ranks([
+            profile.points + (pending.get(profile.user_id) or 0) + buffered.get(profile.user_id, 0)
+            for profile in profiles
+        ])
+        for profile, rank in zip(profiles, ranks):
+            profile.rank = rank
+        return changelist
+
     def get_rank(self, obj):
         """Display user rank in admin list"""
-        return obj.get_rank()
+        return getattr(obj, 'rank', None) or obj.get_rank(obj.get_totals()['points'])
     get_rank.short_description = 'Rank'
+
+
+# Admin configuration for RecycleEvent model
+@admin.register(RecycleEvent)
+class RecycleEventAdmin(admin.ModelAdmin):
+    """
+    Read-only admin view of the append-only recycling ledger
+    """
+    list_display = ['user', 'device', 'points', 'co2_saved', 'compacted', 'created_at']
+    list_filter = ['compacted', 'created_at']
+    search_fields = ['user__username', 'device__brand', 'device__model_name']
+    list_select_related = ['user', 'device']
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
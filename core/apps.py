@@ -9,3 +9,4 @@ class CoreConfig(AppConfig):
     def ready(self):
         """Import signals when the app is ready"""
         import core.models  # Import models to register signals
+        import core.signals  # Keep in-memory indexes in sync
@@ -0,0 +1,130 @@
+"""
+Precomputed hierarchical marker clusters for the locator map
+Facilities are bucketed into fixed-size screen-pixel cells of the Web
+Mercator projection; each zoom level's cells are the 2x2 merge of the
+level below, so the whole pyramid is built in one pass over the table
+"""
+import math
+import threading
+
+# Cell edge in screen pixels, roughly the footprint of one cluster icon
+CLUSTER_CELL_PX = 64
+TILE_SIZE = 256
+MAX_CLUSTER_ZOOM = 16
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def project(lat, lng, zoom):
+    """Web Mercator pixel coordinates of (lat, lng) at the given zoom"""
+    scale = TILE_SIZE * (1 << zoom)
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    x = (lng + 180.0) / 360.0 * scale
+    sin_lat = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return x, y
+
+
+def cell_for(lat, lng, zoom):
+    """Cluster cell containing (lat, lng) at the given zoom"""
+    x, y = project(lat, lng, zoom)
+    last = (TILE_SIZE << zoom) // CLUSTER_CELL_PX - 1
+    return min(int(x // CLUSTER_CELL_PX), last), min(int(y // CLUSTER_CELL_PX), last)
+
+
+class ClusterPyramid:
+    """
+    Per-zoom dicts of cell -> [count, sum_lat, sum_lng, pk]
+    `pk` is only kept for single-facility cells so the API can
+    return those as ordinary markers
+    """
+
+    def __init__(self, max_zoom=MAX_CLUSTER_ZOOM):
+        self.max_zoom = max_zoom
+        self._levels = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._levels = None
+
+    def build(self, points):
+        """Build every level from an iterable of (pk, lat, lng)"""
+        finest = {}
+        for pk, lat, lng in points:
+            lat, lng = float(lat), float(lng)
+            cell = cell_for(lat, lng, self.max_zoom)
+            entry = finest.get(cell)
+            if entry is None:
+                finest[cell] = [1, lat, lng, pk]
+            else:
+                entry[0] += 1
+                entry[1] += lat
+                entry[2] += lng
+                entry[3] = None
+        levels = [None] * (self.max_zoom + 1)
+        levels[self.max_zoom] = finest
+        for zoom in range(self.max_zoom - 1, -1, -1):
+            merged = {}
+            for (cx, cy), (count, sum_lat, sum_lng, pk) in levels[zoom + 1].items():
+                parent = (cx >> 1, cy >> 1)
+                entry = merged.get(parent)
+                if entry is None:
+                    merged[parent] = [count, sum_lat, sum_lng, pk]
+                else:
+                    entry[0] += count
+                    entry[1] += sum_lat
+                    entry[2] += sum_lng
+                    entry[3] = None
+            levels[zoom] = merged
+        return levels
+
+    @classmethod
+    def of(cls, points):
+        """Pyramid over a fixed list of (pk, lat, lng), e.g. search results"""
+        pyramid = cls()
+        pyramid._levels = pyramid.build(points)
+        return pyramid
+
+    def levels(self):
+        levels = self._levels
+        if levels is None:
+            from .models import Facility
+
+            with self._lock:
+                if self._levels is None:
+                    self._levels = self.build(Facility.objects.values_list('id', 'latitude', 'longitude'))
+                levels = self._levels
+        return levels
+
+    def clusters(self, zoom, min_lat, min_lng, max_lat, max_lng):
+        """
+        Clusters whose cell intersects the bounding box at the given zoom
+        Returns dicts with count, centroid lat/lng and pk for singletons
+        """
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        level = self.levels()[zoom]
+        x0, y0 = cell_for(max_lat, min_lng, zoom)
+        x1, y1 = cell_for(min_lat, max_lng, zoom)
+
+        # Walk whichever is smaller: the cells in view or the occupied cells
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(level):
+            cells = (
+                ((cx, cy), level[(cx, cy)])
+                for cx in range(x0, x1 + 1)
+                for cy in range(y0, y1 + 1)
+                if (cx, cy) in level
+            )
+        else:
+            cells = (
+                (cell, entry) for cell, entry in level.items()
+                if x0 <= cell[0] <= x1 and y0 <= cell[1] <= y1
+            )
+
+        return [{
+            'lat': round(sum_lat / count, 6),
+            'lng': round(sum_lng / count, 6),
+            'count': count,
+            'id': pk,
+        } for _, (count, sum_lat, sum_lng, pk) in cells]
+
+
+facility_clusters = ClusterPyramid()
@@ -0,0 +1,59 @@
+"""
+In-process pool of ComponentInfo rows for the learn page
+The table is small and rarely edited, so every row is held in memory
+and a random pick is an in-memory choice with no database query. The
+pool is tied to component_version, the shared component revision that
+the ComponentInfo signals advance, so an edit made in any process
+reloads every worker's pool within DATASET_REVISION_POLL_SECONDS
+"""
+import random
+import threading
+
+from .conditional import component_version
+
+
+class ComponentPool:
+    """
+    Ids and instances of every ComponentInfo row, reloaded whenever the
+    component revision moves
+    Instances are shared between requests and must not be mutated
+    """
+
+    def __init__(self):
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._loaded = None
+
+    def _build(self, version):
+        from .models import ComponentInfo
+
+        components = {component.pk: component for component in ComponentInfo.objects.all()}
+        return version, tuple(components), components
+
+    def data(self):
+        """(ids, {id: component}) for the current component version"""
+        version = component_version.current()
+        loaded = self._loaded
+        if loaded is None or loaded[0] != version:
+            with self._lock:
+                if self._loaded is None or self._loaded[0] != version:
+                    self._loaded = self._build(version)
+                loaded = self._loaded
+        return loaded[1], loaded[2]
+
+    def __len__(self):
+        return len(self.data()[0])
+
+    def get(self, pk):
+        """Component with the given id, or None"""
+        return self.data()[1].get(pk)
+
+    def random(self):
+        """A random component, or None when there are none"""
+        ids, components = self.data()
+        return components[random.choice(ids)] if ids else None
+
+
+component_pool = ComponentPool()
@@ -0,0 +1,32 @@
+"""
+Cheap change markers for whole datasets, used for HTTP conditional GETs
+A dataset version is the shared DatasetRevision of the dataset (see
+core.revisions), so every worker hands out the same validators within
+DATASET_REVISION_POLL_SECONDS of a write made anywhere
+"""
+from .revisions import dataset_revisions
+
+
+class DatasetVersion:
+    """ETag and Last-Modified values of one dataset"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def current(self):
+        """(revision, time of the last write) as seen by this process"""
+        return dataset_revisions.current(self.name)
+
+    def etag(self, *parts):
+        """Strong ETag for the current version plus any extra parts"""
+        revision, updated_at = self.current()
+        # The timestamp keeps tags unique if the revision row is recreated
+        stamp = int(updated_at.timestamp() * 1e6) if updated_at else 0
+        return '"' + '-'.join(str(part) for part in (self.name, revision, stamp, *parts)) + '"'
+
+    def last_modified(self):
+        return self.current()[1]
+
+
+facility_version = DatasetVersion('facilities')
+component_version = DatasetVersion('components')
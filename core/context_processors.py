@@ -0,0 +1,13 @@
+from django.conf import settings
+
+
+def template_fragments(request):
+    """
+    Values used by the cached fragments of every page: the current
+    url_name for the navbar, resolved once per request, and the timeout
+    """
+    match = getattr(request, 'resolver_match', None)
+    return {
+        'nav_active': match.url_name if match else None,
+        'fragment_cache_timeout': settings.TEMPLATE_FRAGMENT_CACHE_TIMEOUT,
+    }
@@ -0,0 +1,284 @@
+"""
+In-process fuzzy search index over Device brand and model names
+Names are compacted (case, punctuation and spacing removed) and broken
+into trigrams, so "iphone12" or "Galaxy S-21" still find "iPhone 12"
+and "Galaxy S21" with one posting-list lookup per trigram
+"""
+import bisect
+import re
+import threading
+from collections import Counter
+
+# Minimum score for the best candidate to count as a match
+MIN_MATCH_SCORE = 0.45
+# Minimum score for other candidates to be offered as suggestions
+MIN_SUGGESTION_SCORE = 0.3
+# Share of the score given to the brand, the rest goes to the model name
+BRAND_WEIGHT = 0.3
+# Minimum brand similarity for a device to be a candidate at all, so a
+# strong model match under another brand is never offered
+MIN_BRAND_SCORE = 0.4
+
+
+def compact(text):
+    """Lowercase letters and digits only, e.g. 'Galaxy S-21' -> 'galaxys21'"""
+    return re.sub(r'[^0-9a-z]+', '', (text or '').lower())
+
+
+def trigrams(text):
+    """Set of padded character trigrams of a compacted string"""
+    if not text:
+        return set()
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """Dice coefficient between two trigram sets"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class DeviceIndex:
+    """
+    Trigram postings over model names plus per-device brand trigrams
+    Loaded lazily and kept current by the Device signals in core.signals
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._devices = {}
+        self._postings = {}
+        self._lock = threading.RLock()
+
+    def invalidate(self):
+        """Reload from the database on next use"""
+        with self._lock:
+            self.loaded = False
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self._lock:
+            if not self.loaded:
+                self.rebuild()
+
+    def rebuild(self):
+        """Reload every device name from the database"""
+        from .models import Device
+
+        with self._lock:
+            self._devices.clear()
+            self._postings.clear()
+            for pk, brand, model_name in Device.objects.values_list('id', 'brand', 'model_name'):
+                self.add(pk, brand, model_name)
+            self.loaded = True
+
+    def add(self, pk, brand, model_name):
+        """Index (or re-index) one device"""
+        model_grams = trigrams(compact(model_name))
+        with self._lock:
+            self.remove(pk)
+            self._devices[pk] = (compact(brand), trigrams(compact(brand)), model_grams, compact(model_name))
+            for gram in model_grams:
+                self._postings.setdefault(gram, set()).add(pk)
+
+    def remove(self, pk):
+        with self._lock:
+            entry = self._devices.pop(pk, None)
+            if entry is None:
+                return
+            for gram in entry[2]:
+                posting = self._postings.get(gram)
+                if posting is not None:
+                    posting.discard(pk)
+                    if not posting:
+                        del self._postings[gram]
+
+    def search(self, brand, model_name, limit=5):
+        """
+        Rank devices by similarity to the given brand and model name
+        Devices of a clearly different brand are left out unless no
+        brand is given. Returns up to `limit` (pk, score) pairs, best first
+        """
+        self.ensure_loaded()
+        brand_key = compact(brand)
+        brand_grams = trigrams(brand_key)
+        model_key = compact(model_name)
+        model_grams = trigrams(model_key)
+
+        with self._lock:
+            # Only devices sharing at least one model trigram are scored
+            shared = Counter()
+            for gram in model_grams:
+                shared.update(self._postings.get(gram, ()))
+
+            ranked = []
+            for pk, hits in shared.items():
+                device_brand, device_brand_grams, device_model_grams, device_model = self._devices[pk]
+                model_score = 2 * hits / (len(model_grams) + len(device_model_grams))
+                # A typed model that is contained in the stored one (as the
+                # old icontains lookup allowed) is at least a fair match
+                if model_key and model_key in device_model:
+                    model_score = max(model_score, 0.6 + 0.4 * len(model_key) / len(device_model))
+                if brand_key == device_brand:
+                    brand_score = 1.0
+                else:
+                    brand_score = similarity(brand_grams, device_brand_grams)
+                    if brand_key and brand_score < MIN_BRAND_SCORE:
+                        continue
+                score = BRAND_WEIGHT * brand_score + (1 - BRAND_WEIGHT) * model_score
+                ranked.append((score, pk))
+
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [(pk, round(score, 3)) for score, pk in ranked[:limit]]
+
+    def best_match(self, brand, model_name, limit=5):
+        """
+        (best pk or None, other candidate pks) for a brand/model query
+        """
+        results = [
+            (pk, score) for pk, score in self.search(brand, model_name, limit=limit)
+            if score >= MIN_SUGGESTION_SCORE
+        ]
+        if not results or results[0][1] < MIN_MATCH_SCORE:
+            return None, [pk for pk, _ in results]
+        return results[0][0], [pk for pk, _ in results[1:]]
+
+
+device_index = DeviceIndex()
+
+
+class SuggestionIndex:
+    """
+    Sorted array of compacted brand and model keys for prefix lookups
+    Each entry is (key, kind, brand, model_name); a model is reachable
+    both by its own name and by "brand model"
+    """
+
+    def __init__(self):
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._arrays = None
+
+    def _build(self):
+        from .models import Device
+
+        entries = set()
+        for brand, model_name in Device.objects.values_list('brand', 'model_name'):
+            entries.add((compact(brand), 'brand', brand, ''))
+            entries.add((compact(model_name), 'model', brand, model_name))
+            entries.add((compact(brand + model_name), 'model', brand, model_name))
+        entries = sorted(entries)
+        return [entry[0] for entry in entries], entries
+
+    def arrays(self):
+        """Return (keys, entries), building them if needed"""
+        arrays = self._arrays
+        if arrays is None:
+            with self._lock:
+                if self._arrays is None:
+                    self._arrays = self._build()
+                arrays = self._arrays
+        return arrays
+
+    def suggest(self, query, brand=None, limit=8):
+        """
+        Brands and models whose key starts with the query, brands first
+        Pass `brand` to only suggest that brand's models
+        """
+        prefix = compact(query)
+        if not prefix:
+            return []
+        brand_key = compact(brand) if brand else None
+        keys, entries = self.arrays()
+
+        brands, models, seen = [], [], set()
+        for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+            key, kind, entry_brand, model_name = entries[i]
+            if not key.startswith(prefix) or len(brands) + len(models) >= limit * 2:
+                break
+            if brand_key and (kind == 'brand' or compact(entry_brand) != brand_key):
+                continue
+            if (kind, entry_brand, model_name) in seen:
+                continue
+            seen.add((kind, entry_brand, model_name))
+            (brands if kind == 'brand' else models).append({
+                'type': kind,
+                'label': f'{entry_brand} {model_name}'.strip(),
+                'brand': entry_brand,
+                'model_name': model_name,
+            })
+        return (brands + models)[:limit]
+
+
+suggestion_index = SuggestionIndex()
+
+
+class DeviceCatalog:
+    """
+    Compact (id, label) list of every device for the recycle picker,
+    sorted by label, plus an id -> label dict for form validation
+    Invalidated by the Device signals, and by the device revision for
+    writes made in other processes (including bulk value updates)
+    """
+
+    def __init__(self):
+        self._data = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._data = None
+
+    def _build(self):
+        from .models import Device
+
+        entries = sorted(
+            (f"{brand} {model_name} (₹{value})", pk)
+            for pk, brand, model_name, value in Device.objects.values_list(
+                'id', 'brand', 'model_name', 'estimated_value'
+            )
+        )
+        choices = [(pk, label) for label, pk in entries]
+        keys = [compact(label) for label, _ in entries]
+        return choices, keys, dict(choices)
+
+    def data(self):
+        data = self._data
+        if data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self._build()
+                data = self._data
+        return data
+
+    def __contains__(self, pk):
+        return pk in self.data()[2]
+
+    def label(self, pk):
+        return self.data()[2].get(pk)
+
+    def page(self, query='', offset=0, limit=20):
+        """
+        (choices, has_more) for devices whose label contains the query,
+        ignoring case, spacing and punctuation
+        """
+        choices, keys, _ = self.data()
+        needle = compact(query)
+        if needle:
+            matches = (choice for choice, key in zip(choices, keys) if needle in key)
+        else:
+            matches = iter(choices)
+        page = []
+        for i, choice in enumerate(matches):
+            if i >= offset + limit:
+                return page, True
+            if i >= offset:
+                page.append(choice)
+        return page, False
+
+
+device_catalog = DeviceCatalog()
@@ -0,0 +1,119 @@
+"""
+Vectorized great-circle distances from one or many origins to every facility
+Facility coordinates are held as contiguous NumPy arrays so a ranking is a
+handful of array operations instead of per-row Decimal arithmetic
+"""
+import threading
+
+import numpy as np
+
+from .spatial import EARTH_RADIUS_KM
+
+# Upper bound on origins x facilities evaluated in one array operation,
+# keeps peak memory around 100 MB for batch queries
+MAX_BLOCK_ELEMENTS = 4_000_000
+
+
+def haversine_matrix(origin_lats, origin_lngs, lats_rad, lngs_rad, cos_lats=None):
+    """
+    Distances in km from each origin (degrees) to each destination (radians)
+    Returns an array of shape (len(origins), len(destinations))
+    """
+    phi1 = np.radians(np.asarray(origin_lats, dtype=np.float64))[:, None]
+    lmb1 = np.radians(np.asarray(origin_lngs, dtype=np.float64))[:, None]
+    if cos_lats is None:
+        cos_lats = np.cos(lats_rad)
+    a = np.sin((lats_rad - phi1) / 2) ** 2 + np.cos(phi1) * cos_lats * np.sin((lngs_rad - lmb1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class FacilityCoordinates:
+    """
+    Snapshot of all facility coordinates as parallel arrays sorted by id
+    Rebuilt lazily after core.signals marks it stale
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._arrays = None
+
+    def invalidate(self):
+        self._arrays = None
+
+    def _load(self):
+        from .models import Facility
+
+        rows = list(Facility.objects.order_by('id').values_list('id', 'latitude', 'longitude'))
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        coords = np.array([(row[1], row[2]) for row in rows], dtype=np.float64).reshape(-1, 2)
+        lats = np.ascontiguousarray(np.radians(coords[:, 0]))
+        lngs = np.ascontiguousarray(np.radians(coords[:, 1]))
+        return ids, lats, lngs, np.cos(lats)
+
+    def arrays(self):
+        """Return (ids, lats_rad, lngs_rad, cos_lats), loading if needed"""
+        arrays = self._arrays
+        if arrays is None:
+            with self._lock:
+                if self._arrays is None:
+                    self._arrays = self._load()
+                arrays = self._arrays
+        return arrays
+
+    def subset(self, pks=None):
+        """Arrays restricted to the given facility ids (all when None)"""
+        ids, lats, lngs, cos_lats = self.arrays()
+        if pks is None:
+            return ids, lats, lngs, cos_lats
+        wanted = np.asarray(sorted(pks), dtype=np.int64)
+        positions = np.searchsorted(ids, wanted)
+        positions = positions[positions < len(ids)]
+        positions = positions[np.isin(ids[positions], wanted)]
+        return ids[positions], lats[positions], lngs[positions], cos_lats[positions]
+
+    def distances_from(self, lat, lng, pks=None):
+        """
+        Distances in km from one origin to the given facility ids
+        (or every facility), as (ids, distances) arrays
+        """
+        ids, lats, lngs, cos_lats = self.subset(pks)
+        return ids, haversine_matrix([lat], [lng], lats, lngs, cos_lats)[0]
+
+    def rank(self, lat, lng, pks=None):
+        """Return [(pk, distance_km), ...] sorted nearest first"""
+        ids, distances = self.distances_from(lat, lng, pks)
+        order = np.argsort(distances, kind='stable')
+        return list(zip(ids[order].tolist(), distances[order].tolist()))
+
+    def nearest_many(self, origins, k=1, radius_km=None, pks=None):
+        """
+        For each (lat, lng) origin return up to k (pk, distance_km) pairs,
+        nearest first, processing origins in memory-bounded blocks
+        """
+        ids, lats, lngs, cos_lats = self.subset(pks)
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+        if not len(ids):
+            return [[] for _ in range(len(origins))]
+        k = min(k, len(ids))
+        block = max(1, MAX_BLOCK_ELEMENTS // len(ids))
+        results = []
+        for start in range(0, len(origins), block):
+            chunk = origins[start:start + block]
+            distances = haversine_matrix(chunk[:, 0], chunk[:, 1], lats, lngs, cos_lats)
+            if k < len(ids):
+                top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(len(ids)), distances.shape)
+            top_distances = np.take_along_axis(distances, top, axis=1)
+            order = np.argsort(top_distances, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            top_distances = np.take_along_axis(top_distances, order, axis=1)
+            for row_ids, row_distances in zip(ids[top].tolist(), top_distances.tolist()):
+                pairs = zip(row_ids, row_distances)
+                if radius_km is not None:
+                    pairs = [(pk, d) for pk, d in pairs if d <= radius_km]
+                results.append(list(pairs))
+        return results
+
+
+facility_coordinates = FacilityCoordinates()
@@ -0,0 +1,56 @@
+"""
+Streaming encoders for the facility export API
+Rows are read with a server-side iterator and encoded a batch at a
+time, so memory use stays flat however large the table grows
+"""
+import json
+from decimal import Decimal
+
+EXPORT_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+# Rows fetched per database round trip and encoded per yielded chunk
+EXPORT_CHUNK_SIZE = 2000
+
+
+def iter_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield JSON-ready dicts for `fields` without caching the queryset"""
+    for values in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield {
+            field: float(value) if isinstance(value, Decimal) else value
+            for field, value in zip(fields, values)
+        }
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(row))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encode_json_array(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Encode rows as one JSON array, yielded in pieces"""
+    yield '['
+    first = True
+    for batch in _batched(rows, chunk_size):
+        yield ('' if first else ',') + ','.join(batch)
+        first = False
+    yield ']'
+
+
+def encode_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Encode rows as newline-delimited JSON, one object per line"""
+    for batch in _batched(rows, chunk_size):
+        yield '\n'.join(batch) + '\n'
+
+
+ENCODERS = {
+    'json': encode_json_array,
+    'ndjson': encode_ndjson,
+}
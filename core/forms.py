@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from .models import Device
+from .device_search import device_catalog
 
 
 class DeviceSearchForm(forms.Form):
@@ -15,7 +16,8 @@ class DeviceSearchForm(forms.Form):
         widget=forms.TextInput(attrs={
             'class': 'form-control',
             'placeholder': 'Enter device brand (e.g., Apple, Samsung)',
-            'autocomplete': 'off'
+            'autocomplete': 'off',
+            'list': 'brand-suggestions'
         })
     )
     model_name = forms.CharField(
@@ -24,7 +26,8 @@ class DeviceSearchForm(forms.Form):
         widget=forms.TextInput(attrs={
             'class': 'form-control',
             'placeholder': 'Enter model name (e.g., iPhone 12, Galaxy S21)',
-            'autocomplete': 'off'
+            'autocomplete': 'off',
+            'list': 'model-suggestions'
         })
     )
 
@@ -41,13 +44,14 @@ class DeviceSearchForm(forms.Form):
 
 class FacilitySearchForm(forms.Form):
     """
-    Form for searching facilities by city or pincode
-    Used in the Facility Locator
+    Form for searching facilities by city, pincode or any text, and by
+    accepted items. Used in the Facility Locator
     """
     SEARCH_CHOICES = [
         ('', 'All Locations'),
         ('city', 'Search by City'),
         ('pincode', 'Search by Pincode'),
+        ('anywhere', 'Search Anywhere'),
     ]
     
     search_type = forms.ChoiceField(
@@ -63,11 +67,35 @@ class FacilitySearchForm(forms.Form):
         required=False,
         widget=forms.TextInput(attrs={
             'class': 'form-control',
-            'placeholder': 'Enter city name or pincode',
+            'placeholder': 'Enter city, pincode, name or address',
+            'autocomplete': 'off'
+        })
+    )
+
+    accepts = forms.CharField(
+        max_length=200,
+        required=False,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Accepts (e.g., laptop, battery)',
             'autocomplete': 'off'
         })
     )
 
+    # Filled in by the browser's geolocation to sort results by distance
+    lat = forms.FloatField(
+        required=False,
+        min_value=-90,
+        max_value=90,
+        widget=forms.HiddenInput()
+    )
+    lng = forms.FloatField(
+        required=False,
+        min_value=-180,
+        max_value=180,
+        widget=forms.HiddenInput()
+    )
+
 
 class UserRegistrationForm(UserCreationForm):
     """
@@ -129,21 +157,66 @@ class UserRegistrationForm(UserCreationForm):
         return user
 
 
+# Devices listed per page of the recycle picker
+DEVICE_PICKER_PAGE_SIZE = 20
+
+
+class DevicePickerField(forms.Field):
+    """
+    Device chosen by id from the in-memory device catalog
+    Only a page of options is rendered; the rest are searched through
+    the device picker API. Cleans to a Device instance
+    """
+    widget = forms.Select
+
+    default_error_messages = {
+        'invalid_choice': 'Select a valid device.',
+    }
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+    def clean(self, value):
+        pk = super().clean(value)
+        if pk is None:
+            return None
+        # Validate against the catalog first so bad ids never reach the database
+        if pk not in device_catalog:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        try:
+            return Device.objects.get(pk=pk)
+        except Device.DoesNotExist:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+
 class RecycleDeviceForm(forms.Form):
     """
     Form for simulating device recycling action
     Used in the dashboard to add recycled devices
     """
-    device = forms.ModelChoiceField(
-        queryset=Device.objects.all(),
+    device = DevicePickerField(
         required=True,
         widget=forms.Select(attrs={
             'class': 'form-select',
+            'size': 8,
         }),
         label='Select Device to Recycle'
     )
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Customize the device display in dropdown
-        self.fields['device'].label_from_instance = lambda obj: f"{obj.brand} {obj.model_name} (₹{obj.estimated_value})"
+        # Render the first page of the catalog, keeping a submitted choice
+        choices, self.has_more_devices = device_catalog.page(limit=DEVICE_PICKER_PAGE_SIZE)
+        selected = self.data.get(self.add_prefix('device')) if self.is_bound else None
+        try:
+            selected = int(selected)
+        except (TypeError, ValueError):
+            selected = None
+        if selected is not None and selected in device_catalog and selected not in dict(choices):
+            choices = [(selected, device_catalog.label(selected))] + choices
+        self.fields['device'].widget.choices = choices
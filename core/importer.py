@@ -0,0 +1,265 @@
+"""
+Bulk facility import from CSV, JSON, JSON Lines and GeoJSON files
+Records are streamed from disk, validated and normalized (missing coordinates
+are filled from the PIN code centroid table), then upserted
+in batches keyed on (name, pincode) with a single INSERT ... ON CONFLICT
+per batch. Signals are bypassed, so derived data is refreshed once at
+the end with refresh_facility_data()
+"""
+import csv
+import json
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .pincodes import pincode_centroids
+
+IMPORT_FORMATS = ('csv', 'json', 'jsonl', 'geojson')
+COORDINATE_STEP = Decimal('0.000001')
+PINCODE_RE = re.compile(r'^\d{6}$')
+
+# Alternative column names accepted in import files
+FIELD_ALIASES = {
+    'lat': 'latitude',
+    'lng': 'longitude',
+    'lon': 'longitude',
+    'long': 'longitude',
+    'pin': 'pincode',
+    'pin_code': 'pincode',
+    'postal_code': 'pincode',
+    'phone': 'contact',
+    'items': 'accepted_items',
+}
+TEXT_FIELDS = ('name', 'address', 'city', 'contact')
+UPDATE_FIELDS = ('address', 'city', 'city_key', 'pincode_key', 'latitude', 'longitude', 'contact', 'accepted_items', 'updated_at')
+
+
+def detect_format(path):
+    """Guess the import format from a file name"""
+    suffix = path.rsplit('.', 1)[-1].lower()
+    if suffix == 'ndjson':
+        return 'jsonl'
+    if suffix in IMPORT_FORMATS:
+        return suffix
+    raise ValueError(f"Cannot tell the format of '{path}', pass one of {', '.join(IMPORT_FORMATS)}")
+
+
+def _iter_json_array(fh, key=None, block_size=1 << 16):
+    """
+    Yield the items of a top-level JSON array, or of the array stored
+    under `key` in a top-level object, reading the file block by block
+    """
+    decoder = json.JSONDecoder()
+    start = re.compile(rf'"{re.escape(key)}"\s*:\s*\[' if key else r'\s*\[')
+    buf = ''
+    eof = False
+
+    def read_more():
+        nonlocal buf, eof
+        block = fh.read(block_size)
+        eof = not block
+        buf += block
+        return not eof
+
+    match = start.search(buf) if key else start.match(buf)
+    while match is None:
+        if not read_more():
+            raise ValueError(f"No JSON array found{f' under {key!r}' if key else ''}")
+        match = start.search(buf) if key else start.match(buf)
+    pos = match.end()
+
+    while True:
+        while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ','):
+            pos += 1
+        if pos >= len(buf):
+            if not read_more():
+                raise ValueError('Unterminated JSON array')
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if not read_more():
+                raise
+            continue
+        yield item
+        pos = end
+        if pos > block_size:
+            buf, pos = buf[pos:], 0
+
+
+def read_records(fh, fmt):
+    """
+    Yield (position, raw dict) pairs from an open text file, where
+    position is a line number for CSV/JSON Lines and an index otherwise
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(fh)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(fh, 1):
+            if line.strip():
+                yield line_num, json.loads(line)
+    elif fmt == 'json':
+        for index, item in enumerate(_iter_json_array(fh), 1):
+            # Accept the facility entries of Django fixtures as well as plain objects
+            if isinstance(item, dict) and 'fields' in item and 'model' in item:
+                if item['model'] != 'core.facility':
+                    continue
+                item = item['fields']
+            yield index, item
+    elif fmt == 'geojson':
+        for index, feature in enumerate(_iter_json_array(fh, key='features'), 1):
+            record = dict((feature or {}).get('properties') or {})
+            coordinates = ((feature or {}).get('geometry') or {}).get('coordinates') or []
+            if len(coordinates) >= 2:
+                record['longitude'], record['latitude'] = coordinates[:2]
+            yield index, record
+    else:
+        raise ValueError(f"Unknown import format '{fmt}'")
+
+
+def _coordinate(value, name, limit):
+    try:
+        number = Decimal(str(value).strip()).quantize(COORDINATE_STEP)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"'{name}' must be a number")
+    if not -limit <= number <= limit:
+        raise ValueError(f"'{name}' must be between {-limit} and {limit}")
+    return number
+
+
+def validate_pincode(value):
+    """Six-digit Indian PIN code with spaces removed, or ValueError"""
+    pincode = re.sub(r'\s+', '', str(value or ''))
+    if not PINCODE_RE.match(pincode):
+        raise ValueError("'pincode' must be 6 digits")
+    return pincode
+
+
+def normalize_record(raw):
+    """
+    Turn one raw import record into Facility field values
+    Raises ValueError describing the first problem found
+    """
+    from .models import Facility, normalize_city, normalize_pincode
+
+    if not isinstance(raw, dict):
+        raise ValueError('record is not an object')
+    record = {}
+    for key, value in raw.items():
+        key = str(key).strip().lower()
+        record[FIELD_ALIASES.get(key, key)] = value
+
+    values = {}
+    for field in TEXT_FIELDS:
+        text = re.sub(r'\s+', ' ', str(record.get(field) or '')).strip()
+        if not text and field != 'contact':
+            raise ValueError(f"'{field}' is required")
+        max_length = Facility._meta.get_field(field).max_length
+        if max_length and len(text) > max_length:
+            raise ValueError(f"'{field}' is longer than {max_length} characters")
+        values[field] = text
+    values['pincode'] = validate_pincode(record.get('pincode'))
+
+    latitude, longitude = record.get('latitude'), record.get('longitude')
+    if latitude in (None, '') or longitude in (None, ''):
+        # Fall back to the centroid of the facility's PIN code
+        centroid = pincode_centroids.lookup(values['pincode'])
+        if centroid is None:
+            raise ValueError("'latitude' and 'longitude' are required when the pincode has no known centroid")
+        latitude, longitude = centroid
+    values['latitude'] = _coordinate(latitude, 'latitude', 90)
+    values['longitude'] = _coordinate(longitude, 'longitude', 180)
+
+    items = record.get('accepted_items') or ''
+    if isinstance(items, (list, tuple)):
+        items = ', '.join(str(item).strip() for item in items if str(item).strip())
+    values['accepted_items'] = str(items).strip()
+    # bulk_create skips the pre_save receiver that fills these
+    values['city_key'] = normalize_city(values['city'])
+    values['pincode_key'] = normalize_pincode(values['pincode'])
+    return values
+
+
+def upsert_batch(rows):
+    """
+    Insert or update one batch of normalized rows keyed on (name, pincode)
+    Returns (created, updated)
+    """
+    from .models import Facility
+
+    # A statement may not touch the same row twice, so the last one wins
+    rows = list({(row['name'], row['pincode']): row for row in rows}.values())
+    existing = set(Facility.objects.filter(
+        name__in={row['name'] for row in rows},
+        pincode__in={row['pincode'] for row in rows},
+    ).values_list('name', 'pincode'))
+    with transaction.atomic():
+        Facility.objects.bulk_create(
+            [Facility(**row) for row in rows],
+            update_conflicts=True,
+            unique_fields=['name', 'pincode'],
+            update_fields=list(UPDATE_FIELDS),
+        )
+    updated = sum((row['name'], row['pincode']) in existing for row in rows)
+    return len(rows) - updated, updated
+
+
+def import_facilities(records, batch_size=1000, dry_run=False, on_error=None):
+    """
+    Validate and upsert (position, raw dict) records in batches
+    Invalid records are reported through on_error(position, message)
+    and skipped. Returns counts of valid, created, updated and invalid rows
+    """
+    counts = {'valid': 0, 'created': 0, 'updated': 0, 'invalid': 0}
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            created, updated = upsert_batch(batch)
+            counts['created'] += created
+            counts['updated'] += updated
+        batch.clear()
+
+    for position, raw in records:
+        try:
+            batch.append(normalize_record(raw))
+        except ValueError as e:
+            counts['invalid'] += 1
+            if on_error is not None:
+                on_error(position, str(e))
+            continue
+        counts['valid'] += 1
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return counts
+
+
+def refresh_facility_data():
+    """
+    Rebuild every structure derived from Facility rows, for use after
+    bulk writes that bypassed the signals in core.signals, and advance
+    the shared facility revision so other processes drop theirs
+    """
+    from .clustering import facility_clusters
+    from .distance import facility_coordinates
+    from .items import item_index
+    from .revisions import dataset_revisions
+    from .spatial import facility_index
+    from . import query_cache, stats, tiles
+
+    if facility_index.loaded:
+        facility_index.rebuild()
+    if item_index.loaded:
+        item_index.rebuild()
+    facility_coordinates.invalidate()
+    facility_clusters.invalidate()
+    tiles.clear_cache()
+    query_cache.invalidate_facilities()
+    stats.invalidate()
+    dataset_revisions.bump('facilities')
@@ -0,0 +1,165 @@
+"""
+Normalized vocabulary and inverted index for Facility.accepted_items
+Maps each canonical item to the set of facility ids that accept it so
+"who takes my device" questions are answered by set intersections
+"""
+import re
+import threading
+
+# Alternative spellings mapped to the canonical item name, which follows
+# Device.DEVICE_TYPES where one exists
+ITEM_SYNONYMS = {
+    'mice': 'mouse',
+    'notebook': 'laptop',
+    'mobile': 'smartphone',
+    'mobile phone': 'smartphone',
+    'cell phone': 'smartphone',
+    'phone': 'smartphone',
+    'ipad': 'tablet',
+    'computer': 'desktop',
+    'desktop computer': 'desktop',
+    'pc': 'desktop',
+    'screen': 'monitor',
+    'display': 'monitor',
+    'tv': 'television',
+    'wire': 'cable',
+    'charger': 'power adapter',
+    'adapter': 'power adapter',
+    'pcb': 'circuit board',
+    'ac': 'air conditioner',
+    'fridge': 'refrigerator',
+    'cell': 'battery',
+}
+
+# Phrases meaning the facility takes any kind of e-waste
+WILDCARD_ITEMS = {
+    'all types of electronic devices',
+    'all electronic devices',
+    'all electronics',
+    'all e-waste',
+    'any e-waste',
+}
+
+
+def _singular(word):
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('ches', 'shes', 'xes', 'sses')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us')) and len(word) > 2:
+        return word[:-1]
+    return word
+
+
+def normalize_item(text):
+    """Canonical name for one item, e.g. 'Mobile phones' -> 'smartphone'"""
+    text = re.sub(r'\s+', ' ', text.strip().lower())
+    if not text or text in WILDCARD_ITEMS:
+        return text
+    text = ITEM_SYNONYMS.get(text, text)
+    singular = ' '.join(_singular(word) for word in text.split(' '))
+    return ITEM_SYNONYMS.get(singular, singular)
+
+
+def parse_items(text):
+    """
+    Split a comma-separated item list into (canonical items, is_wildcard)
+    """
+    items = set()
+    wildcard = False
+    for part in (text or '').split(','):
+        item = normalize_item(part)
+        if item in WILDCARD_ITEMS:
+            wildcard = True
+        elif item:
+            items.add(item)
+    return items, wildcard
+
+
+class ItemIndex:
+    """
+    Posting sets of facility ids per canonical item, plus the set of
+    facilities that accept everything
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._postings = {}
+        self._wildcard = set()
+        self._items_by_id = {}
+        self._lock = threading.RLock()
+
+    def invalidate(self):
+        """Reload from the database on next use"""
+        with self._lock:
+            self.loaded = False
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self._lock:
+            if not self.loaded:
+                self.rebuild()
+
+    def rebuild(self):
+        """Reload every facility's accepted items from the database"""
+        from .models import Facility
+
+        with self._lock:
+            self._postings.clear()
+            self._wildcard.clear()
+            self._items_by_id.clear()
+            for pk, accepted_items in Facility.objects.values_list('id', 'accepted_items'):
+                self.add(pk, accepted_items)
+            self.loaded = True
+
+    def add(self, pk, accepted_items):
+        """Index (or re-index) one facility"""
+        items, wildcard = parse_items(accepted_items)
+        with self._lock:
+            self.remove(pk)
+            self._items_by_id[pk] = items
+            for item in items:
+                self._postings.setdefault(item, set()).add(pk)
+            if wildcard:
+                self._wildcard.add(pk)
+
+    def remove(self, pk):
+        with self._lock:
+            for item in self._items_by_id.pop(pk, ()):
+                posting = self._postings.get(item)
+                if posting is not None:
+                    posting.discard(pk)
+                    if not posting:
+                        del self._postings[item]
+            self._wildcard.discard(pk)
+
+    def vocabulary(self):
+        self.ensure_loaded()
+        return sorted(self._postings)
+
+    def facilities_accepting(self, items):
+        """
+        Ids of facilities accepting every item in `items` (raw or
+        canonical names); wildcard facilities match any item
+        """
+        self.ensure_loaded()
+        wanted = {normalize_item(item) for item in items if item.strip()}
+        with self._lock:
+            postings = [self._postings.get(item, set()) for item in wanted]
+            # Intersect the smallest posting sets first
+            postings.sort(key=len)
+            matches = None
+            for posting in postings:
+                matches = posting if matches is None else matches & posting
+                if not matches:
+                    break
+            return (set(matches) if matches else set()) | self._wildcard
+
+
+def parse_accepts_param(raw):
+    """Turn '?accepts=laptop,battery' into a list of item names"""
+    return [part for part in (raw or '').split(',') if part.strip()]
+
+
+item_index = ItemIndex()
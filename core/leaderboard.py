@@ -0,0 +1,210 @@
+"""
+Materialized leaderboards for the dashboard
+Each window (all time, this month, this week) is computed from profile
+totals and the RecycleEvent ledger, stored as LeaderboardEntry rows and
+cached for LEADERBOARD_CACHE_TIMEOUT seconds. Refreshes only rewrite the
+positions that changed. The `worker` process of the Procfile (and the
+render.yaml worker service) runs refresh_leaderboard to keep the stored
+snapshots current. Without it every snapshot goes stale, and each worker
+process computes the window itself on every cache miss, i.e. every
+LEADERBOARD_CACHE_TIMEOUT seconds (one more query); it only
+caches the result, never writes the table
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .ledger import with_pending_events
+from .models import LeaderboardEntry, RecycleEvent, UserProfile
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = [window for window, _ in LeaderboardEntry.WINDOW_CHOICES]
+ROW_FIELDS = ('user_id', 'username', 'points', 'total_recycled', 'co2_saved')
+
+
+def _cache_key(window):
+    return f'core:leaderboard:{window}'
+
+
+def window_start(window, now=None):
+    """Start of a window in local time, or None for all time"""
+    now = timezone.localtime(now or timezone.now())
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == 'week':
+        return midnight - timedelta(days=midnight.weekday())
+    if window == 'month':
+        return midnight.replace(day=1)
+    return None
+
+
+def _all_time_rows(size):
+    """
+    Top profiles by stored points plus ledger events not compacted yet
+    Only profiles already in the stored top `size` or with pending
+    events can be in the combined top `size`; all are read in one query
+    """
+    top_ids = UserProfile.objects.order_by('-points', 'user_id').values('user_id')[:size]
+    candidates = (
+        with_pending_events(UserProfile.objects.order_by())
+        .filter(Q(user_id__in=top_ids) | Q(user_id__in=RecycleEvent.objects.filter(compacted=False).values('user_id')))
+        .values('user_id', 'user__username', 'points', 'total_recycled', 'co2_saved')
+        .annotate(
+            pending_points=Sum('pending_events__points'),
+            pending_recycled=Count('pending_events'),
+            pending_co2=Sum('pending_events__co2_saved'),
+        )
+    )
+
+    rows = []
+    for profile in candidates:
+        rows.append({
+            'user_id': profile['user_id'],
+            'username': profile['user__username'],
+            'points': profile['points'] + (profile['pending_points'] or 0),
+            'total_recycled': profile['total_recycled'] + profile['pending_recycled'],
+            'co2_saved': profile['co2_saved'] + (profile['pending_co2'] or 0),
+        })
+    rows.sort(key=lambda row: (-row['points'], row['user_id']))
+    return rows[:size]
+
+
+def _window_rows(since, size):
+    """Users ranked by ledger events recorded since `since`"""
+    events = (
+        RecycleEvent.objects.filter(created_at__gte=since)
+        .values('user_id', 'user__username')
+        .annotate(points=Sum('points'), total_recycled=Count('id'), co2_saved=Sum('co2_saved'))
+        .order_by('-points', 'user_id')[:size]
+    )
+    return [
+        {
+            'user_id': event['user_id'],
+            'username': event['user__username'],
+            'points': event['points'],
+            'total_recycled': event['total_recycled'],
+            'co2_saved': event['co2_saved'],
+        }
+        for event in events
+    ]
+
+
+def compute(window, now=None):
+    """Current top LEADERBOARD_SIZE rows of a window, best first"""
+    size = settings.LEADERBOARD_SIZE
+    since = window_start(window, now)
+    rows = _all_time_rows(size) if since is None else _window_rows(since, size)
+    for position, row in enumerate(rows, 1):
+        row['position'] = position
+    return _assign_ranks(rows)
+
+
+def _assign_ranks(rows):
+    """
+    Give rows ordered by points the rank the rank service reports for
+    them: 1 + number of users with more points, so ties share a rank
+    """
+    for i, row in enumerate(rows):
+        if i and max(row['points'], 0) == max(rows[i - 1]['points'], 0):
+            row['rank'] = rows[i - 1]['rank']
+        else:
+            row['rank'] = i + 1
+    return rows
+
+
+def _store(window, rows, now):
+    """
+    Write the positions of `rows` that differ from the stored snapshot
+    Returns the number of rows created, updated or deleted
+    """
+    with transaction.atomic():
+        existing = {
+            entry.position: entry
+            for entry in LeaderboardEntry.objects.select_for_update().filter(window=window)
+        }
+        created, updated = [], []
+        for row in rows:
+            entry = existing.pop(row['position'], None)
+            if entry is None:
+                created.append(LeaderboardEntry(
+                    window=window, position=row['position'], computed_at=now,
+                    **{field: row[field] for field in ROW_FIELDS}
+                ))
+            elif any(getattr(entry, field) != row[field] for field in ROW_FIELDS):
+                for field in ROW_FIELDS:
+                    setattr(entry, field, row[field])
+                updated.append(entry)
+        if existing:
+            LeaderboardEntry.objects.filter(pk__in=[entry.pk for entry in existing.values()]).delete()
+        if updated:
+            LeaderboardEntry.objects.bulk_update(updated, ROW_FIELDS)
+        if created:
+            LeaderboardEntry.objects.bulk_create(created)
+        LeaderboardEntry.objects.filter(window=window).update(computed_at=now)
+    return len(created) + len(updated) + len(existing)
+
+
+def refresh_window(window, now=None):
+    """
+    Recompute, store and cache one window
+    Returns ((computed_at, rows), rows written)
+    """
+    now = now or timezone.now()
+    rows = compute(window, now)
+    try:
+        written = _store(window, rows, now)
+    except IntegrityError:
+        # Another worker inserted the same positions concurrently
+        logger.info("Leaderboard %s was refreshed concurrently", window)
+        written = 0
+    snapshot = (now, rows)
+    cache.set(_cache_key(window), snapshot, settings.LEADERBOARD_CACHE_TIMEOUT)
+    return snapshot, written
+
+
+def refresh(windows=None):
+    """
+    Recompute every given window (all of them by default)
+    Returns {window: rows written}
+    """
+    now = timezone.now()
+    return {window: refresh_window(window, now)[1] for window in windows or WINDOWS}
+
+
+def _load(window):
+    """(computed_at, rows) of the stored snapshot, or None when missing"""
+    entries = list(
+        LeaderboardEntry.objects.filter(window=window).order_by('position')
+        .values('position', 'computed_at', *ROW_FIELDS)
+    )
+    if not entries:
+        return None
+    computed_at = entries[0]['computed_at']
+    rows = [{key: value for key, value in entry.items() if key != 'computed_at'} for entry in entries]
+    return computed_at, _assign_ranks(rows)
+
+
+def get_leaderboard(window='all'):
+    """
+    Snapshot of one window as {'window', 'computed_at', 'entries'}; zero
+    database queries while the cached snapshot is present, one when the
+    stored snapshot is fresh, and 1 + compute() otherwise
+    """
+    if window not in WINDOWS:
+        window = 'all'
+    snapshot = cache.get(_cache_key(window))
+    if snapshot is None:
+        snapshot = _load(window)
+        max_age = timedelta(seconds=settings.LEADERBOARD_MAX_AGE)
+        if snapshot is None or timezone.now() - snapshot[0] > max_age:
+            # No worker is refreshing the table; writes are left to it
+            now = timezone.now()
+            snapshot = (now, compute(window, now))
+        cache.set(_cache_key(window), snapshot, settings.LEADERBOARD_CACHE_TIMEOUT)
+    computed_at, rows = snapshot
+    return {'window': window, 'computed_at': computed_at, 'entries': rows}
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg
+from core.models import Facility
+from core.pincodes import build_index, read_centroids_csv
+
+
+class Command(BaseCommand):
+    """
+    Compile the PIN code centroid CSV into the memory-mapped lookup file
+    Optionally fill PIN codes missing from the CSV with the average
+    position of the facilities that use them
+    """
+    help = 'Build the offline PIN code -> centroid lookup file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default=None, help='Source CSV (default: PINCODE_CENTROIDS_CSV)')
+        parser.add_argument(
+            '--from-facilities', action='store_true',
+            help='Add centroids of facility PIN codes that are not in the CSV',
+        )
+
+    def handle(self, *args, **options):
+        source = options['csv'] or settings.PINCODE_CENTROIDS_CSV
+        try:
+            rows = {pincode: (pincode, lat, lng) for pincode, lat, lng in read_centroids_csv(source)}
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f'Could not read {source}: {e}')
+
+        if options['from_facilities']:
+            derived = Facility.objects.values('pincode').annotate(lat=Avg('latitude'), lng=Avg('longitude'))
+            for row in derived:
+                rows.setdefault(row['pincode'], (row['pincode'], float(row['lat']), float(row['lng'])))
+
+        stored = build_index(rows.values(), settings.PINCODE_CENTROIDS_PATH)
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {stored} PIN code centroids in {settings.PINCODE_CENTROIDS_PATH}'
+        ))
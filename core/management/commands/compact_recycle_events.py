@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from core.ledger import compact_events
+
+
+class Command(BaseCommand):
+    """
+    Roll pending RecycleEvent rows into UserProfile totals
+    Meant to run periodically (e.g. every few minutes from cron); the
+    deployed `refresh_leaderboard --compact` worker already does
+    """
+    help = 'Compact the recycling ledger into user profile totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        compacted = compact_events(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Compacted {compacted} recycle events'))
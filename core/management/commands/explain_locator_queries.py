@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from core.items import item_index
+from core.models import Facility
+
+
+class Command(BaseCommand):
+    """
+    Print the database's query plan for each facility locator query shape
+    Sample filter values are taken from an existing facility
+    """
+    help = 'Show EXPLAIN output for the locator and facilities API queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='Run the queries (EXPLAIN ANALYZE, PostgreSQL only)')
+
+    def handle(self, *args, **options):
+        sample = Facility.objects.order_by('id').first()
+        if sample is None:
+            raise CommandError('Load some facilities first; plans depend on table contents')
+
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--analyze is only supported on PostgreSQL')
+            explain_options = {'analyze': True, 'buffers': True}
+
+        lat, lng = float(sample.latitude), float(sample.longitude)
+        partial_city = sample.city_key[: max(3, len(sample.city_key) // 2)]
+        accepted = sorted(item_index.facilities_accepting(['laptop']))[:100]
+        shapes = [
+            ('City, known names', Facility.objects.in_city(sample.city)),
+            ('City, substring', Facility.objects.filter(city_key__contains=partial_city)),
+            ('Pincode prefix', Facility.objects.with_pincode_prefix(sample.pincode_key[:3])),
+            ('Bounding box', Facility.objects.filter(
+                latitude__range=(lat - 0.5, lat + 0.5), longitude__range=(lng - 0.5, lng + 0.5),
+            )),
+            ('Accepted items (id list)', Facility.objects.filter(id__in=accepted)),
+            ('Keyset page', Facility.objects.filter(
+                Q(city__gt=sample.city) | Q(city=sample.city, name__gt=sample.name)
+                | Q(city=sample.city, name=sample.name, id__gt=sample.id)
+            ).order_by('city', 'name', 'id')[:100]),
+        ]
+
+        self.stdout.write(f'Database: {connection.vendor}, {Facility.objects.count()} facilities')
+        for title, queryset in shapes:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{title}'))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.importer import IMPORT_FORMATS, detect_format, import_facilities, read_records, refresh_facility_data
+
+# Invalid records echoed individually before only being counted
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    """
+    Load facilities from a CSV, JSON, JSON Lines or GeoJSON file
+    Existing facilities with the same name and pincode are updated
+    """
+    help = 'Bulk import facilities, upserting on (name, pincode)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='File format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the file')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            fmt = options['format'] or detect_format(path)
+        except ValueError as e:
+            raise CommandError(str(e))
+        errors = []
+
+        def report(position, message):
+            errors.append(position)
+            if len(errors) <= MAX_REPORTED_ERRORS:
+                self.stderr.write(f'Record {position}: {message}')
+
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as fh:
+                counts = import_facilities(
+                    read_records(fh, fmt),
+                    batch_size=options['batch_size'],
+                    dry_run=options['dry_run'],
+                    on_error=report,
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {path}: {e}')
+
+        if len(errors) > MAX_REPORTED_ERRORS:
+            self.stderr.write(f'... and {len(errors) - MAX_REPORTED_ERRORS} more invalid records')
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Dry run: {counts['valid']} valid, {counts['invalid']} invalid records"))
+            return
+        if counts['created'] or counts['updated']:
+            refresh_facility_data()
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['created']} facilities created, {counts['updated']} updated, "
+            f"{counts['invalid']} invalid records skipped"
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from core.valuation import METALS, metal_prices, recompute_device_values
+
+
+class Command(BaseCommand):
+    """
+    Refresh Device.estimated_value from metal content and current prices
+    Prices come from settings.METAL_PRICES unless overridden here
+    """
+    help = 'Recompute device values from metal content in one bulk pass'
+
+    def add_arguments(self, parser):
+        for metal in METALS:
+            parser.add_argument(f'--{metal}', type=float, help=f'{metal.title()} price in INR per gram')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many values would change')
+
+    def handle(self, *args, **options):
+        prices = metal_prices({metal: options[metal] for metal in METALS})
+        changed = recompute_device_values(prices, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        summary = ', '.join(f'{metal} ₹{prices[metal]}/g' for metal in METALS)
+        verb = 'would change' if options['dry_run'] else 'updated'
+        self.stdout.write(self.style.SUCCESS(f'{changed} device values {verb} ({summary})'))
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections
+from core import leaderboard
+from core.ledger import compact_events
+
+
+class Command(BaseCommand):
+    """
+    Recompute the materialized dashboard leaderboards
+    Run once (e.g. from cron) or as a worker with --interval, which keeps
+    every window a few seconds fresh so dashboard reads never compute one.
+    With --compact each round first rolls the RecycleEvent ledger into
+    profile totals, so the events get_totals() adds up stay few; the
+    Procfile and render.yaml run it as `--interval 10 --compact`
+    """
+    help = 'Refresh the precomputed leaderboard windows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window', choices=leaderboard.WINDOWS, action='append', dest='windows',
+            help='Window to refresh (repeatable, default: all windows)',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep refreshing every INTERVAL seconds until interrupted',
+        )
+        parser.add_argument(
+            '--compact', action='store_true',
+            help='Compact the recycling ledger into profile totals before each refresh',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval < 0:
+            raise CommandError('--interval must not be negative')
+
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    if options['compact']:
+                        compacted = compact_events()
+                        if compacted:
+                            self.stdout.write(f'Compacted {compacted} recycle events')
+                    written = leaderboard.refresh(options['windows'])
+                except DatabaseError as e:
+                    if not interval:
+                        raise CommandError(f'Could not refresh the leaderboard: {e}')
+                    self.stderr.write(f'Could not refresh the leaderboard: {e}')
+                else:
+                    summary = ', '.join(f'{window}: {count}' for window, count in written.items())
+                    self.stdout.write(self.style.SUCCESS(f'Refreshed leaderboard (rows written {summary})'))
+                if not interval:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Facility
+from core import tiles
+
+
+class Command(BaseCommand):
+    """
+    Pre-render facility map tiles into the on-disk tile cache
+    Only tiles that contain at least one facility are rendered
+    """
+    help = 'Pre-render facility map tiles for a range of zoom levels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-zoom', type=int, default=0)
+        parser.add_argument('--max-zoom', type=int, default=12)
+        parser.add_argument(
+            '--format', choices=sorted(tiles.TILE_FORMATS), action='append', dest='formats',
+            help='Tile format to render (repeatable, default: all formats)',
+        )
+
+    def handle(self, *args, **options):
+        min_zoom, max_zoom = options['min_zoom'], options['max_zoom']
+        if not 0 <= min_zoom <= max_zoom <= tiles.MAX_TILE_ZOOM:
+            raise CommandError(f'Zoom levels must satisfy 0 <= min <= max <= {tiles.MAX_TILE_ZOOM}')
+        formats = options['formats'] or list(tiles.TILE_FORMATS)
+
+        points = list(Facility.objects.values_list('latitude', 'longitude'))
+        rendered = 0
+        for z in range(min_zoom, max_zoom + 1):
+            occupied = {tiles.tile_for(lat, lng, z) for lat, lng in points}
+            for x, y in sorted(occupied):
+                for fmt in formats:
+                    tiles.get_tile(z, x, y, fmt)
+                    rendered += 1
+            self.stdout.write(f'Zoom {z}: {len(occupied)} tiles')
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} tiles into {tiles.cache_dir()}'))
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['city', 'name', 'id'], name='facility_city_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['latitude', 'longitude'], name='facility_lat_lng_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_facility_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecycleEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.IntegerField(help_text='Points earned for this device')),
+                ('co2_saved', models.DecimalField(decimal_places=2, help_text='CO2 saved in kg', max_digits=10)),
+                ('compacted', models.BooleanField(default=False, help_text="Already rolled into the user's profile totals")),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recycle_events', to='core.device')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recycle_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['compacted', 'user'], name='recycleevent_pending_idx')],
+            },
+        ),
+    ]
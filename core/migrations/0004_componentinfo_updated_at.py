@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_recycleevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='componentinfo',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
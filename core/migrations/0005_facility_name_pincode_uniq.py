@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:34
+
+from django.db import migrations, models
+from django.db.models import Count
+
+MERGED_FIELDS = ('address', 'city', 'latitude', 'longitude', 'contact', 'accepted_items')
+
+
+def merge_duplicate_facilities(apps, schema_editor):
+    # Keep the most recently updated row of each (name, pincode) pair, as
+    # the importer's upserts would, fill its blank fields from the other
+    # rows and delete them. Nothing references Facility rows
+    Facility = apps.get_model('core', 'Facility')
+    duplicates = (
+        Facility.objects.values('name', 'pincode')
+        .annotate(rows=Count('id')).filter(rows__gt=1)
+    )
+    for pair in duplicates.iterator():
+        rows = list(
+            Facility.objects.filter(name=pair['name'], pincode=pair['pincode'])
+            .order_by('-updated_at', '-id')
+        )
+        keep, others = rows[0], rows[1:]
+        changed = []
+        for field in MERGED_FIELDS:
+            if getattr(keep, field) in (None, ''):
+                value = next((getattr(row, field) for row in others if getattr(row, field) not in (None, '')), None)
+                if value is not None:
+                    setattr(keep, field, value)
+                    changed.append(field)
+        if changed:
+            # update() keeps updated_at as it was
+            Facility.objects.filter(pk=keep.pk).update(**{field: getattr(keep, field) for field in changed})
+        Facility.objects.filter(pk__in=[row.pk for row in others]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_componentinfo_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_facilities, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='facility',
+            constraint=models.UniqueConstraint(fields=('name', 'pincode'), name='facility_name_pincode_uniq'),
+        ),
+    ]
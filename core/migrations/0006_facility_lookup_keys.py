@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+def fill_lookup_keys(apps, schema_editor):
+    Facility = apps.get_model('core', 'Facility')
+    facilities = list(Facility.objects.only('id', 'city', 'pincode'))
+    for facility in facilities:
+        facility.city_key = ' '.join(facility.city.split()).lower()
+        facility.pincode_key = ''.join(facility.pincode.split())
+    Facility.objects.bulk_update(facilities, ['city_key', 'pincode_key'], batch_size=1000)
+
+
+def create_trigram_index(apps, schema_editor):
+    # Substring city searches can use a trigram index on PostgreSQL only;
+    # other databases fall back to the B-tree indexes for exact/prefix lookups
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS facility_city_key_trgm_idx '
+        'ON core_facility USING gin (city_key gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS facility_city_key_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_facility_name_pincode_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facility',
+            name='city_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='facility',
+            name='pincode_key',
+            field=models.CharField(default='', editable=False, max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['city_key'], name='facility_city_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facility',
+            index=models.Index(fields=['pincode_key'], name='facility_pincode_key_idx'),
+        ),
+        migrations.RunPython(fill_lookup_keys, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,75 @@
+# Full-text search structures for core.search
+
+from django.db import migrations
+
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(city, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(accepted_items, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(address, '')), 'C')"
+)
+
+SQLITE_COLUMNS = 'name, address, city, accepted_items'
+
+# External-content FTS5 table plus the triggers that keep it in step
+# with core_facility (https://sqlite.org/fts5.html#external_content_tables)
+SQLITE_SETUP = [
+    f"CREATE VIRTUAL TABLE core_facility_fts USING fts5({SQLITE_COLUMNS}, "
+    f"content='core_facility', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER core_facility_fts_insert AFTER INSERT ON core_facility BEGIN "
+    f"INSERT INTO core_facility_fts(rowid, {SQLITE_COLUMNS}) "
+    f"VALUES (new.id, new.name, new.address, new.city, new.accepted_items); END",
+    f"CREATE TRIGGER core_facility_fts_delete AFTER DELETE ON core_facility BEGIN "
+    f"INSERT INTO core_facility_fts(core_facility_fts, rowid, {SQLITE_COLUMNS}) "
+    f"VALUES ('delete', old.id, old.name, old.address, old.city, old.accepted_items); END",
+    f"CREATE TRIGGER core_facility_fts_update AFTER UPDATE ON core_facility BEGIN "
+    f"INSERT INTO core_facility_fts(core_facility_fts, rowid, {SQLITE_COLUMNS}) "
+    f"VALUES ('delete', old.id, old.name, old.address, old.city, old.accepted_items); "
+    f"INSERT INTO core_facility_fts(rowid, {SQLITE_COLUMNS}) "
+    f"VALUES (new.id, new.name, new.address, new.city, new.accepted_items); END",
+    "INSERT INTO core_facility_fts(core_facility_fts) VALUES ('rebuild')",
+]
+
+SQLITE_TEARDOWN = [
+    'DROP TRIGGER IF EXISTS core_facility_fts_insert',
+    'DROP TRIGGER IF EXISTS core_facility_fts_delete',
+    'DROP TRIGGER IF EXISTS core_facility_fts_update',
+    'DROP TABLE IF EXISTS core_facility_fts',
+]
+
+
+def sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS facility_search_idx ON core_facility USING gin (({POSTGRES_VECTOR}))'
+        )
+    elif connection.vendor == 'sqlite' and sqlite_has_fts5(connection):
+        for statement in SQLITE_SETUP:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS facility_search_idx')
+    elif connection.vendor == 'sqlite':
+        for statement in SQLITE_TEARDOWN:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_facility_lookup_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_facility_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('all', 'All Time'), ('month', 'This Month'), ('week', 'This Week')], max_length=10)),
+                ('position', models.PositiveIntegerField()),
+                ('username', models.CharField(max_length=150)),
+                ('points', models.IntegerField()),
+                ('total_recycled', models.IntegerField()),
+                ('co2_saved', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Leaderboard Entries',
+                'ordering': ['window', 'position'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['-points'], name='userprofile_points_idx'),
+        ),
+        migrations.AddField(
+            model_name='leaderboardentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardentry',
+            constraint=models.UniqueConstraint(fields=('window', 'position'), name='leaderboard_window_position_uniq'),
+        ),
+    ]
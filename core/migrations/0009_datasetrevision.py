@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+DATASETS = ('facilities', 'components', 'devices')
+
+
+def create_revisions(apps, schema_editor):
+    DatasetRevision = apps.get_model('core', 'DatasetRevision')
+    DatasetRevision.objects.bulk_create([DatasetRevision(name=name) for name in DATASETS], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetRevision',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('revision', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_revisions, migrations.RunPython.noop),
+    ]
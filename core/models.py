@@ -3,6 +3,43 @@ from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+def normalize_city(value):
+    """Lowercase city name with whitespace collapsed, as stored in city_key"""
+    return ' '.join(str(value or '').split()).lower()
+
+
+def normalize_pincode(value):
+    """PIN code with all whitespace removed, as stored in pincode_key"""
+    return ''.join(str(value or '').split())
+
+
+class FacilityQuerySet(models.QuerySet):
+    """Index-friendly city and pincode filters"""
+
+    def in_city(self, term):
+        """
+        Facilities whose city contains `term`, so "Delhi" also finds
+        "New Delhi". When few known cities match, this is an IN lookup on
+        the indexed city_key, otherwise a substring match on it
+        (trigram-indexed on PostgreSQL)
+        """
+        from .query_cache import MAX_FILTER_SCOPES, known_cities
+
+        key = normalize_city(term)
+        matching = [city for city in known_cities() if key in city]
+        if 0 < len(matching) <= MAX_FILTER_SCOPES:
+            return self.filter(city_key__in=matching)
+        return self.filter(city_key__contains=key)
+
+    def with_pincode_prefix(self, term):
+        """PIN codes starting with `term`, as a B-tree range scan"""
+        prefix = normalize_pincode(term)
+        if not prefix:
+            return self
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return self.filter(pincode_key__gte=prefix, pincode_key__lt=upper)
+
+
 # Model for E-Waste Recycling Facilities
 class Facility(models.Model):
     """
@@ -17,16 +54,55 @@ class Facility(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
     contact = models.CharField(max_length=15)
     accepted_items = models.TextField(help_text="Comma-separated list of accepted e-waste items")
+    # Normalized copies of city and pincode for indexed lookups, kept in
+    # step by the pre_save receiver in core.signals
+    city_key = models.CharField(max_length=100, editable=False, default='')
+    pincode_key = models.CharField(max_length=10, editable=False, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = FacilityQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Facilities"
         ordering = ['city', 'name']
+        indexes = [
+            # Keyset pagination order used by the facilities API
+            models.Index(fields=['city', 'name', 'id'], name='facility_city_name_id_idx'),
+            # Bounding-box filters for map viewports
+            models.Index(fields=['latitude', 'longitude'], name='facility_lat_lng_idx'),
+            # Exact city and pincode prefix filters of the locator
+            models.Index(fields=['city_key'], name='facility_city_key_idx'),
+            models.Index(fields=['pincode_key'], name='facility_pincode_key_idx'),
+        ]
+        constraints = [
+            # Natural key used to upsert facilities on import
+            models.UniqueConstraint(fields=['name', 'pincode'], name='facility_name_pincode_uniq'),
+        ]
+
+    # Fields whose previous values the save signals in core.signals use to
+    # expire the tiles and cached queries that showed the facility
+    LOCATION_FIELDS = ('latitude', 'longitude', 'city', 'pincode')
+    _stored_location = None
 
     def __str__(self):
         return f"{self.name} - {self.city}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_location()
+        return instance
+
+    def remember_location(self):
+        """Record the current location as the one stored in the database"""
+        loaded = self.__dict__
+        if all(name in loaded for name in self.LOCATION_FIELDS):
+            self._stored_location = tuple(loaded[name] for name in self.LOCATION_FIELDS)
+        else:
+            # Deferred fields; the save signals read the row back instead
+            self._stored_location = None
+
 
 # Model for Harmful Component Information
 class ComponentInfo(models.Model):
@@ -40,6 +116,7 @@ class ComponentInfo(models.Model):
     environmental_effect = models.TextField(help_text="Impact on environment")
     icon = models.CharField(max_length=50, default="⚠️", help_text="Emoji or icon representation")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = "Component Information"
@@ -108,25 +185,60 @@ class UserProfile(models.Model):
     def add_recycled_device(self, device):
         """
         Add a recycled device to user's profile
-        Updates points, count, and CO2 savings
+        Appends a RecycleEvent instead of rewriting the profile row; the
+        points, count and CO2 savings are rolled into this profile by
+        the compact_recycle_events command and read through
+        get_totals() until then. In buffered accrual mode the event is
+        queued in memory and written by the next batched flush.
         """
-        from decimal import Decimal
-        
+        from .accrual import accrual_buffer, is_buffered
+        from .ranking import rank_service
+
         points_earned = device.get_point_value()
-        self.points += points_earned
-        self.total_recycled += 1
-        # Formula: 1 point = 0.05 kg CO2 saved
-        # Convert to Decimal to match field type
-        self.co2_saved += Decimal(str(points_earned * 0.05))
-        self.save()
-
-    def get_rank(self):
+        co2_saved = RecycleEvent.co2_for_points(points_earned)
+        event = None
+        # A full buffer refuses the event, which is then written directly
+        if not (is_buffered() and accrual_buffer.add(self.user_id, device.pk, points_earned, co2_saved)):
+            event = RecycleEvent.objects.create(
+                user_id=self.user_id,
+                device=device,
+                points=points_earned,
+                co2_saved=co2_saved,
+            )
+        rank_service.add_points(self.pk, points_earned)
+        return event
+
+    def get_totals(self):
+        """
+        Points, devices recycled and CO2 saved including ledger events
+        that have not been compacted into this profile yet and any
+        still waiting in the accrual buffer
+        """
+        from .accrual import accrual_buffer
+
+        pending = RecycleEvent.objects.filter(user_id=self.user_id, compacted=False).aggregate(
+            points=models.Sum('points'),
+            total_recycled=models.Count('id'),
+            co2_saved=models.Sum('co2_saved'),
+        )
+        buffered_points, buffered_count, buffered_co2 = accrual_buffer.pending(self.user_id)
+        return {
+            'points': self.points + (pending['points'] or 0) + buffered_points,
+            'total_recycled': self.total_recycled + pending['total_recycled'] + buffered_count,
+            'co2_saved': self.co2_saved + (pending['co2_saved'] or 0) + buffered_co2,
+        }
+
+    def get_rank(self, points=None):
         """Get user's rank based on points (1 = highest)"""
-        higher_ranked = UserProfile.objects.filter(points__gt=self.points).count()
-        return higher_ranked + 1
+        from .ranking import rank_service
+
+        return rank_service.rank(self.points if points is None else points)
 
     class Meta:
         ordering = ['-points']
+        indexes = [
+            models.Index(fields=['-points'], name='userprofile_points_idx'),
+        ]
 
 
 # Signal to automatically create UserProfile when User is created
@@ -137,8 +249,81 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Save the UserProfile when User is saved"""
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
+# Ledger of recycling activity
+class RecycleEvent(models.Model):
+    """
+    Append-only record of one recycled device
+    Events are inserted without touching the UserProfile row and are
+    periodically compacted into the profile totals
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recycle_events')
+    device = models.ForeignKey(Device, on_delete=models.SET_NULL, null=True, blank=True, related_name='recycle_events')
+    points = models.IntegerField(help_text="Points earned for this device")
+    co2_saved = models.DecimalField(max_digits=10, decimal_places=2, help_text="CO2 saved in kg")
+    compacted = models.BooleanField(default=False, help_text="Already rolled into the user's profile totals")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['compacted', 'user'], name='recycleevent_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} recycled {self.device or 'a deleted device'}"
+
+    @staticmethod
+    def co2_for_points(points):
+        """Formula: 1 point = 0.05 kg CO2 saved"""
+        from decimal import Decimal
+
+        # Decimal arithmetic to match the field type exactly
+        return Decimal(points) * Decimal('0.05')
+
+
+# Materialized leaderboard
+class LeaderboardEntry(models.Model):
+    """
+    One position of a precomputed leaderboard window
+    Rows are rewritten by core.leaderboard.refresh() only when that
+    position changed, and computed_at is stamped on every refresh
+    """
+    WINDOW_CHOICES = [
+        ('all', 'All Time'),
+        ('month', 'This Month'),
+        ('week', 'This Week'),
+    ]
+
+    window = models.CharField(max_length=10, choices=WINDOW_CHOICES)
+    position = models.PositiveIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    username = models.CharField(max_length=150)
+    points = models.IntegerField()
+    total_recycled = models.IntegerField()
+    co2_saved = models.DecimalField(max_digits=10, decimal_places=2)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['window', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['window', 'position'], name='leaderboard_window_position_uniq'),
+        ]
+        verbose_name_plural = "Leaderboard Entries"
+
+    def __str__(self):
+        return f"#{self.position} {self.username} ({self.get_window_display()})"
+
+
+# Shared change counters
+class DatasetRevision(models.Model):
+    """
+    Revision of one dataset (facilities, components, devices), advanced
+    by core.revisions on every write so each process can tell when its
+    in-memory copies were built from older rows
+    """
+    name = models.CharField(max_length=20, primary_key=True)
+    revision = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} r{self.revision}"
@@ -0,0 +1,129 @@
+"""
+Offline PIN code -> centroid lookup
+Centroids are compiled from PINCODE_CENTROIDS_CSV into a direct-address
+binary file: one pair of little-endian int32 microdegrees per possible
+six-digit PIN code. The file is memory-mapped, so a lookup is a single
+array read and only the pages touched are ever loaded
+The file is built at deploy time by `manage.py build_pincode_index`,
+never during a request
+"""
+import csv
+import logging
+import os
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FIRST_PINCODE = 100000
+LAST_PINCODE = 999999
+SLOTS = LAST_PINCODE - FIRST_PINCODE + 1
+MICRODEGREES = 1_000_000
+# Marks PIN codes without a known centroid
+MISSING = np.iinfo(np.int32).min
+
+
+def slot_for(pincode):
+    """Array slot of a PIN code, or None when it is not six digits"""
+    pincode = str(pincode or '').strip()
+    if len(pincode) != 6 or not pincode.isdigit() or pincode[0] == '0':
+        return None
+    return int(pincode) - FIRST_PINCODE
+
+
+def read_centroids_csv(path):
+    """Yield (pincode, lat, lng) rows from a pincode,latitude,longitude CSV"""
+    with open(path, encoding='utf-8-sig', newline='') as fh:
+        for row in csv.DictReader(fh):
+            yield row['pincode'].strip(), float(row['latitude']), float(row['longitude'])
+
+
+def build_index(rows, path):
+    """
+    Write the binary lookup file for (pincode, lat, lng) rows
+    Returns how many PIN codes were stored
+    """
+    table = np.full((SLOTS, 2), MISSING, dtype='<i4')
+    stored = 0
+    for pincode, lat, lng in rows:
+        slot = slot_for(pincode)
+        if slot is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            continue
+        table[slot] = (round(lat * MICRODEGREES), round(lng * MICRODEGREES))
+        stored += 1
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Write to a temporary file first so readers never map a partial file
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(table.tobytes())
+    os.replace(tmp, path)
+    return stored
+
+
+class PincodeCentroids:
+    """
+    Memory-mapped centroid table, opened lazily
+    A file replaced by build_pincode_index is mapped again on next use,
+    and version() changes with it. Every lookup misses while the file
+    has not been built or PINCODE_CENTROID_FALLBACK is off
+    """
+
+    def __init__(self):
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._loaded = None
+
+    def _open(self):
+        path = settings.PINCODE_CENTROIDS_PATH
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            logger.warning("No PIN code centroids at %s; run build_pincode_index", path)
+            return None, None
+        return mtime, np.memmap(path, dtype='<i4', mode='r', shape=(SLOTS, 2))
+
+    def _current(self):
+        loaded = self._loaded
+        if loaded is not None:
+            try:
+                replaced = os.stat(settings.PINCODE_CENTROIDS_PATH).st_mtime_ns != loaded[0]
+            except FileNotFoundError:
+                replaced = loaded[0] is not None
+            if not replaced:
+                return loaded
+        with self._lock:
+            if self._loaded is loaded:
+                self._loaded = self._open()
+            return self._loaded
+
+    def table(self):
+        """The mapped (SLOTS, 2) array, or None when the file is absent"""
+        return self._current()[1]
+
+    def version(self):
+        """Modification time of the mapped file, for cache keys"""
+        return self._current()[0]
+
+    def lookup(self, pincode):
+        """(lat, lng) centroid of a PIN code, or None if unknown"""
+        if not settings.PINCODE_CENTROID_FALLBACK:
+            return None
+        slot = slot_for(pincode)
+        if slot is None:
+            return None
+        table = self.table()
+        if table is None:
+            return None
+        lat, lng = table[slot]
+        if lat == MISSING:
+            return None
+        return int(lat) / MICRODEGREES, int(lng) / MICRODEGREES
+
+
+pincode_centroids = PincodeCentroids()
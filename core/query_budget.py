@@ -0,0 +1,89 @@
+"""
+Per-view database query budgets
+Views declare the most queries one request may run with @query_budget(n);
+QueryBudgetMiddleware counts every query of a request, including the
+session and user lookups, and logs when a view goes over its budget.
+With QUERY_BUDGET_STRICT it raises instead, so a test suite run under
+
+    @override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_STRICT=True)
+
+fails on the first view that regresses into extra (e.g. N+1) queries.
+Budgets hold on a cold worker, with empty caches and no in-memory index
+loaded yet. Warm requests run fewer.
+
+assert_query_budget applies the same check to any block of code, e.g. in
+tests
+"""
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the query budget of a view"""
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+class QueryCounter:
+    """connection.execute_wrapper hook counting executed statements"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def assert_query_budget(max_queries, label='Block'):
+    """
+    Count the queries run inside the block and raise QueryBudgetExceeded
+    when there were more than max_queries; yields the QueryCounter
+    """
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+    if counter.count > max_queries:
+        raise QueryBudgetExceeded(f'{label} ran {counter.count} queries, budget is {max_queries}')
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the queries of each request, report them in an X-Query-Count
+    header and enforce the view's declared budget
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED:
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        response['X-Query-Count'] = str(counter.count)
+
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and counter.count > budget:
+            message = f'{request.method} {request.path} ran {counter.count} queries, budget is {budget}'
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
@@ -0,0 +1,280 @@
+"""
+Read-through cache for facility and device queries
+Entries are keyed by the normalized query parameters plus the version
+counters of the data they read. The signals in core.signals bump the
+counters of the city and pincode an edited facility belongs to, so one
+edit only invalidates the queries that could have returned it
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Returned by stores on a miss, since None is a valid cached value
+MISSING = object()
+# Filters matching more cities/pincodes than this use the global counter
+MAX_FILTER_SCOPES = 64
+
+
+class LRUStore:
+    """
+    Bounded in-process store evicting the least recently used entry
+    Entries also expire `timeout` seconds after being stored, which bounds
+    how long a worker can serve results of writes made by another worker
+    """
+
+    def __init__(self, max_entries=1024, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheStore:
+    """
+    Entries kept in one of settings.CACHES and shared by every worker
+    Eviction is left to the backend (MAX_ENTRIES culling or timeouts)
+    """
+
+    def __init__(self, alias='default', timeout=3600):
+        self.alias = alias
+        self.timeout = timeout
+
+    def __len__(self):
+        # Not tracked by Django cache backends
+        return 0
+
+    def get(self, key):
+        return caches[self.alias].get(key, MISSING)
+
+    def set(self, key, value):
+        caches[self.alias].set(key, value, self.timeout)
+
+    def clear(self):
+        # Stale entries become unreachable once the counters move
+        pass
+
+
+def build_store():
+    """Create the entry store configured by settings.QUERY_CACHE"""
+    config = settings.QUERY_CACHE
+    if config['BACKEND'] == 'django':
+        return DjangoCacheStore(config.get('ALIAS', 'default'), config['TIMEOUT'])
+    if config['BACKEND'] == 'lru':
+        return LRUStore(config['MAX_ENTRIES'], config['TIMEOUT'])
+    raise ValueError(f"Unknown QUERY_CACHE backend {config['BACKEND']!r}")
+
+
+class VersionCounters:
+    """
+    Named counters held in the default Django cache
+    A bump is only seen by other workers when that cache is shared
+    (CACHE_BACKEND=file); with the default per-process LocMemCache it
+    reaches the writing worker alone, and the others keep serving their
+    entries until QUERY_CACHE['TIMEOUT'] expires them
+    A missing counter restarts from the current time, so a key evicted
+    from the cache never brings back an old version
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def _key(self, name):
+        # Names hold arbitrary city text, so hash them into safe keys
+        return f'{self.prefix}:{hashlib.md5(name.encode()).hexdigest()}'
+
+    def get_many(self, names):
+        cache = caches['default']
+        keys = {name: self._key(name) for name in names}
+        found = cache.get_many(keys.values())
+        versions = {}
+        for name, key in keys.items():
+            if key not in found:
+                cache.add(key, time.time_ns(), None)
+                found[key] = cache.get(key)
+            versions[name] = found[key]
+        return versions
+
+    def bump(self, names):
+        cache = caches['default']
+        for name in set(names):
+            try:
+                cache.incr(self._key(name))
+            except ValueError:
+                cache.set(self._key(name), time.time_ns(), None)
+
+
+versions = VersionCounters('core:query-version')
+
+
+class QueryCache:
+    """
+    Read-through cache of computed query results with hit/miss counters
+    Cached values are shared between requests and must not be mutated
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._store = None
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = build_store()
+        return self._store
+
+    def make_key(self, params, scopes):
+        """Cache key for normalized params under the current scope versions"""
+        payload = json.dumps([params, sorted(versions.get_many(scopes).items())], default=str)
+        return f'core:query:{self.namespace}:{hashlib.sha1(payload.encode()).hexdigest()}'
+
+    def get_or_set(self, params, scopes, compute):
+        """
+        Return the cached result for `params`, calling `compute()` and
+        storing its result on a miss
+        """
+        key = self.make_key(params, scopes)
+        value = self.store.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute()
+        self.store.set(key, value)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'entries': len(self.store),
+        }
+
+    def clear(self):
+        self.store.clear()
+        self.hits = self.misses = 0
+
+
+class FacilityVocabulary:
+    """
+    Distinct lowercase cities and pincodes of all facilities, used to
+    find the counters a substring filter depends on
+    Reloaded whenever the 'facility:vocabulary' counter moves
+    """
+
+    def __init__(self):
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def current(self, version):
+        loaded = self._loaded
+        if loaded is None or loaded[0] != version:
+            from .models import Facility, normalize_city, normalize_pincode
+
+            with self._lock:
+                rows = list(Facility.objects.values_list('city', 'pincode').distinct())
+                cities = frozenset(normalize_city(city) for city, _ in rows)
+                pincodes = frozenset(normalize_pincode(pincode) for _, pincode in rows)
+                loaded = self._loaded = (version, cities, pincodes)
+        return loaded[1], loaded[2]
+
+
+facility_vocabulary = FacilityVocabulary()
+
+
+def known_cities():
+    """Normalized names of every city that has a facility"""
+    version = versions.get_many(['facility:vocabulary'])['facility:vocabulary']
+    return facility_vocabulary.current(version)[0]
+
+
+def facility_scopes(city=None, pincode=None):
+    """
+    Counters read by a facility query filtered by city/pincode substrings
+    Unfiltered queries, and filters matching very many values, depend
+    on 'facility:all', which every facility write bumps
+    """
+    scopes = ['facility:vocabulary']
+    from .models import normalize_city, normalize_pincode
+
+    if city or pincode:
+        vocabulary_version = versions.get_many(scopes)['facility:vocabulary']
+        cities, pincodes = facility_vocabulary.current(vocabulary_version)
+        candidates = []
+        if city:
+            needle = normalize_city(city)
+            candidates.append([f'facility:city:{c}' for c in cities if needle in c])
+        if pincode:
+            needle = normalize_pincode(pincode)
+            candidates.append([f'facility:pincode:{p}' for p in pincodes if needle in p])
+        # Rows must pass every filter, so the narrowest one is enough
+        narrowest = min(candidates, key=len)
+        if len(narrowest) <= MAX_FILTER_SCOPES:
+            return scopes + narrowest
+    return scopes + ['facility:all']
+
+
+def facility_changed(*locations, vocabulary=False):
+    """
+    Bump the counters of every (city, pincode) pair a facility write
+    touched; pass vocabulary=True when the set of cities or pincodes
+    may have changed
+    """
+    from .models import normalize_city, normalize_pincode
+
+    names = ['facility:all']
+    for city, pincode in locations:
+        names += [f'facility:city:{normalize_city(city)}', f'facility:pincode:{normalize_pincode(pincode)}']
+    if vocabulary:
+        names.append('facility:vocabulary')
+    versions.bump(names)
+
+
+def invalidate_facilities():
+    """Drop every cached facility query, e.g. after bulk writes"""
+    versions.bump(['facility:all', 'facility:vocabulary'])
+
+
+def invalidate_devices():
+    versions.bump(['device:all'])
+
+
+facility_queries = QueryCache('facilities')
+device_queries = QueryCache('devices')
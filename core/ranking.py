@@ -0,0 +1,221 @@
+"""
+Leaderboard rank service backed by a Fenwick tree over point buckets
+rank(points) is an O(log n) prefix sum instead of a COUNT(*) query, and
+profile point changes are applied incrementally
+"""
+import bisect
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+
+logger = logging.getLogger(__name__)
+
+
+class FenwickTree:
+    """Binary indexed tree of counts over the values 0..size-1"""
+
+    def __init__(self, size):
+        self.size = size
+        self._tree = [0] * (size + 1)
+
+    def add(self, value, delta):
+        i = value + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, value):
+        """Total count of values <= value"""
+        i = min(value + 1, self.size)
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+class RankService:
+    """
+    Point totals of every profile, for 1-based ranks where
+    rank = 1 + number of profiles with strictly more points
+    Totals are grouped into at most `num_buckets` buckets of 2**shift
+    points each: the Fenwick tree counts profiles per bucket and every
+    bucket keeps its totals sorted, so memory and rebuild time depend on
+    the number of profiles rather than the highest score. The buckets
+    are widened (and the index rebuilt) when a total outgrows them.
+    Point totals include ledger events not yet compacted or still in the
+    accrual buffer, and negative balances are counted as zero points
+    """
+
+    def __init__(self, num_buckets=1024):
+        self.num_buckets = num_buckets
+        self.loaded_at = None
+        self._tree = None
+        self._shift = 0
+        self._buckets = {}
+        self._points_by_profile = {}
+        self._stored_by_profile = {}
+        self._lock = threading.RLock()
+        self._reloader = None
+
+    def _key(self, points):
+        return max(int(points), 0)
+
+    def _build_index(self):
+        """Rebuild the buckets and tree from _points_by_profile"""
+        largest = max(self._points_by_profile.values(), default=0)
+        shift = 0
+        while largest >> shift >= self.num_buckets:
+            shift += 1
+        buckets = {}
+        for points in self._points_by_profile.values():
+            buckets.setdefault(points >> shift, []).append(points)
+        tree = FenwickTree(self.num_buckets)
+        for bucket, values in buckets.items():
+            values.sort()
+            tree.add(bucket, len(values))
+        self._shift, self._buckets, self._tree = shift, buckets, tree
+
+    def _insert(self, points):
+        bucket = points >> self._shift
+        if bucket >= self.num_buckets:
+            # Already in _points_by_profile, so the rebuild includes it
+            self._build_index()
+            return
+        bisect.insort(self._buckets.setdefault(bucket, []), points)
+        self._tree.add(bucket, 1)
+
+    def _discard(self, points):
+        bucket = points >> self._shift
+        values = self._buckets[bucket]
+        del values[bisect.bisect_left(values, points)]
+        if not values:
+            del self._buckets[bucket]
+        self._tree.add(bucket, -1)
+
+    def _count_at_most(self, points):
+        """Number of tracked profiles with at most `points` points"""
+        bucket = points >> self._shift
+        if bucket >= self.num_buckets:
+            return len(self._points_by_profile)
+        below = self._tree.prefix_sum(bucket - 1) if bucket else 0
+        return below + bisect.bisect_right(self._buckets.get(bucket, ()), points)
+
+    def rebuild(self):
+        """Reload every profile's points from the database"""
+        from .accrual import accrual_buffer
+        from .ledger import with_pending_events
+        from .models import UserProfile
+
+        # Stored points and uncompacted events of every profile in one query
+        profiles = (
+            with_pending_events(UserProfile.objects.order_by())
+            .values_list('id', 'user_id', 'points').annotate(pending=Sum('pending_events__points'))
+        )
+        with self._lock:
+            profiles = list(profiles)
+            buffered = accrual_buffer.pending_points()
+            self._points_by_profile = {}
+            self._stored_by_profile = {}
+            for pk, user_id, points, pending in profiles:
+                self._points_by_profile[pk] = self._key(points + (pending or 0) + buffered.get(user_id, 0))
+                self._stored_by_profile[pk] = points
+            self._build_index()
+            self.loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        """
+        Load on first use. Once older than RANK_SERVICE_MAX_AGE seconds,
+        which picks up changes made by other processes, the ranks are
+        reloaded by a background thread while requests keep using the
+        current ones, so only a worker's first rank lookup queries
+        """
+        if self.loaded_at is None:
+            with self._lock:
+                if self.loaded_at is None:
+                    self.rebuild()
+            return
+        max_age = getattr(settings, 'RANK_SERVICE_MAX_AGE', 60)
+        if time.monotonic() - self.loaded_at >= max_age:
+            self._start_reload()
+
+    def _start_reload(self):
+        with self._lock:
+            if self._reloader is not None and self._reloader.is_alive():
+                return
+            self._reloader = threading.Thread(target=self._reload, name='rank-reload', daemon=True)
+            self._reloader.start()
+
+    def _reload(self):
+        try:
+            self.rebuild()
+        except DatabaseError:
+            logger.exception("Could not reload leaderboard ranks")
+            # Keep serving the current ranks and retry after another max age
+            self.loaded_at = time.monotonic()
+        finally:
+            # The thread's own connection is never reused
+            connection.close()
+
+    def update(self, profile_id, points):
+        """Record a profile's new point total"""
+        if self.loaded_at is None:
+            return
+        points = self._key(points)
+        with self._lock:
+            old = self._points_by_profile.get(profile_id)
+            if old == points:
+                return
+            if old is not None:
+                self._discard(old)
+            self._points_by_profile[profile_id] = points
+            self._insert(points)
+
+    def stored_points_changed(self, profile_id, stored_points):
+        """
+        Whether a saved profile's compacted points differ from the value
+        last seen for it, i.e. whether its total has to be recomputed
+        """
+        return self.loaded_at is not None and self._stored_by_profile.get(profile_id) != stored_points
+
+    def update_stored(self, profile_id, stored_points, points):
+        """Record a profile's compacted points together with its new total"""
+        if self.loaded_at is None:
+            return
+        with self._lock:
+            self._stored_by_profile[profile_id] = stored_points
+            self.update(profile_id, points)
+
+    def add_points(self, profile_id, delta):
+        """Apply a point change to a profile already being tracked"""
+        with self._lock:
+            old = self._points_by_profile.get(profile_id)
+            if old is not None:
+                self.update(profile_id, old + delta)
+
+    def remove(self, profile_id):
+        if self.loaded_at is None:
+            return
+        with self._lock:
+            self._stored_by_profile.pop(profile_id, None)
+            old = self._points_by_profile.pop(profile_id, None)
+            if old is not None:
+                self._discard(old)
+
+    def rank(self, points):
+        """1-based rank of a profile with the given points"""
+        return self.ranks([points])[0]
+
+    def ranks(self, points_list):
+        """Ranks for many point totals under a single lock"""
+        self.ensure_loaded()
+        with self._lock:
+            total = len(self._points_by_profile)
+            return [total - self._count_at_most(self._key(points)) + 1 for points in points_list]
+
+
+rank_service = RankService()
@@ -0,0 +1,67 @@
+"""
+Render time measurement for every template
+TimedDjangoTemplates is the stock Django template backend with each
+top-level render timed. Renders slower than TEMPLATE_RENDER_SLOW_MS are
+logged, and RenderTimingMiddleware reports the renders of a request in a
+Server-Timing header (shown by browser developer tools)
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+
+def record_render(request, template_name, duration_ms):
+    """Log a slow render and remember the timing on the request"""
+    if duration_ms >= settings.TEMPLATE_RENDER_SLOW_MS:
+        logger.warning("Rendering %s took %.1f ms", template_name, duration_ms)
+    if request is not None:
+        request.__dict__.setdefault('template_timings', []).append((template_name, duration_ms))
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            name = self.origin.template_name or '<string>'
+            record_render(request, name, (time.perf_counter() - start) * 1000)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend returning TimedTemplate instances"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class RenderTimingMiddleware:
+    """
+    Add a Server-Timing entry per template rendered for the request,
+    e.g. `render;desc="core/home.html";dur=3.1`, when
+    TEMPLATE_RENDER_TIMING is on
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        timings = getattr(request, 'template_timings', None)
+        if timings and settings.TEMPLATE_RENDER_TIMING:
+            entries = [f'render;desc="{name}";dur={duration:.1f}' for name, duration in timings]
+            if response.has_header('Server-Timing'):
+                entries.insert(0, response['Server-Timing'])
+            response['Server-Timing'] = ', '.join(entries)
+        return response
@@ -0,0 +1,149 @@
+"""
+Dataset revisions shared by every process through the database
+Each dataset has a DatasetRevision row that every committed write
+advances: the signals in core.signals for single rows, bulk writers
+(imports, value recomputes) once per run. Each process re-reads the rows
+at most every DATASET_REVISION_POLL_SECONDS and calls the listeners of
+every dataset another process has changed since, so in-memory indexes
+and per-worker caches never outlive a write for much longer than that.
+DatasetRevisionMiddleware reads the rows when the worker starts and
+starts a background thread for each later poll, so requests never wait
+for the query
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DATASETS = ('facilities', 'components', 'devices')
+
+
+class DatasetRevisions:
+    """Revisions this process has caught up with, and their listeners"""
+
+    def __init__(self):
+        self._seen = {}
+        self._checked_at = None
+        self._listeners = defaultdict(list)
+        self._lock = threading.Lock()
+        self._poller = None
+        # Separate from _lock, which a running poller holds while it reads
+        self._poller_lock = threading.Lock()
+
+    def subscribe(self, name, callback):
+        """Call `callback()` whenever another process changes dataset `name`"""
+        self._listeners[name].append(callback)
+
+    def _read(self):
+        from .models import DatasetRevision
+
+        return {
+            name: (revision, updated_at)
+            for name, revision, updated_at in DatasetRevision.objects.values_list('name', 'revision', 'updated_at')
+        }
+
+    def _due(self):
+        return self._checked_at is None or time.monotonic() - self._checked_at >= settings.DATASET_REVISION_POLL_SECONDS
+
+    def check(self, force=False):
+        """
+        Re-read the revisions once the poll interval has passed and notify
+        the listeners of datasets changed elsewhere
+        """
+        if not (force or self._due()):
+            return
+        with self._lock:
+            if not (force or self._due()):
+                return
+            try:
+                rows = self._read()
+            except DatabaseError as e:
+                # Tables not migrated yet; retried after the next interval
+                logger.warning("Could not read dataset revisions: %s", e)
+                rows = self._seen
+            changed = [
+                name for name, (revision, _) in rows.items()
+                if name in self._seen and self._seen[name][0] != revision
+            ]
+            self._seen = rows
+            self._checked_at = time.monotonic()
+        for name in changed:
+            for callback in self._listeners[name]:
+                callback()
+
+    def poll(self):
+        """
+        check() without blocking: only a process's first check runs
+        inline, later ones run in a background thread while requests keep
+        using the revisions already seen
+        """
+        if self._checked_at is None:
+            self.check()
+        elif self._due():
+            self._start_poller()
+
+    def _start_poller(self):
+        with self._poller_lock:
+            if self._poller is not None and self._poller.is_alive():
+                return
+            self._poller = threading.Thread(target=self._poll, name='revision-poll', daemon=True)
+            self._poller.start()
+
+    def _poll(self):
+        try:
+            self.check()
+        finally:
+            # The thread's own connection is never reused
+            connection.close()
+
+    def current(self, name):
+        """(revision, updated_at) of a dataset as last seen by this process"""
+        self.poll()
+        return self._seen.get(name, (0, None))
+
+    def bump(self, *names):
+        """
+        Advance the revisions of datasets this process has just written,
+        once the surrounding transaction commits
+        """
+        transaction.on_commit(lambda: self._bump(names))
+
+    def _bump(self, names):
+        from .models import DatasetRevision
+
+        now = timezone.now()
+        for name in names:
+            updated = DatasetRevision.objects.filter(name=name).update(revision=F('revision') + 1, updated_at=now)
+            if not updated:
+                DatasetRevision.objects.get_or_create(name=name, defaults={'revision': 1})
+        rows = self._read()
+        with self._lock:
+            for name in names:
+                seen = self._seen.get(name)
+                # This process already applied its own write; a larger jump
+                # means another process wrote too, left for check() to handle
+                if seen is None or rows[name][0] == seen[0] + 1:
+                    self._seen[name] = rows[name]
+
+
+dataset_revisions = DatasetRevisions()
+
+
+class DatasetRevisionMiddleware:
+    """Catch up with writes made by other processes before the view runs"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Runs once per worker, before it serves its first request
+        dataset_revisions.check()
+
+    def __call__(self, request):
+        dataset_revisions.poll()
+        return self.get_response(request)
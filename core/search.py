@@ -0,0 +1,81 @@
+"""
+Ranked full-text search over facility name, address, city and items
+PostgreSQL matches a weighted tsvector expression backed by a GIN index
+and SQLite an FTS5 table kept in sync by triggers (both created by
+migration 0007); other databases fall back to substring matching
+"""
+import re
+
+from django.db import DatabaseError, connection
+
+# Must match the indexed expression in migration 0007 for the GIN index to be used
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(city, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(accepted_items, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(address, '')), 'C')"
+)
+SQLITE_TABLE = 'core_facility_fts'
+# bm25 column weights for name, address, city, accepted_items
+SQLITE_WEIGHTS = (10.0, 2.0, 5.0, 5.0)
+MAX_SEARCH_RESULTS = 200
+
+
+def search_terms(query):
+    """Words of a user query, lowercased, with FTS syntax stripped"""
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def _search_postgres(terms, limit):
+    # Every word must match, the last one as a prefix for search-as-you-type
+    tsquery = ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+    sql = (
+        f'SELECT id, ts_rank({POSTGRES_VECTOR}, query) AS rank '
+        f"FROM core_facility, to_tsquery('simple', %s) query "
+        f'WHERE ({POSTGRES_VECTOR}) @@ query '
+        f'ORDER BY rank DESC, id LIMIT %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [tsquery, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_sqlite(terms, limit):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+    sql = (
+        f'SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s '
+        f'ORDER BY bm25({SQLITE_TABLE}, {weights}), rowid LIMIT %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_fallback(terms, limit):
+    from django.db.models import Q
+    from .models import Facility
+
+    facilities = Facility.objects.all()
+    for term in terms:
+        facilities = facilities.filter(
+            Q(name__icontains=term) | Q(address__icontains=term)
+            | Q(city__icontains=term) | Q(accepted_items__icontains=term)
+        )
+    return list(facilities.values_list('id', flat=True)[:limit])
+
+
+def search_facility_ids(query, limit=MAX_SEARCH_RESULTS):
+    """Ids of facilities matching every word of `query`, best match first"""
+    terms = search_terms(query)
+    if not terms:
+        return []
+    if connection.vendor == 'postgresql':
+        return _search_postgres(terms, limit)
+    if connection.vendor == 'sqlite':
+        try:
+            return _search_sqlite(terms, limit)
+        except DatabaseError:
+            # SQLite built without FTS5, so migration 0007 skipped the table
+            pass
+    return _search_fallback(terms, limit)
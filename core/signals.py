@@ -0,0 +1,212 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import ComponentInfo, Facility, Device, UserProfile, normalize_city, normalize_pincode
+from .clustering import facility_clusters
+from .components import component_pool
+from .device_search import device_catalog, device_index, suggestion_index
+from .distance import facility_coordinates
+from .items import item_index
+from .ranking import rank_service
+from .revisions import dataset_revisions
+from .spatial import facility_index
+from . import query_cache
+from . import stats
+from . import tiles
+
+
+# Normalized lookup columns, set here so fixture (raw) saves get them too
+@receiver(pre_save, sender=Facility)
+def normalize_facility_keys(sender, instance, **kwargs):
+    instance.city_key = normalize_city(instance.city)
+    instance.pincode_key = normalize_pincode(instance.pincode)
+
+
+# Keep the in-memory spatial structures in step with Facility writes
+@receiver(post_save, sender=Facility)
+def index_facility(sender, instance, **kwargs):
+    """Insert or move a facility in the spatial index"""
+    if facility_index.loaded:
+        facility_index.add(instance.pk, instance.latitude, instance.longitude)
+    facility_coordinates.invalidate()
+    facility_clusters.invalidate()
+
+
+@receiver(post_save, sender=Facility)
+def index_facility_items(sender, instance, **kwargs):
+    """Refresh a facility's entries in the accepted-items index"""
+    if item_index.loaded:
+        item_index.add(instance.pk, instance.accepted_items)
+
+
+# Cached map tiles covering a facility's old and new position are dropped,
+# along with cached queries for its old and new city and pincode
+@receiver(pre_save, sender=Facility)
+def remember_tile_origin(sender, instance, raw=False, **kwargs):
+    """
+    Record where a facility was before this save
+    Instances loaded from the database carry their stored location (see
+    Facility.from_db); only others read it back
+    """
+    instance._tile_origin = None
+    instance._query_origin = None
+    if instance.pk and not raw:
+        origin = instance._stored_location
+        if origin is None:
+            origin = Facility.objects.filter(pk=instance.pk).values_list(*Facility.LOCATION_FIELDS).first()
+        if origin is not None:
+            instance._tile_origin = origin[:2]
+            instance._query_origin = origin[2:]
+
+
+def invalidate_tiles_on_commit(*points):
+    """Delete the cached tiles containing `points` once the write commits"""
+    def invalidate():
+        for point in points:
+            tiles.invalidate_point(*point)
+
+    # Deleting earlier would let a request re-render the old rows in between
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Facility)
+def invalidate_facility_tiles(sender, instance, **kwargs):
+    """Delete cached tiles that showed or should now show the facility"""
+    points = [(instance.latitude, instance.longitude)]
+    origin = getattr(instance, '_tile_origin', None)
+    if origin is not None:
+        points.append(origin)
+    invalidate_tiles_on_commit(*points)
+    instance.remember_location()
+
+
+@receiver(post_save, sender=Facility)
+def invalidate_facility_queries(sender, instance, created, **kwargs):
+    """Expire cached queries that could have returned the facility"""
+    location = (instance.city, instance.pincode)
+    origin = getattr(instance, '_query_origin', None)
+    locations = [location] if origin is None else [location, origin]
+    query_cache.facility_changed(*locations, vocabulary=created or origin != location)
+    dataset_revisions.bump('facilities')
+
+
+@receiver(post_delete, sender=Facility)
+def unindex_facility(sender, instance, **kwargs):
+    """Remove a deleted facility from the spatial index"""
+    if facility_index.loaded:
+        facility_index.remove(instance.pk)
+    facility_coordinates.invalidate()
+    facility_clusters.invalidate()
+    if item_index.loaded:
+        item_index.remove(instance.pk)
+    invalidate_tiles_on_commit((instance.latitude, instance.longitude))
+    query_cache.facility_changed((instance.city, instance.pincode), vocabulary=True)
+    dataset_revisions.bump('facilities')
+
+
+# Advance the component revision used for conditional GETs, which also
+# makes every worker reload its learn page component pool
+@receiver(post_save, sender=ComponentInfo)
+def touch_component_version(sender, instance, created, **kwargs):
+    component_pool.invalidate()
+    dataset_revisions.bump('components')
+
+
+@receiver(post_delete, sender=ComponentInfo)
+def touch_component_version_on_delete(sender, instance, **kwargs):
+    component_pool.invalidate()
+    dataset_revisions.bump('components')
+
+
+# Keep the device search indexes in step with Device writes
+@receiver(post_save, sender=Device)
+def index_device(sender, instance, **kwargs):
+    """Insert or refresh a device in the search indexes"""
+    if device_index.loaded:
+        device_index.add(instance.pk, instance.brand, instance.model_name)
+    suggestion_index.invalidate()
+    device_catalog.invalidate()
+    query_cache.invalidate_devices()
+    dataset_revisions.bump('devices')
+
+
+@receiver(post_delete, sender=Device)
+def unindex_device(sender, instance, **kwargs):
+    """Remove a deleted device from the search indexes"""
+    if device_index.loaded:
+        device_index.remove(instance.pk)
+    suggestion_index.invalidate()
+    device_catalog.invalidate()
+    query_cache.invalidate_devices()
+    dataset_revisions.bump('devices')
+
+
+# Writes made by other processes reach this one through the shared
+# dataset revisions; drop everything built from the rows they changed
+def forget_facilities():
+    """Mark every structure derived from Facility rows stale"""
+    facility_index.invalidate()
+    item_index.invalidate()
+    facility_coordinates.invalidate()
+    facility_clusters.invalidate()
+    query_cache.invalidate_facilities()
+    stats.invalidate()
+    tiles.clear_cache()
+
+
+def forget_devices():
+    """Mark every structure derived from Device rows stale"""
+    device_index.invalidate()
+    suggestion_index.invalidate()
+    device_catalog.invalidate()
+    query_cache.invalidate_devices()
+    stats.invalidate()
+
+
+dataset_revisions.subscribe('facilities', forget_facilities)
+dataset_revisions.subscribe('components', component_pool.invalidate)
+dataset_revisions.subscribe('devices', forget_devices)
+
+
+# Keep leaderboard ranks in step with profile point changes
+@receiver(post_save, sender=UserProfile)
+def rank_profile(sender, instance, **kwargs):
+    """
+    Move a profile to its new point total in the rank service
+    Most saves (e.g. the one on every login) leave the compacted points
+    alone and cost nothing; otherwise the pending ledger is re-read,
+    since compaction may have moved points out of it in another process
+    """
+    if rank_service.stored_points_changed(instance.pk, instance.points):
+        rank_service.update_stored(instance.pk, instance.points, instance.get_totals()['points'])
+
+
+@receiver(post_delete, sender=UserProfile)
+def unrank_profile(sender, instance, **kwargs):
+    """Drop a deleted profile from the rank service"""
+    rank_service.remove(instance.pk)
+
+
+# Keep the cached home page counters current
+STAT_SENDERS = {
+    Facility: 'total_facilities',
+    Device: 'total_devices',
+    UserProfile: 'total_users',
+}
+
+
+def count_created(sender, instance, created, **kwargs):
+    """Increment the matching counter when a row is created"""
+    if created:
+        stats.adjust(STAT_SENDERS[sender], 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    """Decrement the matching counter when a row is deleted"""
+    stats.adjust(STAT_SENDERS[sender], -1)
+
+
+# Connected per model so saves of every other model never reach them
+for stat_sender in STAT_SENDERS:
+    post_save.connect(count_created, sender=stat_sender, dispatch_uid=f'count_created_{stat_sender.__name__}')
+    post_delete.connect(count_deleted, sender=stat_sender, dispatch_uid=f'count_deleted_{stat_sender.__name__}')
@@ -0,0 +1,200 @@
+"""
+In-memory spatial index over facility coordinates
+Answers nearest-facility and radius queries without scanning the table
+"""
+import math
+import threading
+
+# Mean Earth radius used for all great-circle distances
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km between two points given in degrees"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    """
+    Uniform latitude/longitude grid bucketing point ids by cell
+    Nearest queries search rings of cells outwards from the query cell
+    and stop as soon as no unvisited cell can hold a closer point
+    """
+
+    def __init__(self, cell_size=0.25):
+        self.cell_size = cell_size
+        self.rows = int(math.ceil(180 / cell_size))
+        self.cols = int(math.ceil(360 / cell_size))
+        self._cells = {}
+        self._points = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, pk):
+        return pk in self._points
+
+    def _cell(self, lat, lng):
+        row = min(int((lat + 90) // self.cell_size), self.rows - 1)
+        col = int((lng + 180) // self.cell_size) % self.cols
+        return row, col
+
+    def add(self, pk, lat, lng):
+        """Insert or move a point"""
+        lat, lng = float(lat), float(lng)
+        with self._lock:
+            self.remove(pk)
+            self._points[pk] = (lat, lng)
+            self._cells.setdefault(self._cell(lat, lng), set()).add(pk)
+
+    def remove(self, pk):
+        """Drop a point if present"""
+        with self._lock:
+            point = self._points.pop(pk, None)
+            if point is None:
+                return
+            cell = self._cell(*point)
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(pk)
+                if not bucket:
+                    del self._cells[cell]
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._points.clear()
+
+    def _ring(self, row, col, radius):
+        """Yield the occupied cells exactly `radius` cells away from (row, col)"""
+        if radius == 0:
+            cells = [(row, col)]
+        else:
+            cells = []
+            for c in range(col - radius, col + radius + 1):
+                cells.append((row - radius, c))
+                cells.append((row + radius, c))
+            for r in range(row - radius + 1, row + radius):
+                cells.append((r, col - radius))
+                cells.append((r, col + radius))
+        for r, c in cells:
+            if 0 <= r < self.rows:
+                bucket = self._cells.get((r, c % self.cols))
+                if bucket:
+                    yield bucket
+
+    def _searched_bound_km(self, lat, lng, row, col, radius):
+        """
+        Lower bound on the distance from the query to any point outside
+        the square of cells searched so far
+        """
+        south = lat - ((row - radius) * self.cell_size - 90)
+        north = ((row + radius + 1) * self.cell_size - 90) - lat
+        west = lng - ((col - radius) * self.cell_size - 180)
+        east = ((col + radius + 1) * self.cell_size - 180) - lng
+        bound = math.radians(min(south, north)) * EARTH_RADIUS_KM
+        dlng = math.radians(min(west, east, 90.0))
+        # Distance from a point to a meridian offset by dlng
+        meridian = math.asin(min(1.0, math.cos(math.radians(lat)) * math.sin(dlng)))
+        return min(bound, meridian * EARTH_RADIUS_KM)
+
+    def _scan(self, lat, lng, pks, radius_km, allowed):
+        results = []
+        for pk in pks:
+            if allowed is not None and pk not in allowed:
+                continue
+            plat, plng = self._points[pk]
+            distance = haversine_km(lat, lng, plat, plng)
+            if radius_km is None or distance <= radius_km:
+                results.append((distance, pk))
+        return results
+
+    def nearest(self, lat, lng, k=10, radius_km=None, allowed=None):
+        """
+        Return up to k (pk, distance_km) pairs closest to (lat, lng)
+        Pass k=None to return every point within radius_km, and a set
+        as `allowed` to only consider those ids
+        """
+        lat, lng = float(lat), float(lng)
+        with self._lock:
+            if not self._points or (allowed is not None and not allowed):
+                return []
+            # A candidate set smaller than the occupied cells is cheaper to scan
+            if allowed is not None and len(allowed) <= len(self._cells):
+                pks = [pk for pk in allowed if pk in self._points]
+                found = sorted(self._scan(lat, lng, pks, radius_km, None))
+                if k is not None:
+                    found = found[:k]
+                return [(pk, distance) for distance, pk in found]
+            row, col = self._cell(lat, lng)
+            max_radius = max(self.rows, self.cols)
+            found = []
+            radius = 0
+            while radius <= max_radius:
+                # Once the ring is larger than the occupied cell count it is
+                # cheaper to scan whatever has not been visited yet
+                if (2 * radius + 1) ** 2 > 4 * len(self._cells):
+                    seen = {pk for _, pk in found}
+                    rest = [pk for pk in self._points if pk not in seen]
+                    found.extend(self._scan(lat, lng, rest, radius_km, allowed))
+                    break
+                for bucket in self._ring(row, col, radius):
+                    found.extend(self._scan(lat, lng, bucket, radius_km, allowed))
+                bound = self._searched_bound_km(lat, lng, row, col, radius)
+                if radius_km is not None and bound >= radius_km:
+                    break
+                if k is not None and len(found) >= k:
+                    found.sort()
+                    if found[k - 1][0] <= bound:
+                        break
+                radius += 1
+            found.sort()
+            if k is not None:
+                found = found[:k]
+            return [(pk, distance) for distance, pk in found]
+
+
+class FacilityIndex(GridIndex):
+    """
+    Grid index over Facility coordinates, loaded lazily from the database
+    and kept in sync by the signals in core.signals
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loaded = False
+
+    def invalidate(self):
+        """Reload from the database on next use"""
+        with self._lock:
+            self.loaded = False
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self._lock:
+            if not self.loaded:
+                self.rebuild()
+
+    def rebuild(self):
+        """Reload every facility coordinate from the database"""
+        from .models import Facility
+
+        with self._lock:
+            self.clear()
+            for pk, lat, lng in Facility.objects.values_list('id', 'latitude', 'longitude'):
+                self.add(pk, lat, lng)
+            self.loaded = True
+
+    def nearest(self, lat, lng, k=10, radius_km=None, allowed=None):
+        self.ensure_loaded()
+        return super().nearest(lat, lng, k=k, radius_km=radius_km, allowed=allowed)
+
+
+facility_index = FacilityIndex()
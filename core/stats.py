@@ -0,0 +1,66 @@
+"""
+Cached site statistics for the home page
+Counts live in Django's cache, are adjusted by the create/delete signals
+in core.signals and are recomputed from the database whenever a key
+expires (every STATS_CACHE_TIMEOUT seconds) or goes missing
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+STAT_KEYS = {
+    'total_facilities': 'core:stats:total_facilities',
+    'total_devices': 'core:stats:total_devices',
+    'total_users': 'core:stats:total_users',
+}
+
+
+def _count_queries():
+    from .models import Facility, Device, UserProfile
+
+    return {
+        'total_facilities': Facility.objects.count,
+        'total_devices': Device.objects.count,
+        'total_users': UserProfile.objects.count,
+    }
+
+
+def reconcile():
+    """Recount every statistic from the database and cache the results"""
+    stats = {name: count() for name, count in _count_queries().items()}
+    cache.set_many({STAT_KEYS[name]: value for name, value in stats.items()}, settings.STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def get_home_stats():
+    """
+    Facility, device and user counts; zero database queries while the
+    cached counters are present
+    """
+    cached = cache.get_many(STAT_KEYS.values())
+    if len(cached) == len(STAT_KEYS):
+        return {name: cached[key] for name, key in STAT_KEYS.items()}
+    try:
+        return reconcile()
+    except DatabaseError as e:
+        # If database tables don't exist yet, use default values
+        logger.warning("Could not fetch counts from database: %s", e)
+        return dict.fromkeys(STAT_KEYS, 0)
+
+
+def adjust(name, delta):
+    """Apply a create (+1) or delete (-1) to a cached counter"""
+    try:
+        cache.incr(STAT_KEYS[name], delta)
+    except ValueError:
+        # Not cached right now, the next read recounts it
+        pass
+
+
+def invalidate():
+    """Drop all counters, e.g. after bulk writes that skip signals"""
+    cache.delete_many(STAT_KEYS.values())
@@ -1,3 +1,1509 @@
-from django.test import TestCase
+import gzip
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from io import StringIO
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import count
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .accrual import AccrualBuffer
+from . import stats, tiles
+from .components import component_pool
+from .device_search import DeviceIndex, device_index
+from .forms import DEVICE_PICKER_PAGE_SIZE, RecycleDeviceForm
+from .distance import FacilityCoordinates, haversine_matrix
+from .export import encode_json_array, encode_ndjson
+from .items import ItemIndex, normalize_item
+from .leaderboard import get_leaderboard, refresh, window_start
+from .ledger import compact_events
+from .models import ComponentInfo, DatasetRevision, Device, Facility, LeaderboardEntry, RecycleEvent, UserProfile
+from .importer import normalize_record
+from .pincodes import PincodeCentroids, build_index, pincode_centroids, slot_for
+from .query_budget import QueryBudgetExceeded, assert_query_budget
+from .query_cache import MISSING, LRUStore
+from .ranking import RankService, rank_service
+from .revisions import DatasetRevisions, dataset_revisions
+from .search import search_facility_ids
+from .valuation import compute_values, recompute_device_values
+from .signals import forget_devices, forget_facilities
+from .spatial import GridIndex, haversine_km
+
+
+class FacilityApiValidationTests(TestCase):
+    """Malformed query parameters are rejected with 400, never a 500"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Facility.objects.create(
+            name='Green Recyclers', address='1 MG Road', city='Bangalore', pincode='560001',
+            latitude='12.971600', longitude='77.594600', contact='080-1234567',
+            accepted_items='Laptops, Batteries',
+        )
+
+    def test_clusters_reject_non_finite_bbox(self):
+        for bbox in ('nan,nan,nan,nan', '-inf,0,10,inf', '0,0,10,nan'):
+            response = self.client.get(reverse('core:facilities_clusters'), {'zoom': 5, 'bbox': bbox})
+            self.assertEqual(response.status_code, 400, bbox)
+
+    def test_nearby_rejects_non_finite_coordinates(self):
+        response = self.client.get(reverse('core:facilities_nearby'), {'lat': 'nan', 'lng': '77.5'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('core:facilities_nearby'), {'lat': '12.9', 'lng': 'inf'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_nearest_batch_rejects_nan(self):
+        response = self.client.post(
+            reverse('core:facilities_nearest_batch'),
+            data='{"locations": [{"lat": NaN, "lng": 77.5}]}',
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_clusters_with_valid_bbox(self):
+        response = self.client.get(reverse('core:facilities_clusters'), {'zoom': 5, 'bbox': '0,60,30,90'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(cluster['count'] for cluster in response.json()['clusters']), 1)
+
+
+class AcceptedItemsTests(TestCase):
+    """Accepted-item normalization, the inverted index and ?accepts= filters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = {}
+        for name, items in (
+            ('Laptop Hub', 'Laptops, Notebooks, Batteries'),
+            ('Phone Shop', 'Mobile phones, Chargers'),
+            ('Everything', 'All types of electronic devices'),
+        ):
+            cls.ids[name] = Facility.objects.create(
+                name=name, address='1 Main Road', city='Pune', pincode='411001',
+                latitude='18.520400', longitude='73.856700', accepted_items=items,
+            ).pk
+
+    def test_normalize_item(self):
+        for raw, canonical in (
+            ('Mobile phones', 'smartphone'), (' NOTEBOOKS ', 'laptop'), ('Batteries', 'battery'),
+            ('Mice', 'mouse'), ('chargers', 'power adapter'), ('circuit boards', 'circuit board'),
+        ):
+            self.assertEqual(normalize_item(raw), canonical, raw)
+
+    def test_index_intersects_and_includes_wildcards(self):
+        index = ItemIndex()
+        self.assertEqual(
+            index.facilities_accepting(['laptop', 'battery']), {self.ids['Laptop Hub'], self.ids['Everything']},
+        )
+        self.assertEqual(index.facilities_accepting(['phone', 'laptop']), {self.ids['Everything']})
+        index.add(self.ids['Phone Shop'], 'Phones, Laptops')
+        self.assertIn(self.ids['Phone Shop'], index.facilities_accepting(['Laptops', 'Mobile']))
+        self.assertIn('laptop', index.vocabulary())
+
+    def test_apis_filter_on_accepts(self):
+        response = self.client.get(reverse('core:facilities_json'), {'accepts': 'mobile phone', 'fields': 'name'})
+        self.assertEqual(sorted(row['name'] for row in response.json()), ['Everything', 'Phone Shop'])
+        response = self.client.get(
+            reverse('core:facilities_nearby'), {'lat': '18.5', 'lng': '73.8', 'accepts': 'notebook,battery'},
+        )
+        self.assertEqual(sorted(row['name'] for row in response.json()), ['Everything', 'Laptop Hub'])
+
+
+class FacilitySearchTests(TestCase):
+    """Ranked full-text search over facilities"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ids = {}
+        for name, address, city, items in (
+            ('Green Depot', '4 Laptop Lane', 'Pune', 'Batteries'),
+            ('Laptop Recyclers', '1 Main Road', 'Mumbai', 'Batteries'),
+            ('Eco Hub', '2 Station Road', 'Pune', 'Laptops, Phones'),
+            ('Metal Works', '3 Market Road', 'Delhi', 'Cables'),
+        ):
+            cls.ids[name] = Facility.objects.create(
+                name=name, address=address, city=city, pincode='411001',
+                latitude='18.520400', longitude='73.856700', accepted_items=items,
+            ).pk
+
+    def names(self, query):
+        by_id = {pk: name for name, pk in self.ids.items()}
+        return [by_id[pk] for pk in search_facility_ids(query)]
+
+    def test_name_matches_rank_first(self):
+        # Weighted as name, then city and items, then address
+        self.assertEqual(self.names('laptop'), ['Laptop Recyclers', 'Eco Hub', 'Green Depot'])
+
+    def test_every_word_must_match_and_the_last_is_a_prefix(self):
+        self.assertEqual(self.names('pune lapt'), ['Eco Hub', 'Green Depot'])
+        self.assertEqual(self.names('delhi laptop'), [])
+        # FTS syntax is treated as plain words
+        self.assertEqual(self.names('"metal"*'), ['Metal Works'])
+        self.assertEqual(self.names('metal OR laptop'), [])
+        self.assertEqual(self.names('  '), [])
+
+    def test_index_follows_updates(self):
+        Facility.objects.filter(pk=self.ids['Metal Works']).update(name='Laptop Metal Works')
+        self.assertIn('Metal Works', self.names('laptop'))
+        Facility.objects.filter(pk=self.ids['Laptop Recyclers']).delete()
+        self.assertNotIn(self.ids['Laptop Recyclers'], search_facility_ids('laptop'))
+
+    def test_locator_anywhere_search(self):
+        response = self.client.get(reverse('core:locator'), {'search_type': 'anywhere', 'search_query': 'laptop'})
+        self.assertEqual([f.name for f in response.context['facilities']][0], 'Laptop Recyclers')
+
+
+class FacilityPagingTests(TestCase):
+    """Viewport filters and keyset pages of the facilities API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rows = []
+        for i in range(11):
+            # Repeated city/name pairs exercise the id tie-breaker
+            city = ('Bangalore', 'Chennai', 'Mumbai')[i % 3]
+            rows.append(Facility(
+                name=f'Recycler {i % 4}', address='1 Main Road', city=city, pincode=f'{560000 + i}',
+                latitude=f'{10 + i}.000000', longitude='77.000000', accepted_items='Laptops',
+            ))
+        Facility.objects.bulk_create(rows)
+
+    def get(self, **params):
+        response = self.client.get(reverse('core:facilities_json'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_keyset_pages_cover_every_row_once(self):
+        expected = list(Facility.objects.order_by('city', 'name', 'id').values_list('id', flat=True))
+        seen, cursor = [], None
+        while True:
+            page = self.get(limit=3, fields='id,city', **({'cursor': cursor} if cursor else {}))
+            self.assertLessEqual(len(page['results']), 3)
+            self.assertEqual(set(page['results'][0]), {'id', 'city'})
+            seen += [row['id'] for row in page['results']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_bbox_limits_the_rows(self):
+        rows = self.get(bbox='12.5,76,15.5,78', fields='latitude')
+        self.assertEqual(sorted(row['latitude'] for row in rows), [13.0, 14.0, 15.0])
+        self.assertEqual(self.get(bbox='12.5,76,15.5,78', limit=2)['results'][0]['latitude'], 13.0)
+
+    def test_tampered_cursor_is_rejected(self):
+        response = self.client.get(reverse('core:facilities_json'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FacilityExportTests(TestCase):
+    """Streaming JSON and NDJSON exports"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            Facility.objects.create(
+                name=f'Recycler {i}', address='1 Main Road', city=('Pune', 'Delhi')[i % 2], pincode=f'{411000 + i}',
+                latitude='18.520400', longitude='73.856700', accepted_items='Laptops',
+            )
+
+    def export(self, **params):
+        response = self.client.get(reverse('core:facilities_export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_json_array(self):
+        response, body = self.export(fields='id,name,latitude')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        rows = json.loads(body)
+        self.assertEqual([row['name'] for row in rows], [f'Recycler {i}' for i in range(5)])
+        self.assertEqual(rows[0], {'id': rows[0]['id'], 'name': 'Recycler 0', 'latitude': 18.5204})
+
+    def test_ndjson_with_filters(self):
+        response, body = self.export(format='ndjson', city='Delhi', fields='name')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = body.decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{'name': 'Recycler 1'}, {'name': 'Recycler 3'}])
+
+    def test_gzip_when_accepted(self):
+        response = self.client.get(reverse('core:facilities_export'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(b''.join(response.streaming_content)))), 5)
+
+    def test_encoders_yield_batches(self):
+        rows = [{'n': i} for i in range(5)]
+        self.assertEqual(list(encode_json_array(iter(rows), chunk_size=2)), [
+            '[', '{"n": 0},{"n": 1}', ',{"n": 2},{"n": 3}', ',{"n": 4}', ']',
+        ])
+        self.assertEqual(list(encode_json_array(iter([]))), ['[', ']'])
+        self.assertEqual(''.join(encode_ndjson(iter(rows), chunk_size=2)).count('\n'), 5)
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(reverse('core:facilities_export'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FacilityClusterSearchTests(TestCase):
+    """Map clusters follow the locator's active search"""
+
+    def setUp(self):
+        cache.clear()
+        for name, city, pincode, lat, lng, items in (
+            ('Green Recyclers', 'Bangalore', '560001', '12.971600', '77.594600', 'Laptops, Batteries'),
+            ('Eco Hub', 'Bangalore', '560034', '12.935200', '77.624500', 'Phones'),
+            ('Delhi E-Waste', 'New Delhi', '110001', '28.613900', '77.209000', 'Laptops'),
+        ):
+            Facility.objects.create(
+                name=name, address='1 Main Road', city=city, pincode=pincode,
+                latitude=lat, longitude=lng, contact='080-1234567', accepted_items=items,
+            )
+
+    def cluster_names(self, **filters):
+        params = {'zoom': 16, 'bbox': '0,60,40,90', **filters}
+        response = self.client.get(reverse('core:facilities_clusters'), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(cluster['facility']['name'] for cluster in response.json()['clusters'])
+
+    def test_unfiltered_clusters_cover_every_facility(self):
+        self.assertEqual(self.cluster_names(), ['Delhi E-Waste', 'Eco Hub', 'Green Recyclers'])
+
+    def test_search_filters_limit_the_clusters(self):
+        self.assertEqual(
+            self.cluster_names(search_type='city', search_query='Bangalore'), ['Eco Hub', 'Green Recyclers'],
+        )
+        self.assertEqual(self.cluster_names(accepts='laptop'), ['Delhi E-Waste', 'Green Recyclers'])
+        self.assertEqual(
+            self.cluster_names(search_type='city', search_query='Bangalore', accepts='laptop'), ['Green Recyclers'],
+        )
+
+
+class FacilityCityFilterTests(TestCase):
+    """City filters match any city containing the term"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, city, pincode in (
+            ('Delhi Recyclers', 'Delhi', '110006'),
+            ('Capital E-Waste', 'New Delhi', '110001'),
+            ('Green Recyclers', 'Bangalore', '560001'),
+        ):
+            Facility.objects.create(
+                name=name, address='1 Main Road', city=city, pincode=pincode,
+                latitude='20.000000', longitude='77.000000', accepted_items='Laptops',
+            )
+
+    def cities(self, term):
+        return sorted(Facility.objects.in_city(term).values_list('city', flat=True))
+
+    def test_known_city_also_matches_longer_names(self):
+        self.assertEqual(self.cities('Delhi'), ['Delhi', 'New Delhi'])
+        self.assertEqual(self.cities('  new   DELHI '), ['New Delhi'])
+
+    def test_partial_and_unknown_terms(self):
+        self.assertEqual(self.cities('delh'), ['Delhi', 'New Delhi'])
+        self.assertEqual(self.cities('Mumbai'), [])
+
+    def test_pincode_prefix(self):
+        def pincodes(term):
+            return sorted(Facility.objects.with_pincode_prefix(term).values_list('pincode', flat=True))
+
+        self.assertEqual(pincodes('1100'), ['110001', '110006'])
+        self.assertEqual(pincodes(' 110 006 '), ['110006'])
+        self.assertEqual(pincodes('56'), ['560001'])
+        self.assertEqual(pincodes('109'), [])
+        self.assertEqual(len(pincodes('')), 3)
+
+    def test_api_and_locator_filters(self):
+        response = self.client.get(reverse('core:facilities_json'), {'city': 'delhi', 'fields': 'name'})
+        self.assertEqual(sorted(row['name'] for row in response.json()), ['Capital E-Waste', 'Delhi Recyclers'])
+        response = self.client.get(reverse('core:facilities_json'), {'pincode': '560', 'fields': 'name'})
+        self.assertEqual([row['name'] for row in response.json()], ['Green Recyclers'])
+        response = self.client.get(reverse('core:locator'), {'search_type': 'city', 'search_query': 'New Delhi'})
+        self.assertEqual([f.name for f in response.context['facilities']], ['Capital E-Waste'])
+
+
+class LRUStoreTests(SimpleTestCase):
+    """Entries leave the in-process store by age as well as by recency"""
+
+    def test_entries_expire_after_timeout(self):
+        store = LRUStore(max_entries=4, timeout=60)
+        with mock.patch('core.query_cache.time.monotonic', return_value=1000.0):
+            store.set('key', None)
+            self.assertIsNone(store.get('key'))
+        with mock.patch('core.query_cache.time.monotonic', return_value=1060.0):
+            self.assertIs(store.get('key'), MISSING)
+        self.assertEqual(len(store), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        store = LRUStore(max_entries=2, timeout=60)
+        store.set('a', 1)
+        store.set('b', 2)
+        store.get('a')
+        store.set('c', 3)
+        self.assertEqual((store.get('a'), store.get('b'), store.get('c')), (1, MISSING, 3))
+
+
+class PincodeCentroidTests(SimpleTestCase):
+    """Centroid files are built ahead of time and picked up by running processes"""
+
+    def test_replaced_file_is_mapped_again(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'centroids.csv')
+            with open(source, 'w') as fh:
+                fh.write('pincode,latitude,longitude\n560001,12.97,77.59\n')
+            path = os.path.join(tmp, 'centroids.bin')
+            with override_settings(PINCODE_CENTROIDS_CSV=source, PINCODE_CENTROIDS_PATH=path):
+                centroids = PincodeCentroids()
+                with self.assertLogs('core.pincodes', 'WARNING'):
+                    self.assertIsNone(centroids.lookup('560001'))
+                self.assertFalse(os.path.exists(path), 'built during a lookup')
+
+                call_command('build_pincode_index', stdout=StringIO())
+                self.assertEqual(centroids.lookup('560001'), (12.97, 77.59))
+                version = centroids.version()
+
+                build_index([('560001', 13.0, 77.0)], path)
+                # Coarse filesystem clocks could give the new file the same mtime
+                os.utime(path, ns=(version + 10 ** 9, version + 10 ** 9))
+                self.assertEqual(centroids.lookup('560001'), (13.0, 77.0))
+                self.assertNotEqual(centroids.version(), version)
+
+                with override_settings(PINCODE_CENTROID_FALLBACK=False):
+                    self.assertIsNone(centroids.lookup('560001'))
+
+
+class GridIndexTests(SimpleTestCase):
+    """Grid nearest-neighbour queries agree with a brute-force scan"""
+
+    def setUp(self):
+        rng = random.Random(1)
+        # Clustered around Indian cities plus a sprinkling worldwide,
+        # including points on both sides of the antimeridian
+        self.points = {}
+        for pk in range(1, 401):
+            if pk % 4:
+                lat, lng = rng.uniform(8, 35), rng.uniform(68, 97)
+            else:
+                lat, lng = rng.uniform(-89, 89), rng.uniform(-180, 180)
+            self.points[pk] = (lat, lng)
+        self.points[401] = (10.0, 179.95)
+        self.points[402] = (10.0, -179.95)
+        self.index = GridIndex(cell_size=0.5)
+        for pk, (lat, lng) in self.points.items():
+            self.index.add(pk, lat, lng)
+
+    def brute_force(self, lat, lng, k=10, radius_km=None, allowed=None):
+        found = sorted(
+            (haversine_km(lat, lng, plat, plng), pk) for pk, (plat, plng) in self.points.items()
+            if (allowed is None or pk in allowed)
+        )
+        if radius_km is not None:
+            found = [(d, pk) for d, pk in found if d <= radius_km]
+        return [pk for _, pk in found[:k]]
+
+    def assertSameResults(self, lat, lng, **kwargs):
+        got = self.index.nearest(lat, lng, **kwargs)
+        self.assertEqual([pk for pk, _ in got], self.brute_force(lat, lng, **kwargs), (lat, lng, kwargs))
+        for pk, distance in got:
+            self.assertAlmostEqual(distance, haversine_km(lat, lng, *self.points[pk]))
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(2)
+        for _ in range(50):
+            self.assertSameResults(rng.uniform(-80, 80), rng.uniform(-180, 180), k=5)
+            self.assertSameResults(rng.uniform(8, 35), rng.uniform(68, 97), k=10)
+
+    def test_radius_and_allowed_filters(self):
+        allowed = set(range(1, 403, 3))
+        self.assertSameResults(20.0, 78.0, k=None, radius_km=300)
+        self.assertSameResults(20.0, 78.0, k=10, allowed=allowed)
+        self.assertSameResults(20.0, 78.0, k=10, allowed={7, 8, 9})
+        self.assertEqual(self.index.nearest(20.0, 78.0, allowed=set()), [])
+
+    def test_antimeridian_and_moves(self):
+        self.assertEqual(self.index.nearest(10.0, -179.99, k=2)[0][0], 402)
+        self.assertEqual({pk for pk, _ in self.index.nearest(10.0, 180.0, k=2)}, {401, 402})
+        self.index.add(401, 20.0, 78.0)
+        self.index.remove(402)
+        self.points[401] = (20.0, 78.0)
+        del self.points[402]
+        self.assertSameResults(10.0, 179.99, k=3)
+        self.assertEqual(self.index.nearest(20.0, 78.0, k=1)[0][0], 401)
+
+
+class HaversineMatrixTests(TestCase):
+    """Vectorized distances agree with the scalar haversine"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(3)
+        Facility.objects.bulk_create([
+            Facility(
+                name=f'Facility {i}', address='1 Main Road', city='Pune', pincode=f'{411000 + i}',
+                latitude=f'{rng.uniform(-60, 60):.6f}', longitude=f'{rng.uniform(-180, 180):.6f}',
+                accepted_items='Laptops',
+            ) for i in range(60)
+        ])
+        cls.points = {
+            pk: (float(lat), float(lng))
+            for pk, lat, lng in Facility.objects.values_list('id', 'latitude', 'longitude')
+        }
+
+    def setUp(self):
+        self.coordinates = FacilityCoordinates()
+
+    def test_matrix_matches_scalar(self):
+        origins = [(0.0, 0.0), (12.97, 77.59), (-33.9, 151.2), (89.9, -179.9)]
+        destinations = [(28.61, 77.21), (51.5, -0.13), (-33.9, 151.2), (0.0, 180.0)]
+        lats = [math.radians(lat) for lat, _ in destinations]
+        lngs = [math.radians(lng) for _, lng in destinations]
+        matrix = haversine_matrix([o[0] for o in origins], [o[1] for o in origins], lats, lngs)
+        self.assertEqual(matrix.shape, (4, 4))
+        for i, origin in enumerate(origins):
+            for j, destination in enumerate(destinations):
+                self.assertAlmostEqual(matrix[i, j], haversine_km(*origin, *destination), places=6)
+
+    def brute_force(self, lat, lng, pks=None):
+        return sorted(
+            (haversine_km(lat, lng, *point), pk) for pk, point in self.points.items()
+            if pks is None or pk in pks
+        )
+
+    def test_rank_matches_scalar(self):
+        ranked = self.coordinates.rank(12.97, 77.59)
+        expected = self.brute_force(12.97, 77.59)
+        self.assertEqual([pk for pk, _ in ranked], [pk for _, pk in expected])
+        for (_, distance), (expected_distance, _) in zip(ranked, expected):
+            self.assertAlmostEqual(distance, expected_distance, places=6)
+
+        subset = set(list(self.points)[::7]) | {10 ** 9}
+        self.assertEqual(
+            [pk for pk, _ in self.coordinates.rank(12.97, 77.59, subset)],
+            [pk for _, pk in self.brute_force(12.97, 77.59, subset)],
+        )
+
+    def test_nearest_many_in_blocks(self):
+        origins = [(0.0, 0.0), (12.97, 77.59), (40.7, -74.0)]
+        with mock.patch('core.distance.MAX_BLOCK_ELEMENTS', 100):
+            results = self.coordinates.nearest_many(origins, k=3)
+        for origin, found in zip(origins, results):
+            expected = self.brute_force(*origin)[:3]
+            self.assertEqual([pk for pk, _ in found], [pk for _, pk in expected])
+
+        within = self.coordinates.nearest_many(origins, k=len(self.points) + 5, radius_km=2000)
+        for origin, found in zip(origins, within):
+            expected = [pk for distance, pk in self.brute_force(*origin) if distance <= 2000]
+            self.assertEqual([pk for pk, _ in found], expected)
+
+
+class DeviceIndexTests(SimpleTestCase):
+    """Fuzzy brand and model matching of the device index"""
+
+    def setUp(self):
+        self.index = DeviceIndex()
+        self.index.loaded = True
+        for pk, brand, model_name in (
+            (1, 'Apple', 'iPhone 12'),
+            (2, 'Apple', 'iPhone 12 Pro'),
+            (3, 'Samsung', 'Galaxy S21'),
+        ):
+            self.index.add(pk, brand, model_name)
+
+    def test_spacing_case_and_punctuation_are_ignored(self):
+        self.assertEqual(self.index.best_match('apple', 'iphone12')[0], 1)
+        self.assertEqual(self.index.best_match('SAMSUNG', 'Galaxy S-21')[0], 3)
+        self.assertEqual(self.index.best_match('Apple', 'iPhone 12 Pro'), (2, [1]))
+
+    def test_typos_match_and_weak_candidates_are_suggestions(self):
+        self.assertEqual(self.index.best_match('Apple', 'iPhon 12')[0], 1)
+        best, others = self.index.best_match('Apple', 'iPhone')
+        self.assertIn(best, (1, 2))
+        self.assertEqual(self.index.best_match('Samsung', 'Note 9'), (None, []))
+        scores = [score for _, score in self.index.search('Apple', 'iPhone 12')]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_removed_devices_are_not_found(self):
+        self.index.remove(3)
+        self.assertEqual(self.index.best_match('Samsung', 'Galaxy S21'), (None, []))
+        self.index.add(3, 'Samsung', 'Galaxy S22')
+        self.assertEqual(self.index.best_match('Samsung', 'Galaxy S22')[0], 3)
+
+    def test_other_brands_never_match(self):
+        self.assertEqual(self.index.best_match('Samsung', 'iPhone 12'), (None, []))
+        self.assertEqual(self.index.best_match('Appel', 'iPhone 12'), (1, [2]))
+
+
+class DeviceAutocompleteTests(TestCase):
+    """Typeahead suggestions and their conditional responses"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for brand, model_name in (('Apple', 'iPhone 12'), ('Apple', 'iPad Air'), ('Asus', 'ZenBook 14')):
+            Device.objects.create(
+                brand=brand, model_name=model_name, device_type='smartphone',
+                gold_mg=30, silver_mg=300, copper_mg=15000, estimated_value=50,
+            )
+
+    def get(self, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('core:devices_autocomplete'), params, **headers)
+
+    def labels(self, **params):
+        response = self.get(**params)
+        self.assertEqual(response.status_code, 200)
+        return [suggestion['label'] for suggestion in response.json()['suggestions']]
+
+    def test_brands_come_before_models(self):
+        self.assertEqual(self.labels(q='a'), ['Apple', 'Asus', 'Apple iPad Air', 'Apple iPhone 12', 'Asus ZenBook 14'])
+        self.assertEqual(self.labels(q='i-ph'), ['Apple iPhone 12'])
+        self.assertEqual(self.labels(q='appleipa'), ['Apple iPad Air'])
+        self.assertEqual(self.labels(q='a', brand='apple'), ['Apple iPad Air', 'Apple iPhone 12'])
+        self.assertEqual(self.labels(q='ip', brand='asus'), [])
+        self.assertEqual(self.labels(q='zen', brand='ASUS'), ['Asus ZenBook 14'])
+        self.assertEqual(self.labels(q='a', limit=1), ['Apple'])
+
+    def test_unchanged_suggestions_are_not_modified(self):
+        response = self.get(q='ap')
+        etag = response['ETag']
+        self.assertEqual(self.get(etag, q='ap').status_code, 304)
+        self.assertEqual(self.get(etag, q='as').status_code, 200)
+        Device.objects.create(
+            brand='Apricot', model_name='One', device_type='smartphone',
+            gold_mg=1, silver_mg=1, copper_mg=1, estimated_value=1,
+        )
+        response = self.get(etag, q='ap')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Apricot', [suggestion['label'] for suggestion in response.json()['suggestions']])
+
+
+class DevicePickerTests(TestCase):
+    """The recycle form's device picker pages through the in-memory catalog"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.devices = [
+            Device.objects.create(
+                brand='Acme', model_name=f'Phone {i:02d}', device_type='smartphone',
+                gold_mg=30, silver_mg=300, copper_mg=15000, estimated_value=50,
+            ) for i in range(DEVICE_PICKER_PAGE_SIZE + 5)
+        ]
+        Device.objects.create(
+            brand='Zen', model_name='Tab', device_type='tablet',
+            gold_mg=1, silver_mg=1, copper_mg=1, estimated_value=10,
+        )
+
+    def page(self, **params):
+        response = self.client.get(reverse('core:devices_picker'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_cover_the_catalog_in_label_order(self):
+        first = self.page()
+        self.assertEqual(len(first['results']), DEVICE_PICKER_PAGE_SIZE)
+        self.assertEqual(first['results'][0], {'id': self.devices[0].pk, 'label': 'Acme Phone 00 (₹50.00)'})
+        second = self.page(page=first['next_page'])
+        self.assertIsNone(second['next_page'])
+        labels = [row['label'] for row in first['results'] + second['results']]
+        self.assertEqual(labels, sorted(labels))
+        self.assertEqual(len(labels), len(self.devices) + 1)
+
+    def test_query_ignores_case_and_spacing(self):
+        self.assertEqual([row['label'] for row in self.page(q='zentab')['results']], ['Zen Tab (₹10.00)'])
+        self.assertEqual(len(self.page(q='ACME phone 0')['results']), 10)
+        self.assertEqual(self.page(q='nothing'), {'results': [], 'next_page': None})
+        self.assertEqual(self.client.get(reverse('core:devices_picker'), {'page': '-1'}).status_code, 400)
+
+    def test_form_renders_a_page_and_accepts_any_device(self):
+        last = self.devices[-1]
+        form = RecycleDeviceForm({'device': last.pk})
+        self.assertTrue(form.has_more_devices)
+        self.assertIn(last.pk, dict(form.fields['device'].widget.choices))
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['device'], last)
+        self.assertFalse(RecycleDeviceForm({'device': 10 ** 9}).is_valid())
+
+
+class EstimateBatchTests(TestCase):
+    """Bulk quotes use the same stored values as the estimator page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Stored value deliberately differs from the metal content at current prices
+        cls.device = Device.objects.create(
+            brand='Apple', model_name='iPhone 12', device_type='smartphone',
+            gold_mg=30, silver_mg=300, copper_mg=15000, estimated_value='123.45',
+        )
+
+    def setUp(self):
+        device_index.invalidate()
+
+    def post(self, items):
+        return self.client.post(
+            reverse('core:estimate_batch'), data=json.dumps({'items': items}), content_type='application/json',
+        )
+
+    def test_stored_values_are_quoted(self):
+        response = self.post([
+            {'brand': 'Apple', 'model_name': 'iphone12', 'quantity': 3},
+            {'brand': 'Nokia', 'model_name': '3310'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        matched, unmatched = data['items']
+        self.assertEqual(matched['device']['id'], self.device.pk)
+        self.assertEqual((matched['unit_value'], matched['total_value']), (123.45, 370.35))
+        self.assertFalse(unmatched['matched'])
+        self.assertEqual(data['total_value'], 370.35)
+        self.assertEqual(data['total_metals_g'], {'gold': 0.09, 'silver': 0.9, 'copper': 45.0})
+
+        estimate = self.client.post(reverse('core:estimate'), {'brand': 'Apple', 'model_name': 'iPhone 12'})
+        self.assertEqual(estimate.context['device'].estimated_value, Decimal('123.45'))
+
+
+    def test_invalid_items_are_rejected(self):
+        for items in (
+            [{'brand': 'Apple', 'model_name': 'iPhone 12', 'quantity': 1.5}],
+            [{'brand': 'Apple', 'model_name': 'iPhone 12', 'quantity': 0}],
+            [{'brand': 'Apple'}],
+            [{'brand': 'Apple', 'model_name': 'iPhone 12'}] * 501,
+            'iPhone 12',
+        ):
+            self.assertEqual(self.post(items).status_code, 400)
+
+    @override_settings(METAL_PRICES={'gold': 6000, 'silver': 80, 'copper': 1})
+    def test_recomputed_values_follow_metal_prices(self):
+        self.assertEqual(compute_values([[30, 300, 15000]]).tolist(), [219.0])
+        self.assertEqual(recompute_device_values(dry_run=True), 1)
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.estimated_value, Decimal('123.45'))
+
+        self.assertEqual(recompute_device_values(), 1)
+        self.assertEqual(recompute_device_values(), 0)
+        response = self.post([{'brand': 'Apple', 'model_name': 'iPhone 12', 'quantity': 2}])
+        self.assertEqual(response.json()['total_value'], 438.0)
+
+
+class PincodeCentroidLookupTests(TestCase):
+    """Centroids fill imported coordinates and turn PIN code searches into nearest queries"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'centroids.bin')
+        build_index([('560048', 12.9897, 77.7503), ('110020', 28.5355, 77.2635), ('0560001', 1.0, 1.0)], path)
+        self.enterContext(override_settings(PINCODE_CENTROIDS_PATH=path))
+        pincode_centroids.invalidate()
+        self.addCleanup(pincode_centroids.invalidate)
+        cache.clear()
+
+    def test_lookup(self):
+        self.assertEqual(pincode_centroids.lookup(' 560048 '), (12.9897, 77.7503))
+        self.assertIsNone(pincode_centroids.lookup('560049'))
+        for invalid in ('56004', '056004', '5600481', '56O048', '', None):
+            self.assertIsNone(slot_for(invalid), invalid)
+            self.assertIsNone(pincode_centroids.lookup(invalid))
+
+    def test_import_fills_missing_coordinates(self):
+        record = {'name': 'Hub', 'address': '1 Main Road', 'city': 'Bangalore', 'pincode': '560048'}
+        values = normalize_record(record)
+        self.assertEqual((values['latitude'], values['longitude']), (Decimal('12.989700'), Decimal('77.750300')))
+        with self.assertRaisesMessage(ValueError, 'no known centroid'):
+            normalize_record({**record, 'pincode': '560049'})
+
+    def test_full_pincode_search_lists_nearest_facilities(self):
+        for name, pincode, lat, lng in (
+            ('Whitefield Hub', '560066', '12.969800', '77.749900'),
+            ('Indiranagar Hub', '560038', '12.978400', '77.640800'),
+            ('Delhi Hub', '110020', '28.535500', '77.263500'),
+        ):
+            Facility.objects.create(
+                name=name, address='1 Main Road', city='City', pincode=pincode,
+                latitude=lat, longitude=lng, accepted_items='Laptops',
+            )
+        response = self.client.get(reverse('core:locator'), {'search_type': 'pincode', 'search_query': '560048'})
+        facilities = response.context['facilities']
+        self.assertEqual([f.name for f in facilities], ['Whitefield Hub', 'Indiranagar Hub'])
+        self.assertEqual([f.distance_km for f in facilities], [2.2, 11.9])
+
+        # Unknown PIN codes keep the prefix match
+        response = self.client.get(reverse('core:locator'), {'search_type': 'pincode', 'search_query': '1100'})
+        self.assertEqual([f.name for f in response.context['facilities']], ['Delhi Hub'])
+
+
+class RankServiceTests(SimpleTestCase):
+    """Bucketed ranks agree with counting every profile"""
+
+    def make_service(self, points_by_profile, num_buckets=16):
+        service = RankService(num_buckets=num_buckets)
+        service._points_by_profile = dict(points_by_profile)
+        service._build_index()
+        service.loaded_at = float('inf')
+        return service
+
+    def assertRanksMatch(self, service, probes):
+        totals = list(service._points_by_profile.values())
+        expected = [1 + sum(total > service._key(points) for total in totals) for points in probes]
+        self.assertEqual(service.ranks(probes), expected)
+
+    def test_ranks_match_brute_force_under_updates(self):
+        rng = random.Random(7)
+        service = self.make_service({pk: rng.randrange(0, 500) for pk in range(200)})
+        probes = [-5, 0, 1, 17, 250, 499, 10 ** 6]
+        self.assertRanksMatch(service, probes)
+        for _ in range(500):
+            pk = rng.randrange(0, 220)
+            if rng.random() < 0.1:
+                service.remove(pk)
+            else:
+                # Occasional huge totals force the buckets to widen
+                service.update(pk, rng.randrange(0, 10 ** 7 if rng.random() < 0.02 else 800))
+        self.assertRanksMatch(service, probes + [rng.randrange(0, 10 ** 7) for _ in range(20)])
+
+    def test_stale_ranks_are_reloaded_in_the_background(self):
+        service = self.make_service({1: 10, 2: 20})
+        service.loaded_at = time.monotonic() - 3600
+        with mock.patch.object(service, 'rebuild') as rebuild:
+            # Served from the current index while the thread reloads it
+            self.assertEqual(service.ranks([15]), [2])
+            service._reloader.join()
+        rebuild.assert_called_once_with()
+
+    def test_index_size_does_not_follow_top_score(self):
+        service = self.make_service({1: 10, 2: 10 ** 12}, num_buckets=1024)
+        self.assertEqual(service._tree.size, 1024)
+        self.assertEqual(service.ranks([10 ** 12, 10, 0]), [1, 2, 3])
+
+
+class LeaderboardRankTests(TestCase):
+    """The dashboard leaderboard and the rank service agree"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = Device.objects.create(
+            brand='Acme', model_name='Phone 1', device_type='smartphone',
+            gold_mg=30, silver_mg=300, copper_mg=15000, estimated_value=50,
+        )
+        cls.users = [User.objects.create_user(f'user{i}', password='secret-pass-1') for i in range(4)]
+
+    def setUp(self):
+        cache.clear()
+        rank_service.loaded_at = None
+
+    def test_ties_share_a_rank_on_both_sides(self):
+        for user in self.users[:2]:
+            user.profile.add_recycled_device(self.device)
+        refresh()
+        board = get_leaderboard('all')
+        by_user = {entry['user_id']: entry['rank'] for entry in board['entries']}
+        for user in self.users:
+            profile = UserProfile.objects.get(user=user)
+            self.assertEqual(by_user[user.pk], profile.get_rank(profile.get_totals()['points']))
+        self.assertEqual(by_user[self.users[0].pk], 1)
+        self.assertEqual(by_user[self.users[1].pk], 1)
+        self.assertEqual(by_user[self.users[2].pk], 3)
+
+    def test_admin_ranks_match_the_dashboard(self):
+        UserProfile.objects.filter(user=self.users[1]).update(points=1)
+        # Uncompacted events put users[0] ahead of the stored points
+        self.users[0].profile.add_recycled_device(self.device)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-1')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:core_userprofile_changelist'))
+        ranks = {profile.user_id: profile.rank for profile in response.context['cl'].result_list}
+        for user in self.users[:2]:
+            profile = UserProfile.objects.get(user=user)
+            self.assertEqual(ranks[user.pk], profile.get_rank(profile.get_totals()['points']))
+        self.assertEqual(ranks[self.users[0].pk], 1)
+
+    def test_login_save_does_not_reread_the_ledger(self):
+        profile = UserProfile.objects.get(user=self.users[0])
+        rank_service.ensure_loaded()
+        with self.assertNumQueries(1):
+            profile.save()
+        profile.points = 500
+        with self.assertNumQueries(2):
+            profile.save()
+        self.assertEqual(rank_service.rank(500), 1)
+
+
+@override_settings(LEADERBOARD_SIZE=3)
+class LeaderboardSnapshotTests(TestCase):
+    """Stored leaderboard snapshots and their refreshes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = Device.objects.create(
+            brand='Acme', model_name='Phone 1', device_type='smartphone',
+            gold_mg=30, silver_mg=300, copper_mg=15000, estimated_value=50,
+        )
+        cls.users = [User.objects.create_user(f'user{i}', password='secret-pass-1') for i in range(5)]
+
+    def setUp(self):
+        cache.clear()
+
+    def recycle(self, user, times=1):
+        profile = UserProfile.objects.get(user=user)
+        for _ in range(times):
+            profile.add_recycled_device(self.device)
+
+    def stored(self, window):
+        return list(LeaderboardEntry.objects.filter(window=window).order_by('position').values_list('username', 'points'))
+
+    def test_refresh_stores_the_top_rows_and_rewrites_only_changes(self):
+        for i, user in enumerate(self.users):
+            self.recycle(user, times=i)
+        self.assertEqual(refresh(), {'all': 3, 'month': 3, 'week': 3})
+        self.assertEqual(self.stored('all'), [('user4', 20), ('user3', 15), ('user2', 10)])
+        self.assertEqual(refresh(['all']), {'all': 0})
+
+        compact_events()
+        self.recycle(self.users[4])
+        self.assertEqual(refresh(['all']), {'all': 1})
+        self.assertEqual(self.stored('all'), [('user4', 25), ('user3', 15), ('user2', 10)])
+
+    def test_windows_only_count_their_own_events(self):
+        self.recycle(self.users[0], times=2)
+        self.recycle(self.users[1])
+        old = timezone.now() - timedelta(days=40)
+        RecycleEvent.objects.filter(user=self.users[0]).update(created_at=old)
+        refresh()
+        self.assertEqual(self.stored('all')[:2], [('user0', 10), ('user1', 5)])
+        self.assertEqual(self.stored('week'), [('user1', 5)])
+
+        wednesday = timezone.make_aware(datetime(2024, 5, 15, 13, 30))
+        self.assertEqual(window_start('week', wednesday), timezone.make_aware(datetime(2024, 5, 13)))
+        self.assertEqual(window_start('month', wednesday), timezone.make_aware(datetime(2024, 5, 1)))
+        self.assertIsNone(window_start('all', wednesday))
+
+    def test_reads_use_the_fresh_snapshot_then_the_cache(self):
+        self.recycle(self.users[2])
+        refresh()
+        cache.clear()
+        with self.assertNumQueries(1):
+            board = get_leaderboard('month')
+        self.assertEqual([(row['username'], row['rank']) for row in board['entries']], [('user2', 1)])
+        with self.assertNumQueries(0):
+            get_leaderboard('month')
+        self.assertEqual(get_leaderboard('nonsense')['window'], 'all')
+
+    @override_settings(LEADERBOARD_MAX_AGE=0)
+    def test_stale_snapshots_are_computed_but_not_written(self):
+        refresh()
+        stored = self.stored('all')
+        self.recycle(self.users[3])
+        cache.clear()
+        board = get_leaderboard('all')
+        self.assertEqual(board['entries'][0]['username'], 'user3')
+        self.assertEqual(self.stored('all'), stored)
+
+
+@override_settings(RECYCLE_ACCRUAL_MAX_ATTEMPTS=3)
+class AccrualBufferTests(TestCase):
+    """A bad buffered event never blocks the rest of the queue"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = Device.objects.create(
+            brand='Acme', model_name='Phone 1', device_type='smartphone',
+            gold_mg=30, silver_mg=300, copper_mg=15000, estimated_value=50,
+        )
+        cls.user = User.objects.create_user('recycler', password='secret-pass-1')
+
+    def setUp(self):
+        self.buffer = AccrualBuffer()
+        # Flushed explicitly by the tests instead of the background thread
+        self.buffer._ensure_worker = lambda: None
+
+    def test_deleted_device_is_detached_and_deleted_user_dropped(self):
+        gone = User.objects.create_user('gone', password='secret-pass-1')
+        doomed = Device.objects.create(
+            brand='Acme', model_name='Phone 2', device_type='smartphone',
+            gold_mg=30, silver_mg=300, copper_mg=15000, estimated_value=50,
+        )
+        self.buffer.add(self.user.pk, doomed.pk, 10, Decimal('0.50'))
+        self.buffer.add(gone.pk, self.device.pk, 10, Decimal('0.50'))
+        doomed.delete()
+        gone.delete()
+
+        self.assertEqual(self.buffer.flush(), 1)
+        event = RecycleEvent.objects.get()
+        self.assertEqual((event.user_id, event.device_id), (self.user.pk, None))
+        self.assertEqual(UserProfile.objects.get(user=self.user).points, 10)
+        self.assertEqual(self.buffer.pending_points(), {})
+
+    def test_failing_event_is_retried_alone_then_dropped(self):
+        self.buffer.add(self.user.pk, self.device.pk, 10, Decimal('0.50'))
+        # Does not fit the points column, so every write of it fails
+        self.buffer.add(self.user.pk, self.device.pk, 10 ** 20, Decimal('0.25'))
+        self.buffer.add(self.user.pk, self.device.pk, 20, Decimal('1.00'))
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(UserProfile.objects.get(user=self.user).points, 30)
+        self.assertEqual(self.buffer.pending(self.user.pk)[:2], (10 ** 20, 1))
+
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending_points(), {})
+        self.assertEqual(RecycleEvent.objects.count(), 2)
+
+    @override_settings(RECYCLE_ACCRUAL_MAX_BACKLOG=1)
+    def test_full_backlog_is_refused(self):
+        self.assertTrue(self.buffer.add(self.user.pk, self.device.pk, 10, Decimal('0.50')))
+        self.assertFalse(self.buffer.add(self.user.pk, self.device.pk, 10, Decimal('0.50')))
+
+
+class HomeStatsSignalTests(TestCase):
+    """Counters follow creates and deletes of their own model only"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_follow_their_models(self):
+        before = stats.get_home_stats()
+        user = User.objects.create_user('counted', password='secret-pass-1')
+        facility = Facility.objects.create(
+            name='Counted', address='2 MG Road', city='Bangalore', pincode='560001',
+            latitude='12.971600', longitude='77.594600',
+        )
+        after = stats.get_home_stats()
+        self.assertEqual(after['total_users'], before['total_users'] + 1)
+        self.assertEqual(after['total_facilities'], before['total_facilities'] + 1)
+        facility.delete()
+        user.delete()
+        self.assertEqual(stats.get_home_stats(), before)
+
+    def test_other_models_do_not_reach_the_receivers(self):
+        with mock.patch.object(stats, 'adjust') as adjust:
+            ComponentInfo.objects.create(
+                component='Lead', found_in='CRT monitors', health_effect='Toxic', environmental_effect='Soil',
+            ).delete()
+        adjust.assert_not_called()
+
+
+@override_settings(DATASET_REVISION_POLL_SECONDS=60)
+class DatasetRevisionTests(TestCase):
+    """Writes made by one process reach the in-memory data of the others"""
+
+    def facility(self, name, **fields):
+        return Facility(
+            name=name, address='1 MG Road', city='Bangalore', pincode='560001',
+            latitude='12.971600', longitude='77.594600', accepted_items='Laptops', **fields
+        )
+
+    def setUp(self):
+        cache.clear()
+        tile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tile_dir.cleanup)
+        self.enterContext(override_settings(FACILITY_TILE_CACHE_DIR=tile_dir.name))
+        forget_facilities()
+        dataset_revisions.check(force=True)
+
+    def test_listeners_run_for_other_processes_writes_only(self):
+        here, elsewhere = DatasetRevisions(), DatasetRevisions()
+        calls = []
+        here.subscribe('facilities', lambda: calls.append('facilities'))
+        here.check(force=True)
+        elsewhere.check(force=True)
+
+        elsewhere._bump(('facilities',))
+        here.check()
+        self.assertEqual(calls, [], 'checked again before the poll interval')
+        here.check(force=True)
+        self.assertEqual(calls, ['facilities'])
+
+        here._bump(('facilities',))
+        here.check(force=True)
+        self.assertEqual(calls, ['facilities'])
+
+    def test_stale_worker_reloads_facilities(self):
+        url = reverse('core:facilities_nearby')
+        params = {'lat': '12.97', 'lng': '77.59'}
+        self.facility('First').save()
+        self.assertEqual(len(self.client.get(url, params).json()), 1)
+
+        # Written by another process: no signals ran here
+        Facility.objects.bulk_create([self.facility('Second')])
+        self.assertEqual(len(self.client.get(url, params).json()), 1)
+        DatasetRevision.objects.filter(name='facilities').update(revision=F('revision') + 1)
+        dataset_revisions._checked_at = None
+        self.assertEqual(len(self.client.get(url, params).json()), 2)
+
+    def test_committed_write_changes_etag(self):
+        etag = self.client.get(reverse('core:facilities_json'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.facility('Third').save()
+        self.assertNotEqual(self.client.get(reverse('core:facilities_json'))['ETag'], etag)
+
+
+@override_settings(DATASET_REVISION_POLL_SECONDS=60)
+class ConditionalGetTests(TestCase):
+    """Unchanged facility and component data is answered with 304s"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.component = ComponentInfo.objects.create(
+            component='Lead', found_in='CRT monitors', health_effect='Toxic', environmental_effect='Soil',
+        )
+
+    def setUp(self):
+        dataset_revisions.check(force=True)
+
+    def add_facility(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            Facility.objects.create(
+                name=name, address='1 Main Road', city='Pune', pincode='411001',
+                latitude='18.520400', longitude='73.856700', accepted_items='Laptops',
+            )
+
+    def test_facility_apis_revalidate(self):
+        self.add_facility('First')
+        for name in ('core:facilities_json', 'core:facilities_export'):
+            url = reverse(name)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag, last_modified = response['ETag'], response['Last-Modified']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+            self.add_facility(f'After {name}')
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_export_representations_have_their_own_tags(self):
+        url = reverse('core:facilities_export')
+        plain = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url, {'format': 'ndjson'})['ETag'], plain)
+        self.assertNotEqual(self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')['ETag'], plain)
+
+    def test_learn_page_revalidates_specific_components_only(self):
+        url = reverse('core:learn')
+        response = self.client.get(url, {'id': self.component.pk})
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, {'id': self.component.pk}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertFalse(self.client.get(url).has_header('ETag'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.component.health_effect = 'Neurotoxic'
+            self.component.save()
+        response = self.client.get(url, {'id': self.component.pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Neurotoxic')
+
+
+class LearnPageTests(TestCase):
+    """The learn page component pool follows writes made anywhere"""
+
+    def setUp(self):
+        component_pool.invalidate()
+        dataset_revisions.check(force=True)
+
+    def test_empty_table_renders_the_empty_page(self):
+        for params in ({}, {'id': '5'}):
+            response = self.client.get(reverse('core:learn'), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.context['component'])
+
+    def test_malformed_ids_are_not_found(self):
+        ComponentInfo.objects.create(
+            component='Lead', found_in='CRT monitors', health_effect='Toxic', environmental_effect='Soil',
+        )
+        # '²' is a digit to str.isdigit() but not to int()
+        for component_id in ('²', '٣', 'abc', '-1', '999'):
+            response = self.client.get(reverse('core:learn'), {'id': component_id})
+            self.assertEqual(response.status_code, 404, component_id)
+
+    def test_pool_reloads_after_another_process_writes(self):
+        self.assertEqual(len(component_pool), 0)
+        # Written by another process: no signals ran here
+        ComponentInfo.objects.bulk_create([ComponentInfo(
+            component='Lead', found_in='CRT monitors', health_effect='Toxic', environmental_effect='Soil',
+        )])
+        self.assertEqual(len(component_pool), 0)
+        DatasetRevision.objects.filter(name='components').update(revision=F('revision') + 1)
+        dataset_revisions._checked_at = None
+        response = self.client.get(reverse('core:learn'))
+        self.assertEqual(response.context['component'].component, 'Lead')
+        self.assertEqual(response.context['total_components'], 1)
+
+
+class ProfileCounterTests(TestCase):
+    """Profile saves never write back point counters they loaded earlier"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.device = Device.objects.create(
+            brand='Acme', model_name='Phone 1', device_type='smartphone',
+            gold_mg=30, silver_mg=300, copper_mg=15000, estimated_value=50,
+        )
+        cls.user = User.objects.create_user('counted', password='secret-pass-1')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-1')
+
+    def test_user_save_keeps_compacted_points(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        user.profile.add_recycled_device(self.device)
+        compact_events()
+        # e.g. the last_login update of a login racing the compaction
+        user.save()
+        self.assertEqual(UserProfile.objects.get(user=self.user).points, self.device.get_point_value())
+
+    def test_admin_cannot_overwrite_counters(self):
+        profile = UserProfile.objects.get(user=self.user)
+        self.client.force_login(self.admin)
+        url = reverse('admin:core_userprofile_change', args=[profile.pk])
+        self.client.get(url)
+        profile.add_recycled_device(self.device)
+        compact_events()
+        response = self.client.post(url, {'user': self.user.pk, 'points': 0, 'total_recycled': 0, 'co2_saved': 0})
+        self.assertEqual(response.status_code, 302)
+        profile.refresh_from_db()
+        self.assertEqual((profile.points, profile.total_recycled), (self.device.get_point_value(), 1))
+
+    def test_leaderboard_worker_compacts_the_ledger(self):
+        UserProfile.objects.get(user=self.user).add_recycled_device(self.device)
+        call_command('refresh_leaderboard', '--compact', stdout=StringIO())
+        self.assertFalse(RecycleEvent.objects.filter(compacted=False).exists())
+        self.assertEqual(UserProfile.objects.get(user=self.user).points, self.device.get_point_value())
+
+
+def read_varint(data, i):
+    value = shift = 0
+    while True:
+        byte = data[i]
+        value |= (byte & 0x7F) << shift
+        i += 1
+        if not byte & 0x80:
+            return value, i
+        shift += 7
+
+
+def decode_protobuf(data):
+    """(field number, value) pairs of a protobuf message: ints or bytes"""
+    fields, i = [], 0
+    while i < len(data):
+        key, i = read_varint(data, i)
+        if key & 7 == 0:
+            value, i = read_varint(data, i)
+        else:
+            length, i = read_varint(data, i)
+            value, i = data[i:i + length], i + length
+        fields.append((key >> 3, value))
+    return fields
+
+
+def decode_packed(data):
+    values, i = [], 0
+    while i < len(data):
+        value, i = read_varint(data, i)
+        values.append(value)
+    return values
+
+
+def dict_of(fields):
+    grouped = {}
+    for number, value in fields:
+        grouped.setdefault(number, []).append(value)
+    return grouped
+
+
+class FacilityTileCacheTests(TestCase):
+    """Only tiles with facilities are cached, and they expire with their facilities"""
+
+    def setUp(self):
+        tile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tile_dir.cleanup)
+        self.enterContext(override_settings(FACILITY_TILE_CACHE_DIR=tile_dir.name))
+        tiles.tile_cache_size.count = None
+        self.facility = Facility.objects.create(
+            name='Green Recyclers', address='1 MG Road', city='Bangalore', pincode='560001',
+            latitude='12.971600', longitude='77.594600', accepted_items='Laptops',
+        )
+
+    def cached(self, z, x, y, fmt='pbf'):
+        return os.path.exists(tiles.tile_path(z, x, y, fmt))
+
+    def test_empty_tiles_are_not_stored(self):
+        for fmt in tiles.TILE_FORMATS:
+            self.assertIs(tiles.get_tile(10, 0, 0, fmt), tiles.EMPTY_TILES[fmt])
+            self.assertFalse(self.cached(10, 0, 0, fmt))
+        tiles.get_tile(10, 732, 474, 'pbf')
+        self.assertTrue(self.cached(10, 732, 474))
+
+    @override_settings(FACILITY_TILE_CACHE_MAX_FILES=4)
+    def test_oldest_tiles_are_evicted(self):
+        written = []
+        for z in range(6):
+            x, y = tiles.tile_for(self.facility.latitude, self.facility.longitude, z)
+            tiles.get_tile(z, x, y, 'pbf')
+            path = tiles.tile_path(z, x, y, 'pbf')
+            os.utime(path, (z, z))
+            written.append(path)
+        self.assertLessEqual(sum(1 for _ in tiles._cached_tiles()), 4)
+        self.assertTrue(os.path.exists(written[-1]))
+        self.assertFalse(os.path.exists(written[0]))
+
+    def test_tiles_are_dropped_when_the_move_commits(self):
+        tiles.get_tile(10, 732, 474, 'pbf')
+        facility = Facility.objects.get(pk=self.facility.pk)
+        # The stored location came with the row; the save reads nothing back
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks() as callbacks:
+            facility.latitude, facility.longitude = '28.613900', '77.209000'
+            facility.save()
+        self.assertTrue(self.cached(10, 732, 474), 'deleted before the commit')
+        for callback in callbacks:
+            callback()
+        self.assertFalse(self.cached(10, 732, 474))
+
+    def test_geojson_tile_body(self):
+        response = self.client.get(reverse('core:facility_tile', args=[10, 732, 474, 'geojson']))
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        body = json.loads(response.content)
+        self.assertEqual(body['type'], 'FeatureCollection')
+        feature, = body['features']
+        self.assertEqual(feature['id'], self.facility.pk)
+        self.assertEqual(feature['geometry'], {'type': 'Point', 'coordinates': [77.5946, 12.9716]})
+        self.assertEqual(feature['properties']['name'], 'Green Recyclers')
+
+    def test_mvt_tile_body(self):
+        response = self.client.get(reverse('core:facility_tile', args=[10, 732, 474, 'pbf']))
+        self.assertEqual(response['Content-Type'], 'application/vnd.mapbox-vector-tile')
+        layer = dict_of(decode_protobuf(response.content))[3][0]
+        fields = dict_of(decode_protobuf(layer))
+        self.assertEqual(fields[1], [b'facilities'])
+        self.assertEqual(fields[5], [tiles.MVT_EXTENT])
+        keys = [key.decode() for key in fields[3]]
+        values = [dict_of(decode_protobuf(value))[1][0].decode() for value in fields[4]]
+        feature = dict_of(decode_protobuf(fields[2][0]))
+        self.assertEqual(feature[1], [self.facility.pk])
+        self.assertEqual(feature[3], [1])
+        tags = decode_packed(feature[2][0])
+        properties = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+        self.assertEqual(properties, {'name': 'Green Recyclers', 'city': 'Bangalore', 'pincode': '560001'})
+        command, x, y = decode_packed(feature[4][0])
+        self.assertEqual(command, 9)
+        # Zigzag-decoded tile coordinates of the facility inside the tile
+        px, py = (value >> 1 ^ -(value & 1) for value in (x, y))
+        expected = tiles.project(12.9716, 77.5946, 10)
+        scale = tiles.MVT_EXTENT / tiles.TILE_SIZE
+        self.assertEqual((px, py), (
+            round((expected[0] - 732 * tiles.TILE_SIZE) * scale),
+            round((expected[1] - 474 * tiles.TILE_SIZE) * scale),
+        ))
+
+    def test_invalid_tiles_are_not_found(self):
+        for args in ([19, 0, 0, 'pbf'], [2, 4, 0, 'pbf'], [2, 0, 0, 'png']):
+            response = self.client.get(reverse('core:facility_tile', args=args))
+            self.assertEqual(response.status_code, 404, args)
+
+    def test_other_processes_writes_clear_the_cache(self):
+        tiles.get_tile(10, 732, 474, 'geojson')
+        forget_facilities()
+        self.assertFalse(self.cached(10, 732, 474, 'geojson'))
+
+
+@override_settings(
+    QUERY_BUDGET_ENABLED=True,
+    QUERY_BUDGET_STRICT=True,
+    DATASET_REVISION_POLL_SECONDS=60,
+    FACILITY_TILE_CACHE_DIR=os.path.join(tempfile.gettempdir(), 'e-waste-test-tiles'),
+)
+class QueryBudgetTests(TransactionTestCase):
+    """
+    Every budgeted view stays within its budget in strict mode, on a cold
+    worker and on a warm one, and runs as many queries with more data
+    Not wrapped in a transaction, so atomic blocks run no extra
+    SAVEPOINT statements and the counts match production
+    """
+
+    def setUp(self):
+        Facility.objects.bulk_create([
+            Facility(
+                name=f'Recycler {i}', address=f'{i} MG Road', city='Bangalore', pincode='560001',
+                city_key='bangalore', pincode_key='560001', latitude='12.971600', longitude='77.594600',
+                accepted_items='Laptops, Batteries',
+            )
+            for i in range(3)
+        ])
+        self.device = Device.objects.create(
+            brand='Acme', model_name='Phone 1', device_type='smartphone',
+            gold_mg=30, silver_mg=300, copper_mg=15000, estimated_value=50,
+        )
+        self.component = ComponentInfo.objects.create(
+            component='Lead', found_in='CRT monitors', health_effect='Toxic', environmental_effect='Soil',
+        )
+        self.user = User.objects.create_user('budget', password='secret-pass-1')
+        self.user.profile.add_recycled_device(self.device)
+        self.usernames = count()
+        self.batches = count()
+
+    def cold_worker(self):
+        """
+        Forget everything this process has cached or loaded; the dataset
+        revisions are read at startup and the next poll is due
+        """
+        cache.clear()
+        dataset_revisions._seen = {}
+        dataset_revisions.check(force=True)
+        dataset_revisions._checked_at -= settings.DATASET_REVISION_POLL_SECONDS
+        forget_facilities()
+        forget_devices()
+        component_pool.invalidate()
+        rank_service.loaded_at = None
+        tiles.clear_cache()
+
+    def grow(self):
+        """Add enough rows of every kind that per-row queries would show"""
+        batch = next(self.batches)
+        Facility.objects.bulk_create([
+            Facility(
+                name=f'Bulk {batch}-{i}', address=f'{i} Ring Road', city=f'City {i % 15}', pincode=str(560100 + i),
+                city_key=f'city {i % 15}', pincode_key=str(560100 + i),
+                latitude=Decimal('12.9') + Decimal(i) / 1000, longitude=Decimal('77.5') + Decimal(i) / 1000,
+                accepted_items='Phones' if i % 2 else '*',
+            )
+            for i in range(150)
+        ])
+        devices = Device.objects.bulk_create([
+            Device(
+                brand=f'Brand {i % 10}', model_name=f'Model {batch}-{i}', device_type='laptop',
+                gold_mg=i, silver_mg=i, copper_mg=i, estimated_value=i,
+            )
+            for i in range(100)
+        ])
+        ComponentInfo.objects.bulk_create([
+            ComponentInfo(component=f'Metal {batch}-{i}', found_in='Boards', health_effect='-', environmental_effect='-')
+            for i in range(10)
+        ])
+        users = User.objects.bulk_create([User(username=f'bulk{batch}-{i}') for i in range(60)])
+        UserProfile.objects.bulk_create([UserProfile(user=user, points=i) for i, user in enumerate(users)])
+        RecycleEvent.objects.bulk_create([
+            RecycleEvent(user=user, device=devices[i], points=i, co2_saved=Decimal('0.05') * i)
+            for i, user in enumerate(users)
+        ])
+
+    def query_count(self, method, url, data, login, status):
+        if login:
+            self.client.force_login(self.user)
+        else:
+            self.client.logout()
+        send = getattr(self.client, method)
+        if method == 'post' and isinstance(data, str):
+            response = send(url, data, content_type='application/json')
+        else:
+            response = send(url, data() if callable(data) else data)
+        self.assertEqual(response.status_code, status)
+        if dataset_revisions._poller is not None:
+            dataset_revisions._poller.join()
+        return int(response['X-Query-Count'])
+
+    def assertWithinBudget(self, method, name, data=None, login=False, status=200, **kwargs):
+        """
+        Send the request cold and warm, before and after growing the data;
+        the strict middleware raises as soon as one goes over budget
+        """
+        url = reverse(f'core:{name}', kwargs=kwargs)
+        counts = []
+        for grown in (False, True):
+            if grown:
+                self.grow()
+            self.cold_worker()
+            counts.append(tuple(self.query_count(method, url, data, login, status) for _ in range(2)))
+        self.assertEqual(counts[0], counts[1], f'{name} ran more queries with more data')
+        return counts[0]
+
+    def next_username(self):
+        return f'new{next(self.usernames)}'
+
+    def test_home(self):
+        self.assertWithinBudget('get', 'home')
+        self.assertWithinBudget('get', 'home', login=True)
+
+    def test_locator(self):
+        self.assertWithinBudget('get', 'locator')
+        self.assertWithinBudget('get', 'locator', {'search_type': 'city', 'search_query': 'bangalore', 'accepts': 'laptop'})
+        self.assertWithinBudget('get', 'locator', {'search_type': 'pincode', 'search_query': '560001'})
+        self.assertWithinBudget(
+            'get', 'locator', {'search_type': 'city', 'search_query': 'bangalore', 'accepts': 'laptop'}, login=True,
+        )
+
+    def test_learn(self):
+        self.assertWithinBudget('get', 'learn', login=True)
+        self.assertWithinBudget('get', 'learn', {'id': self.component.pk}, login=True)
+
+    def test_estimate(self):
+        self.assertWithinBudget('get', 'estimate')
+        self.assertWithinBudget('post', 'estimate', {'brand': 'acme', 'model_name': 'phone1'}, login=True)
+
+    def test_dashboard(self):
+        self.assertWithinBudget('get', 'dashboard', login=True)
+        self.assertWithinBudget('get', 'dashboard', {'board': 'week'}, login=True)
+        self.assertWithinBudget('post', 'dashboard', {'device': self.device.pk}, login=True, status=302)
+
+    def test_register(self):
+        self.assertWithinBudget('get', 'register')
+        self.assertWithinBudget('post', 'register', lambda: {
+            'username': self.next_username(), 'email': 'new@example.com',
+            'password1': 'Sturdy-pass-123', 'password2': 'Sturdy-pass-123',
+        }, status=302)
+
+    def test_login(self):
+        self.assertWithinBudget('get', 'login')
+        self.assertWithinBudget('post', 'login', {'username': 'budget', 'password': 'secret-pass-1'}, status=302)
+
+    def test_logout(self):
+        self.assertWithinBudget('post', 'logout', login=True, status=302)
+
+    def test_facilities_json(self):
+        self.assertWithinBudget('get', 'facilities_json')
+
+    def test_facilities_export(self):
+        self.assertWithinBudget('get', 'facilities_export')
+        self.assertWithinBudget('get', 'facilities_export', {'format': 'ndjson'})
+
+    def test_facilities_nearby(self):
+        self.assertWithinBudget('get', 'facilities_nearby', {'lat': '12.97', 'lng': '77.59', 'accepts': 'laptop'})
+
+    def test_facilities_nearest_batch(self):
+        body = '{"locations": [{"lat": 12.97, "lng": 77.59}, {"lat": 13.0, "lng": 77.6}], "k": 3}'
+        self.assertWithinBudget('post', 'facilities_nearest_batch', body)
+
+    def test_facilities_clusters(self):
+        self.assertWithinBudget('get', 'facilities_clusters', {'zoom': 5, 'bbox': '0,60,30,90'})
+
+    def test_facility_tile(self):
+        for fmt in tiles.TILE_FORMATS:
+            self.assertWithinBudget('get', 'facility_tile', z=10, x=732, y=474, fmt=fmt)
+
+    def test_devices_autocomplete(self):
+        self.assertWithinBudget('get', 'devices_autocomplete', {'q': 'ac'})
+
+    def test_devices_picker(self):
+        self.assertWithinBudget('get', 'devices_picker', {'q': 'phone'})
+
+    def test_estimate_batch(self):
+        body = '{"items": [{"brand": "Acme", "model_name": "Phone 1", "quantity": 2}]}'
+        self.assertWithinBudget('post', 'estimate_batch', body)
+
+    def test_assert_query_budget(self):
+        rank_service.loaded_at = None
+        with assert_query_budget(1, 'Cold rank lookup') as counter:
+            rank_service.rank(10)
+        self.assertEqual(counter.count, 1)
+        with assert_query_budget(0, 'Warm rank lookup'):
+            rank_service.rank(10)
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_query_budget(0):
+                Facility.objects.count()
@@ -0,0 +1,249 @@
+"""
+Facility map tiles in Mapbox Vector Tile (.pbf) and GeoJSON formats
+Tiles with facilities are cached on disk under FACILITY_TILE_CACHE_DIR,
+at most about FACILITY_TILE_CACHE_MAX_FILES of them (the oldest are
+evicted first), and the tiles covering a facility are deleted whenever
+that facility changes. Empty tiles share one body and are never stored
+"""
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+
+from .clustering import TILE_SIZE, project
+
+TILE_FORMATS = {
+    'pbf': 'application/vnd.mapbox-vector-tile',
+    'geojson': 'application/geo+json',
+}
+MAX_TILE_ZOOM = 18
+MVT_EXTENT = 4096
+MVT_LAYER = 'facilities'
+TILE_PROPERTIES = ('id', 'name', 'city', 'pincode')
+
+
+def tile_bounds(z, x, y):
+    """(min_lat, min_lng, max_lat, max_lng) covered by a tile"""
+    n = 1 << z
+
+    def lat_at(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat_at(y + 1), x / n * 360.0 - 180.0, lat_at(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_for(lat, lng, z):
+    """(x, y) of the tile containing (lat, lng) at zoom z"""
+    px, py = project(float(lat), float(lng), z)
+    last = (1 << z) - 1
+    return min(int(px // TILE_SIZE), last), min(int(py // TILE_SIZE), last)
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+
+def tile_facilities(z, x, y):
+    """Facility rows inside a tile, as dicts with coordinates and properties"""
+    from .models import Facility
+
+    min_lat, min_lng, max_lat, max_lng = tile_bounds(z, x, y)
+    rows = Facility.objects.filter(
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lng, max_lng),
+    ).order_by('id').values('latitude', 'longitude', *TILE_PROPERTIES)
+    # Range filters are inclusive, so drop points owned by a neighbour tile
+    return [row for row in rows if tile_for(row['latitude'], row['longitude'], z) == (x, y)]
+
+
+def render_geojson(z, x, y, rows):
+    features = [{
+        'type': 'Feature',
+        'id': row['id'],
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [float(row['longitude']), float(row['latitude'])],
+        },
+        'properties': {key: row[key] for key in TILE_PROPERTIES},
+    } for row in rows]
+    return json.dumps({'type': 'FeatureCollection', 'features': features}).encode()
+
+
+# Minimal protobuf writer covering the parts of the MVT spec we need
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number, payload):
+    """Length-delimited field"""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _packed(number, values):
+    return _field(number, b''.join(_varint(v) for v in values))
+
+
+def render_mvt(z, x, y, rows):
+    keys = list(TILE_PROPERTIES[1:])
+    values = []
+    value_index = {}
+    features = b''
+    origin_x, origin_y = x * TILE_SIZE, y * TILE_SIZE
+    scale = MVT_EXTENT / TILE_SIZE
+
+    for row in rows:
+        px, py = project(float(row['latitude']), float(row['longitude']), z)
+        tx = int(round((px - origin_x) * scale))
+        ty = int(round((py - origin_y) * scale))
+        tags = []
+        for key_id, key in enumerate(keys):
+            value = str(row[key])
+            if value not in value_index:
+                value_index[value] = len(values)
+                values.append(value)
+            tags += [key_id, value_index[value]]
+        feature = (
+            _uint_field(1, row['id'])
+            + _packed(2, tags)
+            + _uint_field(3, 1)  # POINT
+            + _packed(4, [9, _zigzag(tx), _zigzag(ty)])  # MoveTo(1)
+        )
+        features += _field(2, feature)
+
+    layer = (
+        _uint_field(15, 2)
+        + _field(1, MVT_LAYER.encode())
+        + features
+        + b''.join(_field(3, key.encode()) for key in keys)
+        + b''.join(_field(4, _field(1, value.encode())) for value in values)
+        + _uint_field(5, MVT_EXTENT)
+    )
+    return _field(3, layer)
+
+
+RENDERERS = {
+    'pbf': render_mvt,
+    'geojson': render_geojson,
+}
+# Neither body depends on the tile coordinates when there are no features
+EMPTY_TILES = {fmt: render(0, 0, 0, []) for fmt, render in RENDERERS.items()}
+
+
+def cache_dir():
+    return settings.FACILITY_TILE_CACHE_DIR
+
+
+def tile_path(z, x, y, fmt):
+    return os.path.join(cache_dir(), str(z), str(x), f'{y}.{fmt}')
+
+
+def _cached_tiles():
+    """Paths of every tile in the cache, skipping half-written temp files"""
+    for root, _, names in os.walk(cache_dir()):
+        for name in names:
+            if name.rpartition('.')[2] in TILE_FORMATS:
+                yield os.path.join(root, name)
+
+
+class TileCacheSize:
+    """
+    Approximate number of cached tiles, counted once per process and
+    then per write; past the cap the oldest quarter of tiles is evicted
+    """
+
+    def __init__(self):
+        self.count = None
+        self._lock = threading.Lock()
+
+    def added(self):
+        with self._lock:
+            if self.count is None:
+                self.count = sum(1 for _ in _cached_tiles())
+            self.count += 1
+            limit = settings.FACILITY_TILE_CACHE_MAX_FILES
+            if self.count > limit:
+                self.count = self._evict(limit * 3 // 4)
+
+    def _evict(self, keep):
+        """Delete the least recently written tiles, return how many are left"""
+        dated = []
+        for path in _cached_tiles():
+            try:
+                dated.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                pass
+        dated.sort()
+        for _, path in dated[:max(len(dated) - keep, 0)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return min(len(dated), keep)
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+
+tile_cache_size = TileCacheSize()
+
+
+def get_tile(z, x, y, fmt):
+    """Return tile bytes, rendering and caching them on a miss"""
+    path = tile_path(z, x, y, fmt)
+    try:
+        with open(path, 'rb') as fh:
+            return fh.read()
+    except FileNotFoundError:
+        pass
+
+    rows = tile_facilities(z, x, y)
+    if not rows:
+        # Most tiles of the world are empty; caching them would only fill the disk
+        return EMPTY_TILES[fmt]
+    data = RENDERERS[fmt](z, x, y, rows)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so readers never see a partial tile
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+    tile_cache_size.added()
+    return data
+
+
+def invalidate_point(lat, lng):
+    """Delete every cached tile that contains (lat, lng)"""
+    for z in range(MAX_TILE_ZOOM + 1):
+        x, y = tile_for(lat, lng, z)
+        for fmt in TILE_FORMATS:
+            try:
+                os.remove(tile_path(z, x, y, fmt))
+            except FileNotFoundError:
+                pass
+
+
+def clear_cache():
+    """Delete every cached tile, e.g. after a bulk import"""
+    shutil.rmtree(cache_dir(), ignore_errors=True)
+    tile_cache_size.reset()
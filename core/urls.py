@@ -18,4 +18,14 @@ urlpatterns = [
     
     # API Endpoints
     path('api/facilities/', views.facilities_json, name='facilities_json'),
+    path('api/facilities/export/', views.facilities_export, name='facilities_export'),
+    path('api/facilities/nearby/', views.facilities_nearby, name='facilities_nearby'),
+    path('api/facilities/clusters/', views.facilities_clusters, name='facilities_clusters'),
+    path('api/facilities/nearest/batch/', views.facilities_nearest_batch, name='facilities_nearest_batch'),
+    path('api/devices/autocomplete/', views.devices_autocomplete, name='devices_autocomplete'),
+    path('api/devices/picker/', views.devices_picker, name='devices_picker'),
+    path('api/estimate/batch/', views.estimate_batch, name='estimate_batch'),
+
+    # Map Tiles
+    path('tiles/<int:z>/<int:x>/<int:y>.<str:fmt>', views.facility_tile, name='facility_tile'),
 ]
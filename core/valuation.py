@@ -0,0 +1,74 @@
+"""
+Device valuation from metal content and a configurable price table
+Values for many devices are computed in one NumPy pass, and stored
+values are refreshed with bulk_update instead of per-object save()
+"""
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+METALS = ('gold', 'silver', 'copper')
+
+
+def metal_prices(overrides=None):
+    """Current INR-per-gram prices, optionally overriding some metals"""
+    prices = dict(settings.METAL_PRICES)
+    prices.update({metal: price for metal, price in (overrides or {}).items() if price is not None})
+    return prices
+
+
+def compute_values(content_mg, prices=None):
+    """
+    Recovery values in INR for an (n, 3) array of gold/silver/copper mg
+    Returns a float array rounded to paise
+    """
+    prices = metal_prices() if prices is None else prices
+    price_vector = np.array([prices[metal] for metal in METALS], dtype=np.float64) / 1000.0
+    content = np.asarray(content_mg, dtype=np.float64).reshape(-1, len(METALS))
+    return np.round(content @ price_vector, 2)
+
+
+def device_metal_arrays(queryset=None):
+    """(ids, (n, 3) metal content in mg, stored values) for devices"""
+    from .models import Device
+
+    queryset = Device.objects.all() if queryset is None else queryset
+    rows = list(queryset.order_by('id').values_list(
+        'id', 'gold_mg', 'silver_mg', 'copper_mg', 'estimated_value'
+    ))
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    content = np.array([row[1:4] for row in rows], dtype=np.float64).reshape(-1, len(METALS))
+    stored = np.array([row[4] for row in rows], dtype=np.float64)
+    return ids, content, stored
+
+
+def recompute_device_values(prices=None, batch_size=500, dry_run=False):
+    """
+    Recompute every Device.estimated_value from its metal content
+    Only changed rows are written, in bulk_update batches
+    Returns the number of devices whose value changed
+    """
+    from .models import Device
+
+    ids, content, stored = device_metal_arrays()
+    values = compute_values(content, prices)
+    changed = np.nonzero(np.abs(values - stored) >= 0.005)[0]
+    if dry_run or not len(changed):
+        return len(changed)
+
+    now = timezone.now()
+    devices = [
+        Device(pk=pk, estimated_value=f'{value:.2f}', updated_at=now)
+        for pk, value in zip(ids[changed].tolist(), values[changed].tolist())
+    ]
+    Device.objects.bulk_update(devices, ['estimated_value', 'updated_at'], batch_size=batch_size)
+    # bulk_update skips signals, so drop the caches that show values here
+    if devices:
+        from .device_search import device_catalog
+        from .query_cache import invalidate_devices
+        from .revisions import dataset_revisions
+
+        device_catalog.invalidate()
+        invalidate_devices()
+        dataset_revisions.bump('devices')
+    return len(devices)
@@ -1,130 +1,284 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
+from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
-from django.http import JsonResponse
-from .models import Facility, ComponentInfo, Device, UserProfile
-from .forms import DeviceSearchForm, FacilitySearchForm, UserRegistrationForm, RecycleDeviceForm
-import random
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, set_response_etag
+from django.utils.text import compress_sequence
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+from .models import Facility, Device, LeaderboardEntry, UserProfile, normalize_city, normalize_pincode
+from .forms import DEVICE_PICKER_PAGE_SIZE, DeviceSearchForm, FacilitySearchForm, UserRegistrationForm, RecycleDeviceForm
+from .clustering import ClusterPyramid, facility_clusters
+from .components import component_pool
+from .conditional import component_version, facility_version
+from .export import ENCODERS, EXPORT_FORMATS, iter_rows
+from .device_search import compact, device_catalog, device_index, suggestion_index
+from .distance import facility_coordinates
+from .items import item_index, normalize_item, parse_accepts_param
+from .leaderboard import get_leaderboard
+from .valuation import METALS
+from .pincodes import pincode_centroids
+from .search import search_facility_ids
+from .query_budget import query_budget
+from .query_cache import device_queries, facility_queries, facility_scopes
+from .spatial import facility_index
+from .stats import get_home_stats
+from . import tiles
+import base64
+import copy
+import json
+import math
+from decimal import Decimal
+
+
+# Result limits for the nearby facilities API
+DEFAULT_NEARBY_RESULTS = 10
+MAX_NEARBY_RESULTS = 100
+MAX_BATCH_LOCATIONS = 1000
+MAX_SUGGESTIONS = 20
+MAX_ESTIMATE_ITEMS = 500
+MAX_ESTIMATE_QUANTITY = 100000
+
+# Page sizes and selectable fields for the facilities API
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+FACILITY_FIELDS = (
+    'id', 'name', 'address', 'city', 'pincode',
+    'latitude', 'longitude', 'contact', 'accepted_items',
+)
 
 
 # Home Page View
+@query_budget(5)
 def home(request):
     """
     Landing page with overview and call-to-action buttons
     Shows statistics and featured information
     """
-    try:
-        total_facilities = Facility.objects.count()
-        total_devices = Device.objects.count()
-        total_users = UserProfile.objects.count()
-    except Exception as e:
-        # If database tables don't exist yet, use default values
-        print(f"Warning: Could not fetch counts from database: {e}")
-        total_facilities = 0
-        total_devices = 0
-        total_users = 0
-    
-    context = {
-        'total_facilities': total_facilities,
-        'total_devices': total_devices,
-        'total_users': total_users,
-    }
+    # Counts come from the stats cache, kept current by model signals
+    context = get_home_stats()
     return render(request, 'core/home.html', context)
 
 
 # Facility Locator View
+@query_budget(6)
 def facility_locator(request):
     """
     Display e-waste facilities on an interactive map
-    Supports filtering by city or pincode
+    Supports filtering by city or pincode, ranked full-text search and
+    sorting by distance
+    A full PIN code lists the facilities nearest to its centroid
     """
     form = FacilitySearchForm(request.GET or None)
-    facilities = Facility.objects.all()
+    search_type = search_query = accepts = lat = lng = None
     
     # Apply search filters
     if form.is_valid():
         search_type = form.cleaned_data.get('search_type')
         search_query = form.cleaned_data.get('search_query')
-        
-        if search_type == 'city' and search_query:
-            facilities = facilities.filter(city__icontains=search_query)
-        elif search_type == 'pincode' and search_query:
-            facilities = facilities.filter(pincode__icontains=search_query)
+        accepts = form.cleaned_data.get('accepts')
+        lat = form.cleaned_data.get('lat')
+        lng = form.cleaned_data.get('lng')
+
+    facilities = cached_locator_facilities(search_type, search_query, accepts)
+
+    # Sort by distance from the user's location when it is known
+    if lat is not None and lng is not None:
+        facilities = sort_by_distance(facilities, lat, lng)
+
+    # The map loads clusters from the API, so only ship the bounds to fit
+    map_bounds = None
+    if search_query or accepts:
+        if facilities:
+            lats = [f.latitude for f in facilities]
+            lngs = [f.longitude for f in facilities]
+            map_bounds = [
+                [float(min(lats)), float(min(lngs))],
+                [float(max(lats)), float(max(lngs))],
+            ]
+    
+    # The rendered list is cached per dataset version and search; PIN code
+    # searches also depend on the centroid file
+    facility_list_key = facility_version.etag(json.dumps([
+        search_type,
+        normalize_city(search_query) if search_query else None,
+        sorted({normalize_item(item) for item in parse_accepts_param(accepts)}),
+        lat,
+        lng,
+        pincode_centroids.version() if search_type == 'pincode' else None,
+    ], default=str))
     
     context = {
         'form': form,
         'facilities': facilities,
+        'map_bounds': map_bounds,
+        'facility_list_key': facility_list_key,
     }
     return render(request, 'core/locator.html', context)
 
 
+def cached_locator_facilities(search_type, search_query, accepts):
+    """
+    Facilities matching the locator filters, from the query cache
+    The returned list is shared with other requests, so copy before
+    changing any facility on it
+    """
+    if search_type not in ('city', 'pincode', 'anywhere') or not search_query:
+        search_type = search_query = None
+    accepts = parse_accepts_param(accepts)
+
+    # A full PIN code with a known centroid becomes a nearest-facility query
+    centroid = pincode_centroids.lookup(search_query) if search_type == 'pincode' else None
+    if centroid is not None:
+        return facility_queries.get_or_set(
+            {'pincode_centroid': centroid, 'accepts': sorted({normalize_item(item) for item in accepts})},
+            facility_scopes(),
+            lambda: facilities_near_centroid(centroid, accepts),
+        )
+
+    def query():
+        facilities = Facility.objects.all()
+        if search_type == 'anywhere':
+            return ranked_search_results(search_query, accepts)
+        if search_type == 'city':
+            facilities = facilities.in_city(search_query)
+        elif search_type == 'pincode':
+            facilities = facilities.with_pincode_prefix(search_query)
+        if accepts:
+            facilities = facilities.filter(id__in=item_index.facilities_accepting(accepts))
+        return list(facilities)
+
+    params = {
+        'search_type': search_type,
+        'search_query': normalize_city(search_query) if search_query else None,
+        'accepts': sorted({normalize_item(item) for item in accepts}),
+    }
+    scopes = facility_scopes(
+        city=search_query if search_type == 'city' else None,
+        pincode=search_query if search_type == 'pincode' else None,
+    )
+    return facility_queries.get_or_set(params, scopes, query)
+
+
+def learn_etag(request):
+    """Only a specific ?id= page is cacheable; random picks never are"""
+    if not request.GET.get('id'):
+        return None
+    return component_version.etag(request.GET['id'], request.user.pk or 0)
+
+
+def learn_last_modified(request):
+    if not request.GET.get('id'):
+        return None
+    return component_version.last_modified()
+
+
 # Educational Pop-ups View
+@condition(etag_func=learn_etag, last_modified_func=learn_last_modified)
+@query_budget(4)
 def learn(request):
     """
     Display random harmful component information
     Educational feature about e-waste dangers
     """
-    components = ComponentInfo.objects.all()
-    
-    if components.exists():
-        # Get a random component or the one requested
-        component_id = request.GET.get('id')
-        if component_id:
-            component = get_object_or_404(ComponentInfo, id=component_id)
-        else:
-            component = random.choice(components)
+    # Get a random component or the one requested; with no components at
+    # all the page explains that instead, whatever ?id= asked for
+    component_id = request.GET.get('id')
+    if component_id and len(component_pool):
+        component = component_pool.get(int(component_id)) if component_id.isdecimal() else None
+        if component is None:
+            raise Http404("No component matches the given query.")
     else:
-        component = None
+        component = component_pool.random()
     
     context = {
         'component': component,
-        'total_components': components.count(),
+        'component_version': component_version.etag(),
+        'total_components': len(component_pool),
     }
     return render(request, 'core/learn.html', context)
 
 
 # Device Value Estimator View
+@query_budget(5)
 def estimate(request):
     """
     Estimate device value based on brand and model
+    Tolerates typos and spacing, and suggests close matches
     Shows metal content and potential earnings
     """
     form = DeviceSearchForm(request.POST or None)
     device = None
+    suggestions = []
     not_found = False
     
     if request.method == 'POST' and form.is_valid():
         brand = form.cleaned_data['brand']
         model_name = form.cleaned_data['model_name']
         
-        # Search for device (case-insensitive)
-        try:
-            device = Device.objects.get(
-                brand__iexact=brand,
-                model_name__icontains=model_name
-            )
-        except Device.DoesNotExist:
+        device, suggestions = cached_device_lookup(brand, model_name)
+        if device is None:
             not_found = True
             messages.warning(request, f"Device '{brand} {model_name}' not found in our database.")
-        except Device.MultipleObjectsReturned:
-            # If multiple matches, get the first one
-            device = Device.objects.filter(
-                brand__iexact=brand,
-                model_name__icontains=model_name
-            ).first()
     
     context = {
         'form': form,
         'device': device,
+        'suggestions': suggestions,
         'not_found': not_found,
     }
     return render(request, 'core/estimate.html', context)
 
 
+def ranked_search_results(search_query, accepts):
+    """Full-text matches for the locator, best first"""
+    ids = search_facility_ids(search_query)
+    if accepts:
+        allowed = item_index.facilities_accepting(accepts)
+        ids = [pk for pk in ids if pk in allowed]
+    facilities = Facility.objects.in_bulk(ids)
+    return [facilities[pk] for pk in ids if pk in facilities]
+
+
+def facilities_near_centroid(centroid, accepts):
+    """Facilities closest to a PIN code centroid, with `distance_km` set"""
+    allowed = item_index.facilities_accepting(accepts) if accepts else None
+    matches = facility_index.nearest(
+        *centroid,
+        k=settings.PINCODE_SEARCH_RESULTS,
+        radius_km=settings.PINCODE_SEARCH_RADIUS_KM,
+        allowed=allowed,
+    )
+    facilities = Facility.objects.in_bulk([pk for pk, _ in matches])
+    nearest = []
+    for pk, distance in matches:
+        if pk in facilities:
+            facilities[pk].distance_km = round(distance, 1)
+            nearest.append(facilities[pk])
+    return nearest
+
+
+def cached_device_lookup(brand, model_name):
+    """
+    (best matching device or None, other close devices) for a brand and
+    model query, cached under the compacted names the matcher compares
+    """
+    def query():
+        # Rank devices by fuzzy similarity, then fetch the matches by id
+        best, others = device_index.best_match(brand, model_name)
+        matches = Device.objects.in_bulk([pk for pk in [best, *others] if pk is not None])
+        return matches.get(best), [matches[pk] for pk in others if pk in matches]
+
+    params = {'brand': compact(brand), 'model_name': compact(model_name)}
+    return device_queries.get_or_set(params, ['device:all'], query)
+
+
 # User Dashboard View
 @login_required
+@query_budget(8)
 def dashboard(request):
     """
     User dashboard showing recycling statistics and gamification
@@ -144,19 +298,28 @@ def dashboard(request):
         )
         return redirect('core:dashboard')
     
-    # Get leaderboard (top 5 users)
-    leaderboard = UserProfile.objects.all()[:5]
+    # Precomputed leaderboard snapshot for the selected window
+    leaderboard = get_leaderboard(request.GET.get('board', 'all'))
+    totals = profile.get_totals()
     
     context = {
         'profile': profile,
+        'totals': totals,
         'recycle_form': recycle_form,
         'leaderboard': leaderboard,
-        'user_rank': profile.get_rank(),
+        'leaderboard_windows': LeaderboardEntry.WINDOW_CHOICES,
+        # Rendered rows are shared by every viewer not on the board
+        'leaderboard_viewer': request.user.pk if any(
+            entry['user_id'] == request.user.pk for entry in leaderboard['entries']
+        ) else 0,
+        'leaderboard_cache_timeout': settings.LEADERBOARD_CACHE_TIMEOUT,
+        'user_rank': profile.get_rank(totals['points']),
     }
     return render(request, 'core/dashboard.html', context)
 
 
 # User Registration View
+@query_budget(12)
 def register(request):
     """
     User registration page
@@ -178,6 +341,7 @@ def register(request):
 
 
 # User Login View
+@query_budget(9)
 def user_login(request):
     """
     User login page
@@ -203,6 +367,7 @@ def user_login(request):
 
 
 # User Logout View
+@query_budget(5)
 def user_logout(request):
     """
     Logout user and redirect to home
@@ -213,24 +378,205 @@ def user_logout(request):
 
 
 # API endpoint for facilities (AJAX/JSON)
+@condition(
+    etag_func=lambda request: facility_version.etag(),
+    last_modified_func=lambda request: facility_version.last_modified(),
+)
+@query_budget(5)
 def facilities_json(request):
     """
     Return facilities as JSON for map markers
     Used by Leaflet.js in the frontend
+    Supports ?bbox=min_lat,min_lng,max_lat,max_lng, ?fields=id,latitude,...,
+    ?accepts=laptop,battery and keyset pagination with ?limit= and ?cursor=
+    Unchanged data is answered with 304 Not Modified from the ETag or
+    Last-Modified the client sends back
     """
-    facilities = Facility.objects.all()
-    
-    # Apply filters if provided
     city = request.GET.get('city')
     pincode = request.GET.get('pincode')
+    accepts = parse_accepts_param(request.GET.get('accepts'))
+
+    try:
+        bbox = parse_bbox_param(request.GET)
+        fields = parse_fields_param(request.GET)
+        cursor = decode_cursor(request.GET.get('cursor'))
+        limit = parse_float_param(request.GET, 'limit', 1, MAX_PAGE_SIZE, required=False)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    params = {
+        'city': normalize_city(city) if city else None,
+        'pincode': normalize_pincode(pincode) if pincode else None,
+        'accepts': sorted({normalize_item(item) for item in accepts}),
+        'bbox': bbox,
+        'fields': fields,
+        'cursor': cursor,
+        'limit': limit,
+    }
+    data = facility_queries.get_or_set(
+        params,
+        facility_scopes(city=city, pincode=pincode),
+        lambda: query_facilities_json(city, pincode, accepts, bbox, fields, cursor, limit),
+    )
+    response = JsonResponse(data, safe=False)
+    # Let polling clients revalidate every time; most polls end in a 304
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def query_facilities_json(city, pincode, accepts, bbox, fields, cursor, limit):
+    """Build the facilities API payload for already validated parameters"""
+    facilities = Facility.objects.all()
     
+    # Apply filters if provided
     if city:
-        facilities = facilities.filter(city__icontains=city)
+        facilities = facilities.in_city(city)
     if pincode:
-        facilities = facilities.filter(pincode__icontains=pincode)
-    
-    # Format data for JSON response
-    data = [{
+        facilities = facilities.with_pincode_prefix(pincode)
+    if accepts:
+        facilities = facilities.filter(id__in=item_index.facilities_accepting(accepts))
+
+    if bbox is not None:
+        min_lat, min_lng, max_lat, max_lng = bbox
+        facilities = facilities.filter(
+            latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lng, max_lng),
+        )
+
+    paginate = limit is not None or cursor is not None
+    if not paginate:
+        return [format_facility_row(row, fields) for row in facilities.values(*fields)]
+
+    # Keyset pagination on (city, name, id), matching Facility.Meta.ordering
+    # with the id as a tie-breaker so pages never skip or repeat rows
+    limit = int(limit or DEFAULT_PAGE_SIZE)
+    if cursor is not None:
+        last_city, last_name, last_id = cursor
+        facilities = facilities.filter(
+            Q(city__gt=last_city)
+            | Q(city=last_city, name__gt=last_name)
+            | Q(city=last_city, name=last_name, id__gt=last_id)
+        )
+    keys = ('city', 'name', 'id')
+    rows = list(
+        facilities.order_by(*keys).values(*dict.fromkeys(fields + keys))[:limit + 1]
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][key] for key in keys])
+
+    return {
+        'results': [format_facility_row(row, fields) for row in rows],
+        'next_cursor': next_cursor,
+    }
+
+
+def accepts_gzip(request):
+    return 'gzip' in request.headers.get('Accept-Encoding', '')
+
+
+def export_etag(request):
+    # Gzipped and plain bodies are different representations
+    return facility_version.etag(request.GET.get('format', 'json'), 'gzip' if accepts_gzip(request) else 'identity')
+
+
+# Streaming export of the facility directory
+@condition(
+    etag_func=export_etag,
+    last_modified_func=lambda request: facility_version.last_modified(),
+)
+@query_budget(3)
+def facilities_export(request):
+    """
+    Stream every facility as a JSON array or, with ?format=ndjson, as
+    newline-delimited JSON; gzip-compressed when the client accepts it
+    Takes the same ?city=, ?pincode=, ?accepts= and ?fields= filters
+    as the facilities API
+    """
+    fmt = request.GET.get('format', 'json')
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({'error': f"'format' must be one of {', '.join(EXPORT_FORMATS)}"}, status=400)
+    try:
+        fields = parse_fields_param(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    facilities = Facility.objects.order_by('id')
+    if request.GET.get('city'):
+        facilities = facilities.in_city(request.GET['city'])
+    if request.GET.get('pincode'):
+        facilities = facilities.with_pincode_prefix(request.GET['pincode'])
+    accepts = parse_accepts_param(request.GET.get('accepts'))
+    if accepts:
+        facilities = facilities.filter(id__in=item_index.facilities_accepting(accepts))
+
+    chunks = (chunk.encode() for chunk in ENCODERS[fmt](iter_rows(facilities, fields)))
+    response = StreamingHttpResponse(content_type=EXPORT_FORMATS[fmt])
+    if accepts_gzip(request):
+        chunks = compress_sequence(chunks)
+        response['Content-Encoding'] = 'gzip'
+    response.streaming_content = chunks
+    response['Content-Disposition'] = f'inline; filename="facilities.{fmt}"'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def parse_fields_param(params):
+    """Read ?fields= as a tuple of facility field names"""
+    raw = params.get('fields')
+    if not raw:
+        return FACILITY_FIELDS
+    fields = tuple(dict.fromkeys(part.strip() for part in raw.split(',') if part.strip()))
+    unknown = [field for field in fields if field not in FACILITY_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"'fields' must be chosen from {', '.join(FACILITY_FIELDS)}")
+    return fields
+
+
+def format_facility_row(row, fields):
+    """Build a JSON-ready dict from a .values() row"""
+    data = {field: row[field] for field in fields}
+    for field in ('latitude', 'longitude'):
+        if field in data:
+            data[field] = float(data[field])
+    return data
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe page cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(raw):
+    """Inverse of encode_cursor, raising ValueError on tampered input"""
+    if not raw:
+        return None
+    try:
+        city, name, pk = json.loads(base64.urlsafe_b64decode(raw.encode()))
+        return str(city), str(name), int(pk)
+    except (ValueError, TypeError):
+        raise ValueError("'cursor' is invalid")
+
+
+def sort_by_distance(facilities, lat, lng):
+    """
+    Order facility objects nearest first, setting `distance_km` on each
+    Distances come from one vectorized pass over the coordinate arrays
+    """
+    by_id = {f.id: f for f in facilities}
+    ranked = []
+    for pk, distance in facility_coordinates.rank(lat, lng, by_id):
+        # Copied, as the facilities may be shared through the query cache
+        facility = copy.copy(by_id[pk])
+        facility.distance_km = round(distance, 1)
+        ranked.append(facility)
+    return ranked
+
+
+def serialize_facility(f):
+    """Format a facility as a JSON-ready dict"""
+    return {
         'id': f.id,
         'name': f.name,
         'address': f.address,
@@ -240,6 +586,291 @@ def facilities_json(request):
         'longitude': float(f.longitude),
         'contact': f.contact,
         'accepted_items': f.accepted_items,
-    } for f in facilities]
-    
+    }
+
+
+def parse_float_param(params, name, minimum, maximum, default=None, required=True):
+    """
+    Read a float query parameter, raising ValueError with a readable
+    message if it is missing, malformed or out of range
+    """
+    raw = params.get(name)
+    if raw in (None, ''):
+        if required:
+            raise ValueError(f"'{name}' is required")
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        raise ValueError(f"'{name}' must be a number")
+    if not math.isfinite(value):
+        raise ValueError(f"'{name}' must be a finite number")
+    if not minimum <= value <= maximum:
+        raise ValueError(f"'{name}' must be between {minimum} and {maximum}")
+    return value
+
+
+def parse_bbox_param(params, name='bbox'):
+    """
+    Read a `min_lat,min_lng,max_lat,max_lng` bounding box parameter
+    Returns None when absent and raises ValueError when malformed
+    """
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(part) for part in raw.split(','))
+    except ValueError:
+        raise ValueError(f"'{name}' must be min_lat,min_lng,max_lat,max_lng")
+    if not all(math.isfinite(part) for part in (min_lat, min_lng, max_lat, max_lng)):
+        raise ValueError(f"'{name}' must only contain finite numbers")
+    if min_lat > max_lat or min_lng > max_lng:
+        raise ValueError(f"'{name}' minimums must not exceed maximums")
+    return (
+        max(min_lat, -90.0), max(min_lng, -180.0),
+        min(max_lat, 90.0), min(max_lng, 180.0),
+    )
+
+
+# API endpoint for nearest facilities
+@query_budget(3)
+def facilities_nearby(request):
+    """
+    Return the facilities closest to ?lat=&lng=, nearest first
+    Optional ?k= caps the result count, ?radius_km= the search radius and
+    ?accepts=laptop,battery limits results to facilities taking those items
+    """
+    try:
+        lat = parse_float_param(request.GET, 'lat', -90, 90)
+        lng = parse_float_param(request.GET, 'lng', -180, 180)
+        radius_km = parse_float_param(request.GET, 'radius_km', 0, 20040, required=False)
+        k = int(parse_float_param(request.GET, 'k', 1, MAX_NEARBY_RESULTS, default=DEFAULT_NEARBY_RESULTS, required=False))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    accepts = parse_accepts_param(request.GET.get('accepts'))
+    allowed = item_index.facilities_accepting(accepts) if accepts else None
+    matches = facility_index.nearest(lat, lng, k=k, radius_km=radius_km, allowed=allowed)
+    facilities = Facility.objects.in_bulk([pk for pk, _ in matches])
+
+    data = []
+    for pk, distance in matches:
+        if pk in facilities:
+            item = serialize_facility(facilities[pk])
+            item['distance_km'] = round(distance, 3)
+            data.append(item)
+
     return JsonResponse(data, safe=False)
+
+
+# API endpoint for nearest facilities to many locations at once
+@csrf_exempt
+@require_POST
+@query_budget(3)
+def facilities_nearest_batch(request):
+    """
+    Return the k nearest facilities for each location in a JSON body:
+    {"locations": [{"lat": .., "lng": ..}, ...], "k": 1, "radius_km": ..,
+     "accepts": "laptop,battery"}
+    Results are returned in the same order as the locations
+    """
+    try:
+        payload = json.loads(request.body)
+        locations = payload['locations']
+        if not isinstance(locations, list) or len(locations) > MAX_BATCH_LOCATIONS:
+            raise ValueError(f"'locations' must be a list of at most {MAX_BATCH_LOCATIONS} points")
+        origins = [
+            (parse_float_param(loc, 'lat', -90, 90), parse_float_param(loc, 'lng', -180, 180))
+            for loc in locations
+        ]
+        k = int(parse_float_param(payload, 'k', 1, MAX_NEARBY_RESULTS, default=1, required=False))
+        radius_km = parse_float_param(payload, 'radius_km', 0, 20040, required=False)
+        accepts = parse_accepts_param(payload.get('accepts'))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return JsonResponse({'error': f"Invalid request body: {e}"}, status=400)
+
+    allowed = item_index.facilities_accepting(accepts) if accepts else None
+    matches = facility_coordinates.nearest_many(origins, k=k, radius_km=radius_km, pks=allowed)
+    wanted = {pk for row in matches for pk, _ in row}
+    facilities = Facility.objects.in_bulk(wanted)
+
+    results = []
+    for row in matches:
+        results.append([{
+            'id': pk,
+            'name': facilities[pk].name,
+            'city': facilities[pk].city,
+            'pincode': facilities[pk].pincode,
+            'distance_km': round(distance, 3),
+        } for pk, distance in row if pk in facilities])
+
+    return JsonResponse({'results': results})
+
+
+# API endpoint for map marker clusters
+@query_budget(3)
+def facilities_clusters(request):
+    """
+    Return pre-aggregated facility clusters for a map viewport
+    Expects ?bbox=min_lat,min_lng,max_lat,max_lng&zoom=
+    The locator's search_type, search_query and accepts parameters limit
+    the clusters to the facilities that search lists
+    Single-facility clusters carry the facility details for a popup
+    """
+    try:
+        bbox = parse_bbox_param(request.GET)
+        if bbox is None:
+            raise ValueError("'bbox' is required")
+        zoom = int(parse_float_param(request.GET, 'zoom', 0, 30))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Invalid filters are ignored, as the locator page ignores them
+    form = FacilitySearchForm(request.GET)
+    search_type = search_query = accepts = None
+    if form.is_valid():
+        search_type = form.cleaned_data.get('search_type')
+        search_query = form.cleaned_data.get('search_query')
+        accepts = form.cleaned_data.get('accepts')
+
+    if search_query or accepts:
+        # Clustered on the fly from the (cached) list the locator shows
+        facilities = cached_locator_facilities(search_type, search_query, accepts)
+        pyramid = ClusterPyramid.of((f.id, f.latitude, f.longitude) for f in facilities)
+        clusters = pyramid.clusters(zoom, *bbox)
+        singles = {f.id: f for f in facilities}
+    else:
+        clusters = facility_clusters.clusters(zoom, *bbox)
+        singles = Facility.objects.in_bulk([c['id'] for c in clusters if c['id'] is not None])
+    for cluster in clusters:
+        facility = singles.get(cluster.pop('id'))
+        if facility is not None:
+            cluster['facility'] = serialize_facility(facility)
+
+    return JsonResponse({'zoom': zoom, 'clusters': clusters})
+
+
+# Map tiles of facility points
+@query_budget(2)
+def facility_tile(request, z, x, y, fmt):
+    """
+    Serve one facility tile as a Mapbox Vector Tile or GeoJSON
+    Tiles are rendered on first request and then read from disk
+    """
+    if fmt not in tiles.TILE_FORMATS or not tiles.is_valid_tile(z, x, y):
+        raise Http404("No such tile")
+
+    response = HttpResponse(tiles.get_tile(z, x, y, fmt), content_type=tiles.TILE_FORMATS[fmt])
+    response['Cache-Control'] = f'public, max-age={settings.FACILITY_TILE_MAX_AGE}'
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+# API endpoint for device brand/model typeahead
+@query_budget(1)
+def devices_autocomplete(request):
+    """
+    Return brand and model suggestions starting with ?q=
+    Optional ?brand= restricts suggestions to that brand's models
+    Responses carry an ETag so unchanged suggestions come back as 304s
+    """
+    try:
+        limit = int(parse_float_param(request.GET, 'limit', 1, MAX_SUGGESTIONS, default=8, required=False))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    suggestions = suggestion_index.suggest(
+        request.GET.get('q', ''), brand=request.GET.get('brand'), limit=limit
+    )
+    response = JsonResponse({'suggestions': suggestions})
+    set_response_etag(response)
+    patch_cache_control(response, public=True, max_age=300)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+# API endpoint for the dashboard's device picker
+@query_budget(1)
+def devices_picker(request):
+    """
+    Return one page of (id, label) device choices matching ?q=
+    ?page= is zero-based; next_page is null on the last page
+    """
+    try:
+        page = int(parse_float_param(request.GET, 'page', 0, 100000, default=0, required=False))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    choices, has_more = device_catalog.page(
+        request.GET.get('q', ''), offset=page * DEVICE_PICKER_PAGE_SIZE, limit=DEVICE_PICKER_PAGE_SIZE
+    )
+    response = JsonResponse({
+        'results': [{'id': pk, 'label': label} for pk, label in choices],
+        'next_page': page + 1 if has_more else None,
+    })
+    set_response_etag(response)
+    patch_cache_control(response, private=True, max_age=60)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+# API endpoint for bulk device valuation quotes
+@csrf_exempt
+@require_POST
+@query_budget(3)
+def estimate_batch(request):
+    """
+    Value a list of devices at their stored estimated values, the same
+    figures the estimator page and recycling points use:
+    {"items": [{"brand": .., "model_name": .., "quantity": 1}, ...]}
+    Each item is matched with the fuzzy device index and all matched
+    devices are read in one query
+    """
+    try:
+        items = json.loads(request.body)['items']
+        if not isinstance(items, list) or len(items) > MAX_ESTIMATE_ITEMS:
+            raise ValueError(f"'items' must be a list of at most {MAX_ESTIMATE_ITEMS} entries")
+        requested = []
+        for item in items:
+            brand = str(item['brand']).strip()
+            model_name = str(item['model_name']).strip()
+            quantity = parse_float_param(item, 'quantity', 1, MAX_ESTIMATE_QUANTITY, default=1, required=False)
+            if quantity != int(quantity):
+                raise ValueError("'quantity' must be a whole number")
+            requested.append((brand, model_name, int(quantity)))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return JsonResponse({'error': f"Invalid request body: {e}"}, status=400)
+
+    matched = [device_index.best_match(brand, model_name)[0] for brand, model_name, _ in requested]
+    devices = {
+        row[0]: row[1:] for row in Device.objects.filter(pk__in={pk for pk in matched if pk}).values_list(
+            'id', 'brand', 'model_name', 'estimated_value', 'gold_mg', 'silver_mg', 'copper_mg'
+        )
+    }
+
+    results = []
+    total_value = Decimal('0')
+    total_metals = dict.fromkeys(METALS, Decimal('0'))
+    for (brand, model_name, quantity), pk in zip(requested, matched):
+        if pk not in devices:
+            results.append({'brand': brand, 'model_name': model_name, 'quantity': quantity, 'matched': False})
+            continue
+        device_brand, device_model, unit_value, *content = devices[pk]
+        line_value = unit_value * quantity
+        total_value += line_value
+        for metal, mg in zip(METALS, content):
+            total_metals[metal] += mg * quantity
+        results.append({
+            'brand': brand,
+            'model_name': model_name,
+            'quantity': quantity,
+            'matched': True,
+            'device': {'id': pk, 'brand': device_brand, 'model_name': device_model},
+            'unit_value': float(unit_value),
+            'total_value': float(line_value),
+        })
+
+    return JsonResponse({
+        'items': results,
+        'total_value': float(total_value),
+        'total_metals_g': {metal: float(round(mg / 1000, 3)) for metal, mg in total_metals.items()},
+        'currency': 'INR',
+    })